@@ -0,0 +1,69 @@
+import os
+import time
+
+# Upper bound on how stale another worker's copy can be after a write;
+# the worker that handles the write invalidates its own copy immediately.
+REFERENCE_CACHE_TTL = float(os.getenv("REFERENCE_CACHE_TTL", "60"))
+
+
+class ReferenceCache:
+    """In-process id -> name map for a small, rarely written lookup table.
+
+    The map is reloaded when it is older than the TTL or after invalidate().
+    Every invalidation bumps `version`; a load that raced with one is
+    returned to its caller but not kept, so a write is never masked by a
+    snapshot taken before it committed.
+    """
+
+    def __init__(self, sql, ttl=REFERENCE_CACHE_TTL):
+        self.sql = sql
+        self.ttl = ttl
+        self.version = 0
+        self._data = None
+        self._loaded_at = 0.0
+
+    def _fresh(self):
+        data = self._data
+        if data is not None and time.monotonic() - self._loaded_at < self.ttl:
+            return data
+        return None
+
+    def _store(self, rows, version):
+        data = {row[0]: row[1] for row in rows}
+        if version == self.version:
+            self._data = data
+            self._loaded_at = time.monotonic()
+        return data
+
+    def get(self, conn):
+        data = self._fresh()
+        if data is not None:
+            return data
+        version = self.version
+        cursor = conn.cursor()
+        try:
+            cursor.execute(self.sql)
+            rows = cursor.fetchall()
+        finally:
+            cursor.close()
+        return self._store(rows, version)
+
+    async def get_async(self, conn):
+        data = self._fresh()
+        if data is not None:
+            return data
+        version = self.version
+        async with conn.cursor() as cursor:
+            await cursor.execute(self.sql)
+            rows = await cursor.fetchall()
+        return self._store(rows, version)
+
+    def invalidate(self):
+        # Call after commit so a concurrent reload cannot store pre-commit rows
+        self.version += 1
+        self._data = None
+
+
+category_names = ReferenceCache("SELECT category_id, category_name FROM tblproductcategory")
+unit_names = ReferenceCache("SELECT unit_id, unit_name FROM tblproductunit")
+usernames = ReferenceCache("SELECT user_id, username FROM tbluser")
@@ -0,0 +1,133 @@
+"""Catalog change feed (tblchangelog) behind GET /sync/changes.
+
+Product, category, unit, customer and user write handlers call
+record_change() before committing, so an entry exists exactly when its
+write does, and apply_stock_deltas() logs every product whose stock it
+changed. /sync/changes serves the catalog tables; the log as a whole also
+versions the ETags in app/etag.py. Each entry
+gets an increasing change_seq; terminals pass back the next_seq they were
+given and receive the entries after it.
+
+change_seq is assigned when the entry is inserted, not when it commits, so
+a missing seq may belong to a transaction that has yet to commit. Entries
+are served as soon as they are visible, but next_seq() stops in front of
+such a gap until the entry after it is SYNC_LATE_COMMIT_SECONDS old;
+anything still missing then was rolled back (or compacted away). Entries
+past the gap are therefore served again on the next call. That is
+harmless: an entry only names a row, and the response carries the row's
+current state.
+
+    python -m app.changelog --compact
+
+deletes entries superseded by a newer one for the same row. The latest
+entry per row (including delete tombstones) is always kept, so a terminal
+can resume from any seq.
+"""
+import argparse
+import os
+import sys
+
+import mysql.connector
+
+from app.db import DB_CONFIG
+
+UPSERT = "upsert"
+DELETE = "delete"
+
+# Seconds a gap in change_seq is waited out before next_seq moves past it;
+# well beyond any transaction this service runs (see above)
+SYNC_LATE_COMMIT_SECONDS = int(os.getenv("SYNC_LATE_COMMIT_SECONDS", "300"))
+
+RECORD_CHANGE_SQL = "INSERT INTO tblchangelog (table_name, row_id, operation) VALUES (%s, %s, %s)"
+# Multi-row VALUES rather than INSERT ... SELECT: InnoDB reserves exactly
+# the ids it needs for a row count known up front, so this leaves no gaps
+RECORD_CHANGES_SQL = "INSERT INTO tblchangelog (table_name, row_id, operation) VALUES {rows}"
+CHANGES_SQL = """
+    SELECT change_seq, table_name, row_id, operation,
+           changed_at < NOW() - INTERVAL %s SECOND AS settled
+    FROM tblchangelog
+    WHERE change_seq > %s
+    ORDER BY change_seq
+    LIMIT %s
+"""
+COMPACT_SQL = """
+    DELETE c FROM tblchangelog c
+    JOIN tblchangelog newer
+      ON newer.table_name = c.table_name AND newer.row_id = c.row_id
+     AND newer.change_seq > c.change_seq
+"""
+
+
+def record_change(conn, table, row_id, operation=UPSERT):
+    """Log a catalog write; call inside the write's transaction."""
+    conn.execute_prepared(RECORD_CHANGE_SQL, (table, row_id, operation))
+
+
+def record_changes(cursor, table, row_ids, operation=UPSERT):
+    """Log several rows at once inside the caller's transaction."""
+    row_ids = sorted(row_ids)
+    if row_ids:
+        cursor.execute(
+            RECORD_CHANGES_SQL.format(rows=", ".join(["(%s, %s, %s)"] * len(row_ids))),
+            [value for row_id in row_ids for value in (table, row_id, operation)],
+        )
+
+
+def read_changes(conn, since, limit):
+    """Entries after `since`, oldest first, at most `limit` of them."""
+    cursor = conn.cursor(dictionary=True)
+    try:
+        cursor.execute(CHANGES_SQL, (SYNC_LATE_COMMIT_SECONDS, since, limit))
+        return cursor.fetchall()
+    finally:
+        cursor.close()
+
+
+def next_seq(since, entries):
+    """The seq a reader of `entries` (read after `since`) resumes from.
+
+    Stops before the first gap that may still be filled by a late commit.
+    """
+    resume = since
+    for entry in entries:
+        if entry["change_seq"] != resume + 1 and not entry["settled"]:
+            break
+        resume = entry["change_seq"]
+    return resume
+
+
+def compact(conn):
+    """Delete superseded entries; returns the number removed."""
+    cursor = conn.cursor()
+    try:
+        cursor.execute(COMPACT_SQL)
+        conn.commit()
+        return cursor.rowcount
+    finally:
+        cursor.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m app.changelog",
+                                     description="Maintain the catalog change feed")
+    parser.add_argument("--compact", action="store_true", required=True,
+                        help="delete entries superseded by a newer one for the same row")
+    parser.parse_args(argv)
+
+    try:
+        conn = mysql.connector.connect(**DB_CONFIG)
+    except mysql.connector.Error as err:
+        print(f"Database connection error: {err}", file=sys.stderr)
+        return 1
+    try:
+        print(f"Removed {compact(conn)} superseded changelog entries")
+        return 0
+    except mysql.connector.Error as err:
+        print(f"Compaction failed: {err}", file=sys.stderr)
+        return 1
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,14 +1,451 @@
+import asyncio
+import os
+import re
+import threading
+import time
+from collections import OrderedDict, deque
+
+import aiomysql
 import mysql.connector
-from fastapi import HTTPException
+from fastapi import HTTPException, status
+from mysql.connector.constants import ClientFlag
+
+from app.metrics import Counter, Histogram
+
+DB_CONFIG = {
+    "host": os.getenv("DB_HOST", "localhost"),
+    "user": os.getenv("DB_USER", "root"),
+    "password": os.getenv("DB_PASSWORD", ""),
+    "database": os.getenv("DB_NAME", "pos_system"),
+    # UPDATE rowcount reports matched rows, so handlers can tell "not found"
+    # from "nothing changed" without a separate existence check
+    "client_flags": [ClientFlag.FOUND_ROWS],
+}
+
+# MySQL error numbers surfaced as IntegrityError
+ER_DUP_ENTRY = 1062
+ER_NO_REFERENCED_ROW = 1452
+
+_FK_COLUMN = re.compile(r"FOREIGN KEY \(`(\w+)`\)")
+
+POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", "2"))
+POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "20"))
+# Seconds a physical connection may live before it is recycled
+POOL_MAX_LIFETIME = float(os.getenv("DB_POOL_MAX_LIFETIME", "1800"))
+# Seconds a request may wait for a free connection before we answer 503
+POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "2"))
+# Connections idle for longer than this are pinged before being handed out
+POOL_PING_AFTER = float(os.getenv("DB_POOL_PING_AFTER", "5"))
+
+# Server-side prepared statements kept per connection, keyed by SQL text
+STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE", "32"))
+
+# Rows per multi-row INSERT issued by bulk_insert(); keeps statements well
+# under max_allowed_packet while still amortising the round trip
+BULK_INSERT_CHUNK_SIZE = int(os.getenv("DB_BULK_INSERT_CHUNK_SIZE", "1000"))
+AUTO_INCREMENT_STEP_SQL = "SELECT @@auto_increment_increment AS step"
+# Largest array accepted by the /bulk endpoints
+MAX_BULK_ROWS = int(os.getenv("MAX_BULK_ROWS", "10000"))
+
+# "sync" serves every route through mysql.connector on the threadpool;
+# "async" swaps the hot list endpoints for aiomysql-backed coroutines.
+USE_ASYNC_DB = os.getenv("DB_DRIVER", "sync") == "async"
+
+
+def foreign_key_column(err):
+    """Return the child column named in an ER_NO_REFERENCED_ROW error."""
+    if err.errno != ER_NO_REFERENCED_ROW:
+        return None
+    match = _FK_COLUMN.search(err.msg or "")
+    return match.group(1) if match else None
+
+
+def integrity_http_exception(err):
+    """400 naming the offending column for an FK violation, else a 500."""
+    column = foreign_key_column(err)
+    if column is None:
+        return HTTPException(status_code=500, detail=f"Database error: {err}")
+    return HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Invalid {column}")
+
+
+def bulk_insert(cursor, sql, rows):
+    """Insert rows with multi-row INSERTs and return their auto-increment ids.
+
+    executemany() rewrites a plain INSERT ... VALUES into one statement per
+    chunk. InnoDB reserves a consecutive id range for such a statement and
+    reports the first one, so the ids are derived rather than re-fetched;
+    they are auto_increment_increment apart, which the session is asked
+    for once per call. The caller owns the transaction.
+    """
+    sql = sql.strip()
+    step = 1
+    if len(rows) > 1:
+        cursor.execute(AUTO_INCREMENT_STEP_SQL)
+        row = cursor.fetchone()
+        step = row["step"] if isinstance(row, dict) else row[0]
+    ids = []
+    for start in range(0, len(rows), BULK_INSERT_CHUNK_SIZE):
+        chunk = rows[start:start + BULK_INSERT_CHUNK_SIZE]
+        cursor.executemany(sql, chunk)
+        first_id = cursor.lastrowid
+        ids.extend(range(first_id, first_id + len(chunk) * step, step))
+    return ids
+
+
+class PoolExhausted(Exception):
+    pass
+
+
+statement_cache_events = Counter(
+    "pos_db_statement_cache_events_total",
+    "Prepared statement cache lookups by result (hit, miss, evict)",
+    ["result"],
+)
+connection_acquire_seconds = Histogram(
+    "pos_db_connection_acquire_seconds",
+    "Time spent waiting for a pooled connection, including 503s",
+)
+statement_seconds = Histogram(
+    "pos_db_statement_seconds",
+    "Statement execution time by SQL fingerprint (rows are read by the fetch that follows)",
+    ["fingerprint"],
+)
+rows_returned = Counter(
+    "pos_db_rows_returned_total",
+    "Rows fetched by SQL fingerprint",
+    ["fingerprint"],
+)
+commit_seconds = Histogram(
+    "pos_db_commit_seconds",
+    "Time spent in COMMIT",
+)
+
+_SQL_LITERAL = re.compile(r"'(?:[^'\\]|\\.)*'|\b\d+(?:\.\d+)?\b|%s")
+_SQL_VALUE_LIST = re.compile(r"\(\?(?:\s*,\s*\?)*\)")
+_fingerprints = {}
+# Distinct statement texts remembered; IN lists of every length add up
+FINGERPRINT_CACHE_SIZE = 4096
+
+
+def sql_fingerprint(sql):
+    """Normalize a statement into a metric label.
+
+    Whitespace is collapsed, literals and placeholders become `?` and lists
+    of them `(?+)`, so every IN (...) size shares one series.
+    """
+    fingerprint = _fingerprints.get(sql)
+    if fingerprint is None:
+        normalized = _SQL_LITERAL.sub("?", " ".join(sql.split()))
+        fingerprint = _SQL_VALUE_LIST.sub("(?+)", normalized)
+        if len(_fingerprints) >= FINGERPRINT_CACHE_SIZE:
+            _fingerprints.clear()
+        _fingerprints[sql] = fingerprint
+    return fingerprint
+
+
+class InstrumentedCursor:
+    """Times execute() and counts fetched rows per SQL fingerprint."""
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+        self._fingerprint = None
+
+    def execute(self, sql, *args, **kwargs):
+        self._fingerprint = sql_fingerprint(sql)
+        start = time.perf_counter()
+        try:
+            return self._cursor.execute(sql, *args, **kwargs)
+        finally:
+            statement_seconds.observe(time.perf_counter() - start, self._fingerprint)
+
+    def executemany(self, sql, *args, **kwargs):
+        self._fingerprint = sql_fingerprint(sql)
+        start = time.perf_counter()
+        try:
+            return self._cursor.executemany(sql, *args, **kwargs)
+        finally:
+            statement_seconds.observe(time.perf_counter() - start, self._fingerprint)
+
+    def fetchone(self):
+        row = self._cursor.fetchone()
+        if row is not None:
+            rows_returned.inc(self._fingerprint)
+        return row
+
+    def fetchmany(self, *args, **kwargs):
+        rows = self._cursor.fetchmany(*args, **kwargs)
+        rows_returned.inc(self._fingerprint, amount=len(rows))
+        return rows
+
+    def fetchall(self):
+        rows = self._cursor.fetchall()
+        rows_returned.inc(self._fingerprint, amount=len(rows))
+        return rows
+
+    def __iter__(self):
+        return iter(self.fetchone, None)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+class PooledConnection:
+    """Wraps a pooled mysql connection; close() hands it back to the pool."""
+
+    def __init__(self, pool, raw, created_at):
+        self._pool = pool
+        self._raw = raw
+        self.created_at = created_at
+        self.released_at = time.monotonic()
+        self._statements = OrderedDict()
+
+    def execute_prepared(self, sql, params=()):
+        # One prepared cursor per statement text; the server parses the
+        # statement once per physical connection and we only send parameters.
+        # Callers must read the whole result (fetchall) before the next query.
+        cursor = self._statements.get(sql)
+        if cursor is not None:
+            self._statements.move_to_end(sql)
+            statement_cache_events.inc("hit")
+        else:
+            cursor = InstrumentedCursor(self._raw.cursor(prepared=True, dictionary=True))
+            self._statements[sql] = cursor
+            statement_cache_events.inc("miss")
+            if len(self._statements) > STATEMENT_CACHE_SIZE:
+                _, oldest = self._statements.popitem(last=False)
+                oldest.close()
+                statement_cache_events.inc("evict")
+        cursor.execute(sql, params)
+        return cursor
+
+    def fetchone_prepared(self, sql, params=()):
+        rows = self.execute_prepared(sql, params).fetchall()
+        return rows[0] if rows else None
+
+    def cursor(self, *args, **kwargs):
+        return InstrumentedCursor(self._raw.cursor(*args, **kwargs))
+
+    def commit(self):
+        start = time.perf_counter()
+        try:
+            self._raw.commit()
+        finally:
+            commit_seconds.observe(time.perf_counter() - start)
+
+    def __getattr__(self, name):
+        return getattr(self._raw, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        if self._pool is not None:
+            pool, self._pool = self._pool, None
+            pool.release(self)
+
+    def discard(self):
+        # Drop the physical connection instead of reusing it, e.g. when an
+        # unbuffered result was abandoned half-read.
+        if self._pool is not None:
+            pool, self._pool = self._pool, None
+            pool._discard(self)
+
+
+class ConnectionPool:
+    def __init__(self, config, min_size, max_size, max_lifetime, timeout, ping_after):
+        self.config = config
+        self.min_size = min_size
+        self.max_size = max_size
+        self.max_lifetime = max_lifetime
+        self.timeout = timeout
+        self.ping_after = ping_after
+        self._idle = deque()
+        self._size = 0
+        self._filled = False
+        self._cond = threading.Condition()
+
+    def _connect(self):
+        raw = mysql.connector.connect(**self.config)
+        return PooledConnection(None, raw, time.monotonic())
+
+    def _discard(self, conn):
+        try:
+            if conn._raw.unread_result:
+                conn._raw.shutdown()
+            else:
+                conn._raw.close()
+        except mysql.connector.Error:
+            pass
+        with self._cond:
+            self._size -= 1
+            self._cond.notify()
+
+    def _fill(self):
+        # Open the minimum number of connections on first use rather than at
+        # import time, so the app can start while the database is still down.
+        self._filled = True
+        while True:
+            with self._cond:
+                if self._size >= self.min_size:
+                    return
+                self._size += 1
+            try:
+                conn = self._connect()
+            except mysql.connector.Error:
+                with self._cond:
+                    self._size -= 1
+                raise
+            with self._cond:
+                self._idle.append(conn)
+                self._cond.notify()
+
+    def _healthy(self, conn, now):
+        if now - conn.created_at > self.max_lifetime:
+            return False
+        if now - conn.released_at > self.ping_after:
+            try:
+                conn._raw.ping(reconnect=False)
+            except mysql.connector.Error:
+                return False
+        return True
+
+    def acquire(self):
+        if not self._filled:
+            self._fill()
+        deadline = time.monotonic() + self.timeout
+        while True:
+            conn = None
+            with self._cond:
+                while not self._idle and self._size >= self.max_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise PoolExhausted()
+                    self._cond.wait(remaining)
+                if self._idle:
+                    conn = self._idle.pop()
+                else:
+                    self._size += 1
+
+            if conn is None:
+                try:
+                    conn = self._connect()
+                except mysql.connector.Error:
+                    with self._cond:
+                        self._size -= 1
+                        self._cond.notify()
+                    raise
+            elif not self._healthy(conn, time.monotonic()):
+                self._discard(conn)
+                continue
+
+            conn._pool = self
+            return conn
+
+    def release(self, conn):
+        now = time.monotonic()
+        if conn._raw.unread_result:
+            self._discard(conn)
+            return
+        try:
+            if conn._raw.in_transaction:
+                conn._raw.rollback()
+        except mysql.connector.Error:
+            self._discard(conn)
+            return
+        if now - conn.created_at > self.max_lifetime:
+            self._discard(conn)
+            return
+        conn.released_at = now
+        with self._cond:
+            self._idle.append(conn)
+            self._cond.notify()
+
+
+pool = ConnectionPool(
+    DB_CONFIG,
+    min_size=POOL_MIN_SIZE,
+    max_size=POOL_MAX_SIZE,
+    max_lifetime=POOL_MAX_LIFETIME,
+    timeout=POOL_TIMEOUT,
+    ping_after=POOL_PING_AFTER,
+)
+
 
 def get_connection():
+    start = time.perf_counter()
     try:
-        conn = mysql.connector.connect(
-            host="localhost",
-            user="root",
-            password="",
-            database="pos_system"
+        return pool.acquire()
+    except PoolExhausted:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Database is busy, please retry",
+            headers={"Retry-After": "1"},
         )
-        return conn
     except mysql.connector.Error as err:
-        raise HTTPException(status_code=500, detail=f"Database connection error: {err}") 
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Database connection error: {err}")
+    finally:
+        connection_acquire_seconds.observe(time.perf_counter() - start)
+
+
+def get_db():
+    conn = get_connection()
+    try:
+        yield conn
+    finally:
+        conn.close()
+
+
+_async_pool = None
+_async_pool_lock = asyncio.Lock()
+
+
+async def get_async_pool():
+    global _async_pool
+    if _async_pool is None:
+        async with _async_pool_lock:
+            if _async_pool is None:
+                _async_pool = await aiomysql.create_pool(
+                    host=DB_CONFIG["host"],
+                    user=DB_CONFIG["user"],
+                    password=DB_CONFIG["password"],
+                    db=DB_CONFIG["database"],
+                    minsize=POOL_MIN_SIZE,
+                    maxsize=POOL_MAX_SIZE,
+                    pool_recycle=POOL_MAX_LIFETIME,
+                    # Async routes are read-only; autocommit keeps each query on
+                    # a fresh snapshot and lets the pool reuse the connection.
+                    autocommit=True,
+                )
+    return _async_pool
+
+
+async def close_async_pool():
+    global _async_pool
+    if _async_pool is not None:
+        _async_pool.close()
+        await _async_pool.wait_closed()
+        _async_pool = None
+
+
+async def get_async_db():
+    start = time.perf_counter()
+    try:
+        async_pool = await get_async_pool()
+        conn = await asyncio.wait_for(async_pool.acquire(), POOL_TIMEOUT)
+    except asyncio.TimeoutError:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Database is busy, please retry",
+            headers={"Retry-After": "1"},
+        )
+    except aiomysql.Error as err:
+        raise HTTPException(status_code=500, detail=f"Database connection error: {err}")
+    finally:
+        connection_acquire_seconds.observe(time.perf_counter() - start)
+    try:
+        yield conn
+    finally:
+        async_pool.release(conn)
@@ -0,0 +1,122 @@
+"""Conditional GETs driven by the catalog change log.
+
+Read routes declare the tables their response is built from with
+
+    @router.get("/", dependencies=[Depends(etag.conditional("tblcustomer"))])
+
+and get an ETag derived from the position of tblchangelog plus the
+request's path and query string. Every write to those tables logs an entry
+in its own transaction (see app/changelog.py), so the tag changes exactly
+when some worker has committed a write, and every worker computes the same
+tag for the same data.
+
+Each worker reads that position at most every ETAG_REFRESH_SECONDS,
+through its own pooled connection; write handlers call bump() after
+committing so this worker re-reads it on the next request. A matching
+If-None-Match is answered with 304 before get_db runs. When the position
+cannot be read the route is served without an ETag.
+
+ETAG_TTL (off by default) additionally rolls every tag over each ETAG_TTL
+seconds, for deployments where rows are also changed outside this API.
+"""
+import hashlib
+import os
+import threading
+import time
+
+import mysql.connector
+from fastapi import HTTPException, Request, Response, status
+
+from app.db import get_connection
+
+# Tables whose every write is logged to tblchangelog
+LOGGED_TABLES = {"tblproduct", "tblproductcategory", "tblproductunit", "tblcustomer", "tbluser"}
+
+ETAG_REFRESH_SECONDS = float(os.getenv("ETAG_REFRESH_SECONDS", "1"))
+ETAG_TTL = float(os.getenv("ETAG_TTL", "0"))
+# A transaction that commits late fills a seq below MAX(change_seq)
+# without moving it; counting the newest entries catches that as well
+ETAG_RECENT_ENTRIES = 1000
+
+CHANGELOG_POSITION_SQL = """
+    SELECT latest.change_seq,
+           (SELECT COUNT(*) FROM tblchangelog WHERE change_seq > latest.change_seq - %s)
+    FROM (SELECT COALESCE(MAX(change_seq), 0) AS change_seq FROM tblchangelog) latest
+"""
+
+_position = None
+_read_at = 0.0
+_bumps = 0
+_lock = threading.Lock()
+
+
+def bump(*tables):
+    """Mark tables as changed; call after the write has committed."""
+    global _read_at, _bumps
+    _bumps += 1
+    _read_at = 0.0
+
+
+def _read_position():
+    conn = get_connection()
+    try:
+        cursor = conn.cursor()
+        try:
+            cursor.execute(CHANGELOG_POSITION_SQL, (ETAG_RECENT_ENTRIES,))
+            latest, recent = cursor.fetchone()
+        finally:
+            cursor.close()
+    finally:
+        conn.close()
+    return f"{latest}.{recent}"
+
+
+def position():
+    """The change log position, re-read at most every ETAG_REFRESH_SECONDS; None if unreadable."""
+    global _position, _read_at
+    if time.monotonic() - _read_at < ETAG_REFRESH_SECONDS:
+        return _position
+    with _lock:
+        # Another request may have refreshed it while this one waited
+        if time.monotonic() - _read_at >= ETAG_REFRESH_SECONDS:
+            read_at, bumps = time.monotonic(), _bumps
+            try:
+                _position = _read_position()
+            except (HTTPException, mysql.connector.Error):
+                _position = None
+            # A bump() during the read may postdate it; read again next time
+            if bumps == _bumps:
+                _read_at = read_at
+        return _position
+
+
+def _etag(request, current):
+    bucket = int(time.time() // ETAG_TTL) if ETAG_TTL > 0 else 0
+    key = "|".join([current, str(bucket), request.url.path, request.url.query])
+    return 'W/"' + hashlib.sha1(key.encode()).hexdigest()[:20] + '"'
+
+
+def _matches(if_none_match, tag):
+    if not if_none_match:
+        return False
+    candidates = [candidate.strip() for candidate in if_none_match.split(",")]
+    weak = tag[2:]
+    return "*" in candidates or any(candidate.removeprefix("W/") == weak for candidate in candidates)
+
+
+def conditional(*tables):
+    """Route dependency adding an ETag and answering If-None-Match with 304."""
+    unlogged = set(tables) - LOGGED_TABLES
+    if unlogged:
+        raise ValueError(f"Writes to {', '.join(sorted(unlogged))} are not logged to tblchangelog")
+
+    def dependency(request: Request, response: Response):
+        current = position()
+        if current is None:
+            return
+        tag = _etag(request, current)
+        if _matches(request.headers.get("if-none-match"), tag):
+            raise HTTPException(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": tag})
+        response.headers["ETag"] = tag
+
+    return dependency
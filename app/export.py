@@ -0,0 +1,89 @@
+import csv
+import io
+import json
+import os
+from datetime import date
+from enum import Enum
+
+from fastapi import HTTPException
+from fastapi.responses import StreamingResponse
+import mysql.connector
+
+from app.db import get_connection
+
+# Rows pulled from the server per fetchmany() call while streaming
+EXPORT_CHUNK_SIZE = int(os.getenv("EXPORT_CHUNK_SIZE", "5000"))
+
+
+class ExportFormat(str, Enum):
+    NDJSON = "ndjson"
+    CSV = "csv"
+
+
+MEDIA_TYPES = {
+    ExportFormat.NDJSON: "application/x-ndjson",
+    ExportFormat.CSV: "text/csv",
+}
+
+
+def _json_default(value):
+    if isinstance(value, date):
+        return value.isoformat()
+    return str(value)
+
+
+def _encode_ndjson(columns, rows):
+    return "".join(
+        json.dumps(dict(zip(columns, row)), default=_json_default) + "\n" for row in rows
+    )
+
+
+def _encode_csv(rows):
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    return buffer.getvalue()
+
+
+def _stream_rows(conn, cursor, fmt):
+    try:
+        columns = cursor.column_names
+        if fmt == ExportFormat.CSV:
+            yield _encode_csv([columns])
+        while True:
+            rows = cursor.fetchmany(EXPORT_CHUNK_SIZE)
+            if not rows:
+                break
+            if fmt == ExportFormat.CSV:
+                yield _encode_csv(rows)
+            else:
+                yield _encode_ndjson(columns, rows)
+    finally:
+        if conn.unread_result:
+            # Client went away mid-stream; draining millions of rows just to
+            # reuse the connection is not worth it.
+            conn.discard()
+        else:
+            cursor.close()
+            conn.close()
+
+
+def export_response(sql, params, fmt, filename):
+    # The connection is acquired here rather than through Depends(get_db):
+    # yield dependencies are torn down before the body is streamed, so the
+    # generator owns the connection and returns it when it finishes.
+    conn = get_connection()
+    # Unbuffered cursor: rows are read off the socket chunk by chunk, so
+    # memory stays flat no matter how large the table is. The query runs
+    # before the response starts so database errors still map to a 500.
+    cursor = conn.cursor(buffered=False)
+    try:
+        cursor.execute(sql, params)
+    except mysql.connector.Error as err:
+        cursor.close()
+        conn.close()
+        raise HTTPException(status_code=500, detail=f"Database error: {err}")
+    return StreamingResponse(
+        _stream_rows(conn, cursor, fmt),
+        media_type=MEDIA_TYPES[fmt],
+        headers={"Content-Disposition": f'attachment; filename="{filename}.{fmt.value}"'},
+    )
@@ -0,0 +1,83 @@
+from typing import Annotated, Optional
+
+from fastapi import HTTPException, Query, status
+
+# Shared `fields` query parameter for list and detail endpoints
+FieldsParam = Annotated[Optional[str], Query(description="Comma-separated response fields to return")]
+# Shared `include` query parameter for embedding related resources
+IncludeParam = Annotated[Optional[str], Query(description="Comma-separated related resources to embed")]
+
+
+def _names(text):
+    return list(dict.fromkeys(name.strip() for name in text.split(",") if name.strip()))
+
+
+def parse_include(include, allowed):
+    """Validate an `include` parameter against the embeddable names."""
+    if include is None:
+        return []
+    requested = _names(include)
+    unknown = [name for name in requested if name not in allowed]
+    if unknown:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Unknown include: {', '.join(unknown)}; expected one of: {', '.join(allowed)}"
+        )
+    return requested
+
+
+class Projection:
+    """Builds the SELECT for a response model from the fields a client asked for.
+
+    Every model field is a column of `from_sql`: by default `alias.field`,
+    or the expression given in `columns`. A field listed in `joins` is only
+    reachable through that join, which is added only when the field is
+    selected. Fields in `derived` are filled in Python after the query
+    (e.g. names from the reference caches) and pull in their source
+    columns instead.
+    """
+
+    def __init__(self, model, from_sql, alias=None, columns=None, joins=None, derived=None):
+        self.model = model
+        self.from_sql = from_sql
+        self.joins = joins or {}
+        self.derived = derived or {}
+        columns = columns or {}
+        prefix = f"{alias}." if alias else ""
+        self.columns = {
+            name: columns.get(name, prefix + name)
+            for name in model.model_fields
+            if name not in self.derived
+        }
+
+    def parse(self, fields):
+        """Validate a `fields` parameter; None means every field."""
+        if fields is None:
+            return None
+        requested = _names(fields)
+        unknown = [name for name in requested if name not in self.model.model_fields]
+        if unknown or not requested:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Unknown fields: {', '.join(unknown)}" if unknown else "No fields requested"
+            )
+        return requested
+
+    def wants(self, requested, field):
+        return requested is None or field in requested
+
+    def select(self, requested=None, extra=()):
+        """SELECT ... FROM ... for `requested` plus `extra` columns (cursor keys)."""
+        names = list(self.model.model_fields) if requested is None else requested
+        needed = []
+        for name in [*names, *extra]:
+            for column in self.derived.get(name, (name,)):
+                if column not in needed:
+                    needed.append(column)
+        joins = []
+        for column in needed:
+            join = self.joins.get(column)
+            if join is not None and join not in joins:
+                joins.append(join)
+        select_list = ", ".join(f"{self.columns[column]} AS {column}" for column in needed)
+        return "\n".join([f"SELECT {select_list}", f"FROM {self.from_sql}", *joins, ""])
@@ -0,0 +1,36 @@
+"""Typed list filters, collected into WHERE conditions for Keyset.query().
+
+Each list router declares a dependency that takes its filter parameters
+and returns a Filters; every filter maps to a single indexed column.
+"""
+from datetime import date
+from typing import Annotated, Optional
+
+from fastapi import HTTPException, Query, status
+
+# Inclusive date range, spelled like the reports endpoints
+DateFrom = Annotated[Optional[date], Query(alias="from")]
+DateTo = Annotated[Optional[date], Query(alias="to")]
+
+
+class Filters:
+    def __init__(self):
+        self.conditions = []
+        self.params = []
+
+    def equal(self, column, value):
+        if value is not None:
+            self.conditions.append(f"{column} = %s")
+            self.params.append(value)
+        return self
+
+    def date_range(self, column, date_from, date_to):
+        if date_from is not None and date_to is not None and date_from > date_to:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="'from' must not be after 'to'")
+        if date_from is not None:
+            self.conditions.append(f"{column} >= %s")
+            self.params.append(date_from)
+        if date_to is not None:
+            self.conditions.append(f"{column} <= %s")
+            self.params.append(date_to)
+        return self
@@ -0,0 +1,206 @@
+"""Idempotency-Key support for the create endpoints.
+
+A terminal that retries a POST sends the same Idempotency-Key header; the
+retry gets the first response back instead of writing a second invoice.
+
+run_idempotent() wraps run_transaction(). The first statement of the
+transaction inserts the key into tblidempotency and the last one stores the
+response, so the key commits or rolls back together with the write. A
+concurrent duplicate blocks on that insert until the first request's
+transaction ends: if it committed, the insert fails with a duplicate key
+and the stored response is replayed; if it rolled back, the duplicate goes
+ahead as the first request. Failed requests (4xx/5xx) store nothing and may
+be retried with the same key.
+
+Committed responses are also kept in a bounded in-process LRU so a retry
+storm against one worker is answered without touching the database.
+Reusing a key with a different body is rejected with 422.
+
+    python -m app.idempotency --purge [--hours 24]
+
+deletes keys older than the retention window.
+"""
+import argparse
+import hashlib
+import json
+import os
+import sys
+import threading
+from collections import OrderedDict
+from typing import Annotated, Optional
+
+import mysql.connector
+from fastapi import Header, HTTPException, Response, status
+from fastapi.encoders import jsonable_encoder
+
+from app.db import DB_CONFIG, ER_DUP_ENTRY
+from app.metrics import Counter
+from app.stock import run_transaction
+
+# Completed responses kept in memory per worker
+IDEMPOTENCY_CACHE_SIZE = int(os.getenv("IDEMPOTENCY_CACHE_SIZE", "1024"))
+# Hours a key is kept before --purge deletes it
+IDEMPOTENCY_KEY_TTL_HOURS = float(os.getenv("IDEMPOTENCY_KEY_TTL_HOURS", "24"))
+
+REPLAYED_HEADER = "Idempotent-Replayed"
+
+# Shared optional header parameter for the create endpoints
+IdempotencyKey = Annotated[Optional[str], Header(alias="Idempotency-Key", min_length=1, max_length=255)]
+
+CLAIM_SQL = "INSERT INTO tblidempotency (endpoint, idempotency_key, request_hash) VALUES (%s, %s, %s)"
+STORE_SQL = """
+    UPDATE tblidempotency SET status_code = %s, response_body = %s
+    WHERE endpoint = %s AND idempotency_key = %s
+"""
+# Locking read: sees the committing request's row even if this
+# transaction's snapshot predates it
+STORED_SQL = """
+    SELECT request_hash, status_code, response_body FROM tblidempotency
+    WHERE endpoint = %s AND idempotency_key = %s
+    LOCK IN SHARE MODE
+"""
+PURGE_SQL = "DELETE FROM tblidempotency WHERE created_at < NOW() - INTERVAL %s SECOND"
+
+idempotent_replays = Counter(
+    "pos_idempotent_replays_total",
+    "Requests answered with a stored Idempotency-Key response, by source",
+    ["source"],
+)
+
+_cache = OrderedDict()
+_lock = threading.Lock()
+
+
+class _Stored(Exception):
+    """Raised inside the transaction when the key already committed."""
+
+    def __init__(self, entry):
+        super().__init__("idempotency key already used")
+        self.entry = entry
+
+
+def _cache_get(cache_key):
+    with _lock:
+        entry = _cache.get(cache_key)
+        if entry is not None:
+            _cache.move_to_end(cache_key)
+        return entry
+
+
+def _cache_put(cache_key, entry):
+    with _lock:
+        _cache[cache_key] = entry
+        _cache.move_to_end(cache_key)
+        while len(_cache) > IDEMPOTENCY_CACHE_SIZE:
+            _cache.popitem(last=False)
+
+
+def fingerprint(payload):
+    raw = json.dumps(jsonable_encoder(payload), sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+def _replay(entry, fingerprint):
+    request_hash, status_code, body = entry
+    if request_hash != fingerprint:
+        raise HTTPException(
+            status_code=422,
+            detail="Idempotency-Key was already used with a different request body"
+        )
+    return Response(content=bytes(body), status_code=status_code, media_type="application/json",
+                    headers={REPLAYED_HEADER: "true"})
+
+
+def claim(cursor, endpoint, key, request_hash):
+    """Take the key inside the caller's transaction.
+
+    Returns None when this transaction now owns the key, or the stored
+    (request_hash, status_code, body) when it had already committed.
+    """
+    try:
+        cursor.execute(CLAIM_SQL, (endpoint, key, request_hash))
+        return None
+    except mysql.connector.IntegrityError as err:
+        if err.errno != ER_DUP_ENTRY:
+            raise
+    cursor.execute(STORED_SQL, (endpoint, key))
+    return cursor.fetchone()
+
+
+def store(cursor, endpoint, key, status_code, body):
+    """Record the response for a key claimed in the same transaction."""
+    cursor.execute(STORE_SQL, (status_code, body, endpoint, key))
+
+
+def run_idempotent(conn, endpoint, key, payload, work, status_code=status.HTTP_201_CREATED):
+    """run_transaction(conn, work) at most once per (endpoint, key).
+
+    work(cursor) must return the response model. Without a key this is
+    plain run_transaction(); with one, a repeat gets a Response replaying
+    the stored body instead.
+    """
+    if key is None:
+        return run_transaction(conn, work)
+
+    cache_key = (endpoint, key)
+    request_hash = fingerprint(payload)
+    entry = _cache_get(cache_key)
+    if entry is not None:
+        idempotent_replays.inc("cache")
+        return _replay(entry, request_hash)
+
+    def idempotent_work(cursor):
+        stored = claim(cursor, endpoint, key, request_hash)
+        if stored is not None:
+            raise _Stored(stored)
+        result = work(cursor)
+        body = result.model_dump_json().encode()
+        store(cursor, endpoint, key, status_code, body)
+        return result, body
+
+    try:
+        result, body = run_transaction(conn, idempotent_work)
+    except _Stored as stored:
+        idempotent_replays.inc("database")
+        _cache_put(cache_key, stored.entry)
+        return _replay(stored.entry, request_hash)
+    _cache_put(cache_key, (request_hash, status_code, body))
+    return result
+
+
+def purge(conn, hours=IDEMPOTENCY_KEY_TTL_HOURS):
+    """Delete keys older than `hours`; returns the number removed."""
+    cursor = conn.cursor()
+    try:
+        cursor.execute(PURGE_SQL, (int(hours * 3600),))
+        conn.commit()
+        return cursor.rowcount
+    finally:
+        cursor.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m app.idempotency",
+                                     description="Maintain stored Idempotency-Key responses")
+    parser.add_argument("--purge", action="store_true", required=True,
+                        help="delete keys older than the retention window")
+    parser.add_argument("--hours", type=float, default=IDEMPOTENCY_KEY_TTL_HOURS)
+    args = parser.parse_args(argv)
+
+    try:
+        conn = mysql.connector.connect(**DB_CONFIG)
+    except mysql.connector.Error as err:
+        print(f"Database connection error: {err}", file=sys.stderr)
+        return 1
+    try:
+        print(f"Purged {purge(conn, args.hours)} idempotency keys")
+        return 0
+    except mysql.connector.Error as err:
+        print(f"Purge failed: {err}", file=sys.stderr)
+        return 1
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,4 +1,8 @@
 from fastapi import FastAPI
+from app import outbox
+from app.metrics import RequestMetrics
+from app.db import USE_ASYNC_DB, close_async_pool
+from app.routers import metrics, reports, stream, sync
 from app.routers import tblproductcategory,tblproductunit,tbluser,tblproduct,tblcustomer,tblsupplier, tblinvoice, tblsales,tblreceiveproduct,tblpurchaseorder
 
 app = FastAPI(
@@ -6,6 +10,14 @@ app = FastAPI(
     description="API for POS SYSTEM",
     version="1.0.0"
 )
+app.add_middleware(RequestMetrics)
+
+# Async list endpoints must be registered first so they take precedence
+# over the sync routes with the same path.
+if USE_ASYNC_DB:
+    app.include_router(tblproduct.async_router)
+    app.include_router(tblinvoice.async_router)
+    app.include_router(tblsales.async_router)
 
 app.include_router(tblproductcategory.router)
 app.include_router(tblproductunit.router)
@@ -16,4 +28,13 @@ app.include_router(tblsupplier.router)
 app.include_router(tblinvoice.router)
 app.include_router(tblsales.router)
 app.include_router(tblreceiveproduct.router)
-app.include_router(tblpurchaseorder.router)
\ No newline at end of file
+app.include_router(tblpurchaseorder.router)
+app.include_router(reports.router)
+app.include_router(sync.router)
+app.include_router(stream.router)
+app.include_router(metrics.router)
+
+@app.on_event("shutdown")
+async def shutdown():
+    await outbox.publisher.stop()
+    await close_async_pool()
@@ -0,0 +1,191 @@
+import bisect
+import threading
+import time
+
+# Minimal Prometheus text-format registry; avoids a client library
+# dependency for the handful of series this service exports.
+REGISTRY = []
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labelnames, values):
+    if not labelnames:
+        return ""
+    pairs = ",".join(f'{name}="{_escape(value)}"' for name, value in zip(labelnames, values))
+    return "{" + pairs + "}"
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels):
+        return self._values.get(labels, 0)
+
+    def samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        for labels, value in items:
+            yield self.name + _format_labels(self.labelnames, labels), value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(f"{series} {value}" for series, value in self.samples())
+        return "\n".join(lines)
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, *labels, amount=1):
+        self.inc(*labels, amount=-amount)
+
+    def set(self, *labels, value):
+        with self._lock:
+            self._values[labels] = value
+
+
+# Seconds; spans a cached lookup to a slow report query
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # labels -> [count per bucket (the last one is +Inf), sum]
+        self._values = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def observe(self, value, *labels):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(labels)
+            if entry is None:
+                entry = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][i] += 1
+            entry[1] += value
+
+    def count(self, *labels):
+        entry = self._values.get(labels)
+        return sum(entry[0]) if entry else 0
+
+    def samples(self):
+        with self._lock:
+            items = [(labels, list(counts), total) for labels, (counts, total) in self._values.items()]
+        bucket_names = self.labelnames + ("le",)
+        for labels, counts, total in items:
+            cumulative = 0
+            for bound, count in zip([*self.buckets, "+Inf"], counts):
+                cumulative += count
+                yield f"{self.name}_bucket" + _format_labels(bucket_names, (*labels, bound)), cumulative
+            yield f"{self.name}_sum" + _format_labels(self.labelnames, labels), total
+            yield f"{self.name}_count" + _format_labels(self.labelnames, labels), cumulative
+
+    render = Counter.render
+
+
+http_request_seconds = Histogram(
+    "pos_http_request_duration_seconds",
+    "Request latency by method and route template, until the last body byte",
+    ["method", "route"],
+)
+http_requests = Counter(
+    "pos_http_requests_total",
+    "Requests by method, route template and status code",
+    ["method", "route", "status"],
+)
+http_requests_in_progress = Gauge(
+    "pos_http_requests_in_progress",
+    "Requests being served, by method",
+    ["method"],
+)
+http_streams_open = Gauge(
+    "pos_http_streams_open",
+    "Event streams (text/event-stream responses) currently open, by route template",
+    ["route"],
+)
+# Route label for paths no route matched, so stray URLs add no series
+UNMATCHED_ROUTE = "<unmatched>"
+STREAM_MEDIA_TYPE = b"text/event-stream"
+
+
+def _route(scope):
+    return getattr(scope.get("route"), "path", UNMATCHED_ROUTE)
+
+
+def _is_stream(message):
+    return any(name == b"content-type" and value.startswith(STREAM_MEDIA_TYPE)
+               for name, value in message.get("headers", ()))
+
+
+class RequestMetrics:
+    """ASGI middleware recording the http_* series above.
+
+    Plain ASGI rather than BaseHTTPMiddleware: no extra task or body
+    re-streaming per request. Routes are labelled by their template
+    (/product/{product_id}), which the router leaves in the scope.
+
+    An event stream stays open for as long as the client listens, so once
+    its headers are sent it moves from the in-progress gauge to
+    pos_http_streams_open and its lifetime is kept out of the latency
+    histogram.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        method = scope["method"]
+        status_code = 500
+        streaming = False
+
+        async def send_with_status(message):
+            nonlocal status_code, streaming
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                if _is_stream(message):
+                    streaming = True
+                    http_requests_in_progress.dec(method)
+                    http_streams_open.inc(_route(scope))
+            await send(message)
+
+        http_requests_in_progress.inc(method)
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - start
+            route = _route(scope)
+            if streaming:
+                http_streams_open.dec(route)
+            else:
+                http_requests_in_progress.dec(method)
+                http_request_seconds.observe(elapsed, method, route)
+            http_requests.inc(method, route, str(status_code))
+
+
+def render():
+    return "\n".join(metric.render() for metric in REGISTRY) + "\n"
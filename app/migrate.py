@@ -0,0 +1,144 @@
+"""Apply the numbered SQL files in migrations/ to the configured database.
+
+    python -m app.migrate            apply pending migrations
+    python -m app.migrate --status   list applied and pending migrations
+
+Each file is NNNN_description.sql. Applied versions are recorded in
+schema_migrations, so running the command again only applies new files.
+MySQL commits DDL implicitly, so a file that fails halfway cannot be rolled
+back; "already exists" errors are ignored instead, which makes re-running a
+partially applied file safe.
+"""
+import argparse
+import os
+import re
+import sys
+
+import mysql.connector
+
+from app.db import DB_CONFIG
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "migrations")
+
+_MIGRATION_FILE = re.compile(r"^(\d+)_(\w+)\.sql$")
+
+# Errors meaning the statement's effect is already in place
+ER_TABLE_EXISTS = 1050
+ER_DUP_FIELDNAME = 1060
+ER_DUP_KEYNAME = 1061
+ER_FK_DUP_NAME = 1826
+ALREADY_APPLIED_ERRORS = {ER_TABLE_EXISTS, ER_DUP_FIELDNAME, ER_DUP_KEYNAME, ER_FK_DUP_NAME}
+
+SCHEMA_MIGRATIONS_SQL = """
+    CREATE TABLE IF NOT EXISTS schema_migrations (
+        version INT PRIMARY KEY,
+        name VARCHAR(100) NOT NULL,
+        applied_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+    )
+"""
+
+
+def discover(directory=MIGRATIONS_DIR):
+    """Return [(version, name, path)] sorted by version."""
+    migrations = []
+    for filename in os.listdir(directory):
+        match = _MIGRATION_FILE.match(filename)
+        if match:
+            migrations.append((int(match.group(1)), match.group(2), os.path.join(directory, filename)))
+    migrations.sort()
+    versions = [version for version, _, _ in migrations]
+    if len(versions) != len(set(versions)):
+        raise SystemExit(f"Duplicate migration version in {directory}")
+    return migrations
+
+
+def split_statements(sql):
+    """Split a migration file on ';' line endings, dropping '--' comments."""
+    lines = [line for line in sql.splitlines() if not line.strip().startswith("--")]
+    statements = re.split(r";\s*$", "\n".join(lines), flags=re.MULTILINE)
+    return [statement.strip() for statement in statements if statement.strip()]
+
+
+def applied_versions(cursor):
+    cursor.execute(SCHEMA_MIGRATIONS_SQL)
+    cursor.execute("SELECT version FROM schema_migrations")
+    return {version for (version,) in cursor.fetchall()}
+
+
+def apply(conn, version, name, path):
+    cursor = conn.cursor()
+    try:
+        with open(path, encoding="utf-8") as f:
+            statements = split_statements(f.read())
+        for statement in statements:
+            try:
+                cursor.execute(statement)
+            except mysql.connector.Error as err:
+                if err.errno not in ALREADY_APPLIED_ERRORS:
+                    raise
+                print(f"  skipped ({err.msg})")
+        cursor.execute(
+            "INSERT INTO schema_migrations (version, name) VALUES (%s, %s)",
+            (version, name)
+        )
+        conn.commit()
+    finally:
+        cursor.close()
+
+
+def migrate(conn, directory=MIGRATIONS_DIR):
+    """Apply every pending migration in order; return the versions applied."""
+    cursor = conn.cursor()
+    try:
+        done = applied_versions(cursor)
+    finally:
+        cursor.close()
+
+    applied = []
+    for version, name, path in discover(directory):
+        if version in done:
+            continue
+        print(f"Applying {version:04d}_{name}")
+        apply(conn, version, name, path)
+        applied.append(version)
+    return applied
+
+
+def status(conn, directory=MIGRATIONS_DIR):
+    cursor = conn.cursor()
+    try:
+        done = applied_versions(cursor)
+    finally:
+        cursor.close()
+    for version, name, _ in discover(directory):
+        state = "applied" if version in done else "pending"
+        print(f"{version:04d}_{name}: {state}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m app.migrate", description="Apply database migrations")
+    parser.add_argument("--status", action="store_true", help="list migrations without applying them")
+    args = parser.parse_args(argv)
+
+    try:
+        conn = mysql.connector.connect(**DB_CONFIG)
+    except mysql.connector.Error as err:
+        print(f"Database connection error: {err}", file=sys.stderr)
+        return 1
+    try:
+        if args.status:
+            status(conn)
+        else:
+            applied = migrate(conn)
+            if not applied:
+                print("Database is up to date")
+        return 0
+    except mysql.connector.Error as err:
+        print(f"Migration failed: {err}", file=sys.stderr)
+        return 1
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
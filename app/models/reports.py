@@ -0,0 +1,39 @@
+from pydantic import BaseModel
+from datetime import date
+from typing import List, Optional
+
+class DailySalesResponse(BaseModel):
+    sales_date: date
+    quantity: float
+    total_amount: float
+    line_count: int
+
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "sales_date": "2024-01-15",
+                "quantity": 42.0,
+                "total_amount": 1250.75,
+                "line_count": 18
+            }
+        }
+
+class AbcProduct(BaseModel):
+    product_id: int
+    product_name: Optional[str] = None
+    category_name: Optional[str] = None
+    quantity: float
+    revenue: float
+    margin: Optional[float] = None  # None when the product was never received
+    line_count: int
+    revenue_share: float
+    cumulative_share: float
+    abc_class: str
+    quantity_rank: int
+    margin_rank: Optional[int] = None
+
+class AbcReportResponse(BaseModel):
+    total_revenue: float
+    total_lines: int
+    product_count: int
+    products: List[AbcProduct]
@@ -0,0 +1,71 @@
+from pydantic import BaseModel
+from typing import List, Optional
+from enum import Enum
+from app.models.tblcustomer import CustomerResponse
+from app.models.tblinvoice import CheckoutCreate
+from app.models.tblproduct import ProductResponse
+from app.models.tblproductcategory import ProductCategoryResponse
+from app.models.tblproductunit import ProductUnitResponse
+
+class SyncInvoice(CheckoutCreate):
+    # The terminal's own id for the sale; a repeat upload is not re-applied
+    client_ref: str
+
+class SyncUpload(BaseModel):
+    terminal_id: str
+    invoices: List[SyncInvoice]
+
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "terminal_id": "store-3-till-1",
+                "invoices": [
+                    {
+                        "client_ref": "T1-000184",
+                        "customer_id": 1,
+                        "payment_type": 1,
+                        "total_amount": 21.98,
+                        "amount_tendered": 25.00,
+                        "date_recorded": "2023-05-15",
+                        "user_id": 1,
+                        "lines": [
+                            {"product_id": 1, "quantity": 2.0, "unit_price": 10.99, "sub_total": 21.98}
+                        ]
+                    }
+                ]
+            }
+        }
+
+class SyncStatus(str, Enum):
+    CREATED = "created"
+    DUPLICATE = "duplicate"  # uploaded before; ids are from the first upload
+    REJECTED = "rejected"  # not written; see detail
+
+class SyncInvoiceResult(BaseModel):
+    client_ref: str
+    status: SyncStatus
+    invoice_id: Optional[int] = None
+    sales_ids: List[int] = []
+    # Products this sale took below zero stock; their count needs checking
+    oversold: List[int] = []
+    detail: Optional[str] = None
+
+class SyncUploadResponse(BaseModel):
+    results: List[SyncInvoiceResult]
+
+class SyncDeleted(BaseModel):
+    products: List[int] = []
+    categories: List[int] = []
+    units: List[int] = []
+    customers: List[int] = []
+
+class SyncChangesResponse(BaseModel):
+    # Pass back as `since` on the next call; it may stay behind entries
+    # returned here (see app.changelog), which are then sent again
+    next_seq: int
+    has_more: bool
+    products: List[ProductResponse] = []
+    categories: List[ProductCategoryResponse] = []
+    units: List[ProductUnitResponse] = []
+    customers: List[CustomerResponse] = []
+    deleted: SyncDeleted = SyncDeleted()
@@ -1,7 +1,9 @@
 from pydantic import BaseModel
-from typing import Optional
+from typing import List, Optional
 from datetime import date
 from enum import IntEnum
+from app.models.tblcustomer import CustomerResponse
+from app.models.tblsales import SaleResponse
 
 class PaymentType(IntEnum):
     CASH = 1
@@ -38,10 +40,47 @@ class InvoiceCreate(InvoiceBase):
 
 class InvoiceResponse(InvoiceBase):
     invoice_id: int
+    customer_name: Optional[str] = None
+    created_by: Optional[str] = None
 
     class Config:
         from_attributes = True
 
+class InvoiceLine(SaleResponse):
+    product_name: Optional[str] = None
+
+class InvoiceDetailResponse(InvoiceResponse):
+    # Present only when asked for with ?include=lines / ?include=customer
+    lines: Optional[List[InvoiceLine]] = None
+    customer: Optional[CustomerResponse] = None
+
+class CheckoutLine(BaseModel):
+    product_id: int
+    quantity: float
+    unit_price: float
+    sub_total: float
+
+class CheckoutCreate(InvoiceBase):
+    lines: List[CheckoutLine]
+
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "customer_id": 1,
+                "payment_type": 1,
+                "total_amount": 21.98,
+                "amount_tendered": 25.00,
+                "date_recorded": "2023-05-15",
+                "user_id": 1,
+                "lines": [
+                    {"product_id": 1, "quantity": 2.0, "unit_price": 10.99, "sub_total": 21.98}
+                ]
+            }
+        }
+
+class CheckoutResponse(InvoiceResponse):
+    lines: List[SaleResponse]
+
 class InvoiceUpdate(BaseModel):
     customer_id: Optional[int] = None
     payment_type: Optional[PaymentType] = None
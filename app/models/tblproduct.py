@@ -33,10 +33,27 @@ class ProductCreate(ProductBase):
 
 class ProductResponse(ProductBase):
     product_id: int
+    unit: Optional[str] = None
+    category: Optional[str] = None
+    created_by: Optional[str] = None
 
     class Config:
         from_attributes = True
 
+class ProductLookupResponse(BaseModel):
+    product_id: int
+    produce_code: str
+    product_name: str
+    unit_id: int
+    category_id: int
+    unit_price: float
+    discount_percentage: float
+    unit: Optional[str] = None
+    category: Optional[str] = None
+
+class LowStockCountResponse(BaseModel):
+    count: int
+
 class ProductUpdate(BaseModel):
     produce_code: Optional[str] = None
     product_name: Optional[str] = None
@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import Optional
+from typing import List, Optional
 from datetime import date
 
 class PurchaseOrderBase(BaseModel):
@@ -36,6 +36,9 @@ class PurchaseOrderResponse(PurchaseOrderBase):
     class Config:
         from_attributes = True  # Orm_mode in older Pydantic versions
 
+class PurchaseOrderBulkResponse(BaseModel):
+    purchase_order_ids: List[int]
+
 class PurchaseOrderUpdate(BaseModel):
     product_id: Optional[int] = None
     quantity: Optional[float] = None
@@ -44,4 +47,32 @@ class PurchaseOrderUpdate(BaseModel):
     supplier_id: Optional[int] = None
     order_date: Optional[date] = None
     user_id: Optional[int] = None
-    status: Optional[str] = None
\ No newline at end of file
+    status: Optional[str] = None
+
+class PurchaseOrderReceiptLine(BaseModel):
+    quantity: float
+    received_date: date
+    user_id: int
+    unit_price: Optional[float] = None  # Defaults to the purchase order's price
+
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "quantity": 40.0,
+                "received_date": "2023-05-27",
+                "user_id": 1
+            }
+        }
+
+class PurchaseOrderDeliveryLine(PurchaseOrderReceiptLine):
+    purchase_order_id: int
+
+class PurchaseOrderReceiptStatus(BaseModel):
+    purchase_order_id: int
+    quantity: float
+    received_quantity: float
+    status: str
+
+class PurchaseOrderReceiveResponse(BaseModel):
+    receive_product_ids: List[int]
+    purchase_orders: List[PurchaseOrderReceiptStatus]
@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import Optional
+from typing import List, Optional
 from datetime import date
 
 class ReceiveProductBase(BaseModel):
@@ -37,6 +37,9 @@ class ReceiveProductResponse(ReceiveProductBase):
     class Config:
         from_attributes = True
 
+class ReceiveProductBulkResponse(BaseModel):
+    receive_product_ids: List[int]
+
 class ReceiveProductUpdate(BaseModel):
     product_id: Optional[int] = None
     quantity: Optional[float] = None
@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import Optional
+from typing import List, Optional
 
 class SaleBase(BaseModel):
     invoice_id: int
@@ -29,6 +29,9 @@ class SaleResponse(SaleBase):
     class Config:
         from_attributes = True
 
+class SaleBulkResponse(BaseModel):
+    sales_ids: List[int]
+
 class SaleUpdate(BaseModel):
     invoice_id: Optional[int] = None
     product_id: Optional[int] = None
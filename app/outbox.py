@@ -0,0 +1,315 @@
+"""Product event outbox (tbloutbox) and the publisher behind /stream/products.
+
+Writers add events inside the transaction that makes the change, so an
+event exists exactly when its change committed:
+
+- "product": created or updated through /product/ (codes, names, prices,
+  stock as stored after the write)
+- "stock": unit_in_stock after apply_stock_deltas(), i.e. every sale,
+  checkout, sync upload and receipt
+- "delete": product removed
+
+Each worker runs one Publisher task that polls the table for new events
+and fans them out to the SSE subscribers connected to that worker, so the
+database sees a cheap primary-key range read per poll however many
+terminals are listening.
+
+event_seq is assigned on insert, not on commit, so events become visible
+out of order and a missing seq may still be filled by a late commit (or
+never, after a rollback). The publisher sends every event as soon as it is
+visible and re-reads the gaps below the newest event on every poll. Its
+watermark, the seq up to which every event has been sent or is known to be
+gone, only moves past a gap once it has stayed open for
+OUTBOX_LATE_COMMIT_SECONDS. Stream event ids are watermarks, not seqs: a
+reconnecting client sends its Last-Event-ID and is replayed everything
+after it, which may repeat events it already has; the event_seq in each
+event's data lets it drop those.
+
+    python -m app.outbox --purge [--hours 24]
+
+deletes old events; clients resuming from before the oldest kept event are
+told to reload instead.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+import mysql.connector
+import orjson
+
+from app.db import DB_CONFIG, get_connection
+from app.metrics import Counter
+
+PRODUCT = "product"
+STOCK = "stock"
+DELETE = "delete"
+
+# Seconds between polls while anyone is subscribed
+OUTBOX_POLL_INTERVAL = float(os.getenv("OUTBOX_POLL_INTERVAL", "0.5"))
+# Seconds a missing event_seq is re-read before the watermark moves past it;
+# well beyond any transaction this service runs
+OUTBOX_LATE_COMMIT_SECONDS = float(os.getenv("OUTBOX_LATE_COMMIT_SECONDS", "300"))
+# Gaps re-read per poll, oldest first
+OUTBOX_MAX_GAP_RANGES = 100
+# Events read per poll, and the most a reconnecting client is replayed
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "500"))
+OUTBOX_REPLAY_LIMIT = int(os.getenv("OUTBOX_REPLAY_LIMIT", "10000"))
+# Events buffered per subscriber before a slow one is disconnected
+OUTBOX_SUBSCRIBER_QUEUE = int(os.getenv("OUTBOX_SUBSCRIBER_QUEUE", "1000"))
+OUTBOX_RETENTION_HOURS = float(os.getenv("OUTBOX_RETENTION_HOURS", "24"))
+
+_PRODUCT_PAYLOAD = """
+    JSON_OBJECT(
+        'product_id', product_id, 'produce_code', produce_code,
+        'product_name', product_name, 'unit_price', unit_price,
+        'discount_percentage', discount_percentage,
+        'unit_in_stock', unit_in_stock, 'low_stock', low_stock
+    )
+"""
+RECORD_PRODUCT_SQL = f"""
+    INSERT INTO tbloutbox (event_type, product_id, payload)
+    SELECT '{PRODUCT}', product_id, {_PRODUCT_PAYLOAD} FROM tblproduct WHERE product_id = %s
+"""
+# Multi-row VALUES rather than INSERT ... SELECT: InnoDB reserves exactly
+# the ids it needs for a row count known up front, so this leaves no gaps
+RECORD_STOCK_SQL = "INSERT INTO tbloutbox (event_type, product_id, payload) VALUES {rows}"
+_STOCK_ROW = f"""
+    ('{STOCK}', %s, (SELECT JSON_OBJECT('product_id', product_id, 'unit_in_stock', unit_in_stock,
+                                        'low_stock', low_stock)
+                     FROM tblproduct WHERE product_id = %s))
+"""
+RECORD_DELETE_SQL = f"""
+    INSERT INTO tbloutbox (event_type, product_id, payload)
+    VALUES ('{DELETE}', %s, JSON_OBJECT('product_id', %s))
+"""
+EVENTS_SQL = """
+    SELECT event_seq, event_type, payload FROM tbloutbox
+    WHERE event_seq > %s ORDER BY event_seq LIMIT %s
+"""
+RANGES_SQL = """
+    SELECT event_seq, event_type, payload FROM tbloutbox
+    WHERE {ranges} ORDER BY event_seq
+"""
+BOUNDS_SQL = "SELECT MIN(event_seq), MAX(event_seq) FROM tbloutbox"
+PURGE_SQL = "DELETE FROM tbloutbox WHERE created_at < NOW() - INTERVAL %s SECOND"
+
+outbox_events_published = Counter(
+    "pos_outbox_events_published_total",
+    "Outbox events fanned out by this worker's publisher",
+)
+outbox_poll_errors = Counter(
+    "pos_outbox_poll_errors_total",
+    "Publisher polls that failed and were retried",
+)
+stream_subscribers_dropped = Counter(
+    "pos_stream_subscribers_dropped_total",
+    "Stream subscribers disconnected for falling too far behind",
+)
+
+
+def record_product(conn, product_id):
+    """Queue a "product" event; call inside the write's transaction."""
+    conn.execute_prepared(RECORD_PRODUCT_SQL, (product_id,))
+
+
+def record_product_deleted(conn, product_id):
+    conn.execute_prepared(RECORD_DELETE_SQL, (product_id, product_id))
+
+
+def record_stock(cursor, product_ids):
+    """Queue "stock" events with the levels this transaction just wrote."""
+    ids = sorted(product_ids)
+    if ids:
+        cursor.execute(RECORD_STOCK_SQL.format(rows=", ".join([_STOCK_ROW] * len(ids))),
+                       [value for product_id in ids for value in (product_id, product_id)])
+
+
+def _fetch(sql, params):
+    conn = get_connection()
+    try:
+        cursor = conn.cursor()
+        try:
+            cursor.execute(sql, params)
+            return cursor.fetchall()
+        finally:
+            cursor.close()
+    finally:
+        conn.close()
+
+
+def read_events(since, limit):
+    """[(event_seq, event_type, payload)] after `since`, oldest first."""
+    return _fetch(EVENTS_SQL, (since, limit))
+
+
+def read_ranges(ranges):
+    """Events within the inclusive (first, last) seq ranges."""
+    sql = RANGES_SQL.format(ranges=" OR ".join(["event_seq BETWEEN %s AND %s"] * len(ranges)))
+    return _fetch(sql, [bound for seq_range in ranges for bound in seq_range])
+
+
+def bounds():
+    """(oldest, newest) event_seq kept, or (None, None) when empty."""
+    return _fetch(BOUNDS_SQL, ())[0]
+
+
+def event_data(event_seq, payload):
+    """SSE data for an event: its payload plus event_seq, for de-duplication."""
+    return orjson.dumps({"event_seq": event_seq, **orjson.loads(payload)}).decode()
+
+
+class Publisher:
+    def __init__(self):
+        self._subscribers = set()
+        self._task = None
+        self._ready = None
+        # Every seq up to the watermark has been published or is gone;
+        # _published holds the seqs above it that have been, and _gaps when
+        # each run of missing seqs (keyed by its first seq) was noticed
+        self.watermark = None
+        self._high = None
+        self._published = set()
+        self._gaps = {}
+
+    async def position(self):
+        """The current watermark, once the publisher has started."""
+        await self._ready.wait()
+        return self.watermark
+
+    def subscribe(self):
+        queue = asyncio.Queue(maxsize=OUTBOX_SUBSCRIBER_QUEUE)
+        self._subscribers.add(queue)
+        if self._task is None or self._task.done():
+            self._ready = self._ready or asyncio.Event()
+            self._task = asyncio.get_running_loop().create_task(self._run())
+        return queue
+
+    def unsubscribe(self, queue):
+        self._subscribers.discard(queue)
+
+    def _start(self):
+        # Events already in the table predate every subscriber, which
+        # replays them; only the gaps among the newest are still watched
+        newest = bounds()[1] or 0
+        self.watermark = self._high = max(0, newest - OUTBOX_BATCH_SIZE)
+        for event_seq, _, _ in read_events(self.watermark, OUTBOX_BATCH_SIZE):
+            self._published.add(event_seq)
+            self._high = max(self._high, event_seq)
+        self._advance()
+
+    def _missing_ranges(self):
+        ranges = []
+        previous = self.watermark
+        for event_seq in sorted(self._published):
+            if event_seq > previous + 1:
+                ranges.append((previous + 1, event_seq - 1))
+                if len(ranges) == OUTBOX_MAX_GAP_RANGES:
+                    break
+            previous = event_seq
+        return ranges
+
+    def _read(self, ranges):
+        rows = read_events(self._high, OUTBOX_BATCH_SIZE)
+        late = read_ranges(ranges) if ranges else []
+        return rows, late
+
+    def _publish(self, event_seq, event_type, payload):
+        self._published.add(event_seq)
+        self._high = max(self._high, event_seq)
+        outbox_events_published.inc()
+        # Everything up to the watermark went out in earlier polls
+        event = (event_seq, event_type, event_data(event_seq, payload), self.watermark)
+        for queue in list(self._subscribers):
+            try:
+                queue.put_nowait(event)
+            except asyncio.QueueFull:
+                # The client resumes with Last-Event-ID and is replayed
+                stream_subscribers_dropped.inc()
+                self._subscribers.discard(queue)
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(None)
+
+    def _advance(self):
+        now = time.monotonic()
+        for event_seq in sorted(self._published):
+            if event_seq != self.watermark + 1:
+                noticed = self._gaps.setdefault(self.watermark + 1, now)
+                if now - noticed < OUTBOX_LATE_COMMIT_SECONDS:
+                    break
+            self.watermark = event_seq
+        self._published = {event_seq for event_seq in self._published if event_seq > self.watermark}
+        self._gaps = {start: noticed for start, noticed in self._gaps.items() if start > self.watermark}
+
+    async def _run(self):
+        while True:
+            if not self._subscribers:
+                await asyncio.sleep(OUTBOX_POLL_INTERVAL)
+                continue
+            try:
+                if self.watermark is None:
+                    await asyncio.to_thread(self._start)
+                    self._ready.set()
+                rows, late = await asyncio.to_thread(self._read, self._missing_ranges())
+            except Exception:
+                outbox_poll_errors.inc()
+                await asyncio.sleep(OUTBOX_POLL_INTERVAL)
+                continue
+            for event_seq, event_type, payload in sorted(late + rows):
+                if event_seq not in self._published and event_seq > self.watermark:
+                    self._publish(event_seq, event_type, payload)
+            self._advance()
+            if len(rows) < OUTBOX_BATCH_SIZE:
+                await asyncio.sleep(OUTBOX_POLL_INTERVAL)
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+publisher = Publisher()
+
+
+def purge(conn, hours=OUTBOX_RETENTION_HOURS):
+    """Delete events older than `hours`; returns the number removed."""
+    cursor = conn.cursor()
+    try:
+        cursor.execute(PURGE_SQL, (int(hours * 3600),))
+        conn.commit()
+        return cursor.rowcount
+    finally:
+        cursor.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m app.outbox",
+                                     description="Maintain the product event outbox")
+    parser.add_argument("--purge", action="store_true", required=True,
+                        help="delete events older than the retention window")
+    parser.add_argument("--hours", type=float, default=OUTBOX_RETENTION_HOURS)
+    args = parser.parse_args(argv)
+
+    try:
+        conn = mysql.connector.connect(**DB_CONFIG)
+    except mysql.connector.Error as err:
+        print(f"Database connection error: {err}", file=sys.stderr)
+        return 1
+    try:
+        print(f"Purged {purge(conn, args.hours)} outbox events")
+        return 0
+    except mysql.connector.Error as err:
+        print(f"Purge failed: {err}", file=sys.stderr)
+        return 1
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,106 @@
+import base64
+import json
+from datetime import date
+from typing import Annotated, Optional
+
+from fastapi import HTTPException, Query, Response, status
+
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 1000
+
+# Shared `limit` query parameter for every list endpoint
+PageLimit = Annotated[int, Query(ge=1, le=MAX_LIMIT)]
+
+# Shared `sort` query parameter; a leading "-" sorts descending
+SortParam = Annotated[Optional[str], Query(description="Sort key, prefixed with '-' for descending order")]
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def encode_cursor(values):
+    raw = json.dumps([v.isoformat() if isinstance(v, date) else v for v in values])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor, size):
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except ValueError:
+        values = None
+    if not isinstance(values, list) or len(values) != size:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+    return values
+
+
+class Keyset:
+    """Orders a list query by `columns` and resumes after an opaque cursor.
+
+    Columns are qualified SQL names ("i.invoice_id"); the row key read back
+    for the next cursor is the part after the dot. The last column must be
+    unique (normally the primary key) so the order is total.
+    """
+
+    def __init__(self, *columns, descending=False):
+        self.columns = columns
+        self.keys = [column.split(".")[-1] for column in columns]
+        self.descending = descending
+
+    def reversed(self):
+        return Keyset(*self.columns, descending=not self.descending)
+
+    def query(self, base_sql, after, limit, conditions=(), params=()):
+        conditions = list(conditions)
+        params = list(params)
+        if after:
+            values = decode_cursor(after, len(self.columns))
+            # (a > x) OR (a = x AND b > y) ... so MySQL can range-scan the index
+            op = "<" if self.descending else ">"
+            branches = []
+            for i, column in enumerate(self.columns):
+                parts = [f"{c} = %s" for c in self.columns[:i]] + [f"{column} {op} %s"]
+                branches.append("(" + " AND ".join(parts) + ")")
+                params.extend(values[:i + 1])
+            conditions.append("(" + " OR ".join(branches) + ")")
+        sql = base_sql
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        direction = " DESC" if self.descending else ""
+        sql += " ORDER BY " + ", ".join(column + direction for column in self.columns) + " LIMIT %s"
+        # One extra row tells us whether there is a next page
+        params.append(limit + 1)
+        return sql, tuple(params)
+
+    def page(self, rows, limit, response: Response):
+        if len(rows) > limit:
+            rows = rows[:limit]
+            last = rows[-1]
+            response.headers[NEXT_CURSOR_HEADER] = encode_cursor([last[key] for key in self.keys])
+        return rows
+
+
+class Sorts:
+    """Whitelisted `sort` values of a list endpoint.
+
+    Each name maps to a Keyset over that column followed by the primary
+    key; "-name" walks the same index backwards. The column must be a
+    response field so the next cursor can be read from the row.
+    """
+
+    def __init__(self, default, **keysets):
+        self.default = default
+        self.keysets = {}
+        for name, keyset in keysets.items():
+            self.keysets[name] = keyset
+            self.keysets["-" + name] = keyset.reversed()
+
+    def keyset(self, sort):
+        if sort is None:
+            return self.keysets[self.default]
+        keyset = self.keysets.get(sort)
+        if keyset is None:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Unknown sort '{sort}'; expected one of: {', '.join(self.keysets)}"
+            )
+        return keyset
@@ -0,0 +1,315 @@
+"""In-process product lookup for the scanning path.
+
+Holds the price-relevant columns of every product keyed by produce_code,
+plus a sorted key list for prefix matches and a trigram index for substring
+matches over produce_code and product_name. Product writes on this worker
+patch the index right after commit. Writes on other workers reach it
+through the "product" and "delete" events they add to tbloutbox: at most
+every PRODUCT_INDEX_POLL_SECONDS a lookup reads the events after the last
+one applied and re-reads those products by id. A full reload still runs
+every REFERENCE_CACHE_TTL, in a background thread while lookups keep
+using the old table, and a code missing from the map is looked up through
+the unique index before answering 404. Stock levels are deliberately not
+part of the entries: they change on every sale and are read from the
+database.
+"""
+import bisect
+import os
+import threading
+import time
+
+import mysql.connector
+
+from app.cache import REFERENCE_CACHE_TTL
+from app.db import get_connection
+from app.metrics import Counter
+from app.outbox import DELETE, OUTBOX_LATE_COMMIT_SECONDS, PRODUCT
+
+PRODUCT_INDEX_SQL = """
+    SELECT product_id, produce_code, product_name, unit_id, category_id,
+           unit_price, discount_percentage
+    FROM tblproduct
+"""
+PRODUCT_BY_CODE_SQL = PRODUCT_INDEX_SQL + "WHERE produce_code = %s"
+PRODUCT_BY_IDS_SQL = PRODUCT_INDEX_SQL + "WHERE product_id IN ({ids})"
+# Where a fresh index starts reading events: the newest one old enough that
+# nothing before it can still commit; the snapshot already has the rest
+INDEX_EVENTS_START_SQL = """
+    SELECT event_seq FROM tbloutbox
+    WHERE created_at < NOW() - INTERVAL %s SECOND
+    ORDER BY created_at DESC LIMIT 1
+"""
+INDEX_EVENTS_SQL = """
+    SELECT event_seq, event_type, product_id,
+           created_at < NOW() - INTERVAL %s SECOND AS settled
+    FROM tbloutbox
+    WHERE event_seq > %s
+    ORDER BY event_seq
+    LIMIT %s
+"""
+_COLUMNS = ("product_id", "produce_code", "product_name", "unit_id", "category_id",
+            "unit_price", "discount_percentage")
+
+GRAM = 3
+PRODUCT_INDEX_POLL_SECONDS = float(os.getenv("PRODUCT_INDEX_POLL_SECONDS", "1"))
+PRODUCT_INDEX_EVENT_BATCH = 1000
+
+product_index_refresh_errors = Counter(
+    "pos_product_index_refresh_errors_total",
+    "Product index reloads and event polls that failed; the old table stays in use",
+    ["kind"],
+)
+
+
+def _normalize(text):
+    # The column collation is case-insensitive, so the map is as well
+    return (text or "").casefold()
+
+
+def _grams(text):
+    return {text[i:i + GRAM] for i in range(len(text) - GRAM + 1)}
+
+
+class _ProductTable:
+    def __init__(self):
+        self.by_id = {}
+        self.by_code = {}
+        self.keys = []  # sorted (normalized code or name, product_id)
+        self.grams = {}
+
+    @classmethod
+    def build(cls, rows):
+        # One sort for the whole key list; add() keeps it sorted per row,
+        # which is quadratic over a full load
+        table = cls()
+        keys = []
+        for row in rows:
+            product_id = row["product_id"]
+            table.by_id[product_id] = row
+            table.by_code[_normalize(row["produce_code"])] = product_id
+            for key in table._keys(row):
+                keys.append((key, product_id))
+                for gram in _grams(key):
+                    table.grams.setdefault(gram, set()).add(product_id)
+        keys.sort()
+        table.keys = keys
+        return table
+
+    def _keys(self, row):
+        return {_normalize(row["produce_code"]), _normalize(row["product_name"])} - {""}
+
+    def add(self, row):
+        product_id = row["product_id"]
+        self.remove(product_id)
+        self.by_id[product_id] = row
+        self.by_code[_normalize(row["produce_code"])] = product_id
+        for key in self._keys(row):
+            bisect.insort(self.keys, (key, product_id))
+            for gram in _grams(key):
+                self.grams.setdefault(gram, set()).add(product_id)
+
+    def remove(self, product_id):
+        row = self.by_id.pop(product_id, None)
+        if row is None:
+            return
+        code = _normalize(row["produce_code"])
+        if self.by_code.get(code) == product_id:
+            del self.by_code[code]
+        for key in self._keys(row):
+            i = bisect.bisect_left(self.keys, (key, product_id))
+            if i < len(self.keys) and self.keys[i] == (key, product_id):
+                del self.keys[i]
+            for gram in _grams(key):
+                self.grams.get(gram, set()).discard(product_id)
+
+    def lookup(self, code):
+        product_id = self.by_code.get(_normalize(code))
+        return None if product_id is None else self.by_id[product_id]
+
+    def search(self, q, limit):
+        q = _normalize(q)
+        found = []
+        seen = set()
+
+        # Prefix matches first: a contiguous run of the sorted key list
+        i = bisect.bisect_left(self.keys, (q,))
+        while i < len(self.keys) and len(found) < limit and self.keys[i][0].startswith(q):
+            product_id = self.keys[i][1]
+            if product_id not in seen:
+                seen.add(product_id)
+                found.append(self.by_id[product_id])
+            i += 1
+
+        # Then substring matches: intersect the query's trigram postings,
+        # smallest first, and confirm against the text
+        grams = _grams(q)
+        if grams and len(found) < limit:
+            postings = sorted((self.grams.get(gram, set()) for gram in grams), key=len)
+            candidates = set.intersection(*postings) - seen
+            for product_id in sorted(candidates):
+                row = self.by_id[product_id]
+                if any(q in key for key in self._keys(row)):
+                    found.append(row)
+                    if len(found) >= limit:
+                        break
+        return found
+
+
+def _next_seq(since, events):
+    """The seq up to which every event has been applied.
+
+    Stops at the first gap that may still fill: a missing seq below an
+    event added within OUTBOX_LATE_COMMIT_SECONDS can belong to a
+    transaction that has not committed yet.
+    """
+    for event in events:
+        if event["event_seq"] != since + 1 and not event["settled"]:
+            break
+        since = event["event_seq"]
+    return since
+
+
+class ProductIndex:
+    def __init__(self, ttl=REFERENCE_CACHE_TTL, poll=PRODUCT_INDEX_POLL_SECONDS):
+        self.ttl = ttl
+        self.poll = poll
+        self._table = None
+        self._loaded_at = 0.0
+        self._event_seq = 0
+        self._polled_at = 0.0
+        self._polling = False
+        self._reloading = False
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+
+    def _load(self, conn, with_start=False):
+        cursor = conn.cursor(dictionary=True)
+        try:
+            start = None
+            if with_start:
+                cursor.execute(INDEX_EVENTS_START_SQL, (OUTBOX_LATE_COMMIT_SECONDS,))
+                start = cursor.fetchone()
+            cursor.execute(PRODUCT_INDEX_SQL)
+            rows = cursor.fetchall()
+        finally:
+            cursor.close()
+        return _ProductTable.build(rows), start["event_seq"] if start else 0
+
+    def _reload(self):
+        conn = None
+        try:
+            with self._lock:
+                since = self._event_seq
+            conn = get_connection()
+            table, _ = self._load(conn)
+            with self._lock:
+                self._table = table
+                self._loaded_at = time.monotonic()
+                # Events applied to the old table while this one loaded may
+                # postdate the snapshot; replay them on the next lookup
+                self._event_seq = min(self._event_seq, since)
+                self._polled_at = 0.0
+        except Exception:
+            product_index_refresh_errors.inc("reload")
+            with self._lock:
+                # Retried after another TTL, not on every lookup
+                self._loaded_at = time.monotonic()
+        finally:
+            if conn is not None:
+                conn.close()
+            with self._lock:
+                self._reloading = False
+
+    def _apply_events(self, conn):
+        with self._lock:
+            since = self._event_seq
+        cursor = conn.cursor(dictionary=True)
+        try:
+            cursor.execute(INDEX_EVENTS_SQL, (OUTBOX_LATE_COMMIT_SECONDS, since, PRODUCT_INDEX_EVENT_BATCH))
+            events = cursor.fetchall()
+            product_ids = sorted({event["product_id"] for event in events
+                                  if event["event_type"] in (PRODUCT, DELETE)})
+            rows = []
+            if product_ids:
+                cursor.execute(PRODUCT_BY_IDS_SQL.format(ids=", ".join(["%s"] * len(product_ids))),
+                               product_ids)
+                rows = cursor.fetchall()
+        finally:
+            cursor.close()
+
+        # Rows are read after the events, so each is at least as new as
+        # the event that named it; replaying an event is harmless
+        found = {row["product_id"]: row for row in rows}
+        with self._lock:
+            for product_id in product_ids:
+                if product_id in found:
+                    self._table.add(found[product_id])
+                else:
+                    self._table.remove(product_id)
+            if self._event_seq == since:
+                self._event_seq = _next_seq(since, events)
+
+    def _current(self, conn):
+        with self._lock:
+            table = self._table
+        if table is None:
+            # Only the first load blocks a request, and only one at a time
+            with self._load_lock:
+                if self._table is None:
+                    table, start = self._load(conn, with_start=True)
+                    with self._lock:
+                        self._table = table
+                        self._event_seq = start
+                        self._loaded_at = self._polled_at = time.monotonic()
+            return self._table
+
+        now = time.monotonic()
+        with self._lock:
+            reload = not self._reloading and now - self._loaded_at >= self.ttl
+            poll = not self._polling and now - self._polled_at >= self.poll
+            self._reloading = self._reloading or reload
+            self._polling = self._polling or poll
+        if reload:
+            threading.Thread(target=self._reload, name="product-index-reload", daemon=True).start()
+        if poll:
+            try:
+                self._apply_events(conn)
+            except mysql.connector.Error:
+                product_index_refresh_errors.inc("poll")
+            finally:
+                with self._lock:
+                    self._polled_at = time.monotonic()
+                    self._polling = False
+        return self._table
+
+    def by_code(self, conn, code):
+        table = self._current(conn)
+        with self._lock:
+            row = table.lookup(code)
+        if row is not None:
+            return row
+        # Possibly created on another worker since the last poll
+        rows = conn.execute_prepared(PRODUCT_BY_CODE_SQL, (code,)).fetchall()
+        if not rows:
+            return None
+        self.upsert(rows[0])
+        return rows[0]
+
+    def search(self, conn, q, limit):
+        table = self._current(conn)
+        with self._lock:
+            return table.search(q, limit)
+
+    def upsert(self, row):
+        """Add or replace a product; call after the write has committed."""
+        with self._lock:
+            if self._table is not None:
+                self._table.add({column: row[column] for column in _COLUMNS})
+
+    def remove(self, product_id):
+        with self._lock:
+            if self._table is not None:
+                self._table.remove(product_id)
+
+
+products = ProductIndex()
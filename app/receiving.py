@@ -0,0 +1,181 @@
+"""Receiving stock against purchase orders.
+
+Every receipt belongs to a purchase order (tblreceiveproduct.purchase_order_id
+is NOT NULL), so every path that adds, changes or removes receipts goes
+through here. That covers /purchase-order/.../receive and the
+/receive-product/ handlers. Orders are locked first, in id order and before
+any product row (see apply_stock_deltas()), then their received totals are
+re-read under a shared lock. Concurrent receipts against the same order
+therefore queue up and cannot both pass the over-receipt check. Statuses
+move between pending, partial and received; an order in any other status
+(e.g. cancelled) keeps it.
+"""
+from fastapi import HTTPException, status
+
+from app.db import bulk_insert
+from app.models.tblpurchaseorder import PurchaseOrderReceiptStatus, PurchaseOrderReceiveResponse
+from app.stock import apply_stock_deltas
+
+PENDING = "pending"
+PARTIAL = "partial"
+RECEIVED = "received"
+RECEIPT_STATUSES = (PENDING, PARTIAL, RECEIVED)
+# Quantities are single-precision FLOAT columns; sums within this of the
+# ordered quantity count as fully received
+QUANTITY_EPSILON = 1e-3
+
+RECEIVE_PRODUCT_INSERT_SQL = """
+    INSERT INTO tblreceiveproduct (product_id, quantity, 
+                                   unit_price, sub_total, 
+                                   supplier_id, received_date, 
+                                   user_id, purchase_order_id)
+    VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+"""
+PURCHASE_ORDER_LOCK_SQL = """
+    SELECT purchase_order_id, product_id, supplier_id, quantity, unit_price, status
+    FROM tblpurchaseorder
+    WHERE purchase_order_id IN ({ids})
+    ORDER BY purchase_order_id
+    FOR UPDATE
+"""
+# A locking read sees the latest committed receipts, whatever snapshot the
+# transaction may already hold
+RECEIVED_QUANTITY_SQL = """
+    SELECT purchase_order_id, SUM(quantity) FROM tblreceiveproduct
+    WHERE purchase_order_id IN ({ids})
+    GROUP BY purchase_order_id
+    LOCK IN SHARE MODE
+"""
+PURCHASE_ORDER_STATUS_SQL = "UPDATE tblpurchaseorder SET status = %s WHERE purchase_order_id IN ({ids})"
+
+
+def _placeholders(values):
+    return ", ".join(["%s"] * len(values))
+
+
+def _receipt_status(ordered, received):
+    if received + QUANTITY_EPSILON >= (ordered or 0):
+        return RECEIVED
+    return PARTIAL if received > 0 else PENDING
+
+
+def lock_orders(cursor, purchase_order_ids):
+    """Lock the orders; returns {id: (id, product_id, supplier_id, quantity, unit_price, status)}."""
+    ids = sorted(set(purchase_order_ids))
+    cursor.execute(PURCHASE_ORDER_LOCK_SQL.format(ids=_placeholders(ids)), ids)
+    orders = {row[0]: row for row in cursor.fetchall()}
+    missing = [purchase_order_id for purchase_order_id in ids if purchase_order_id not in orders]
+    if missing:
+        raise HTTPException(status_code=404, detail=f"Purchase Order {missing[0]} not found")
+    return orders
+
+
+def _received(cursor, ids):
+    cursor.execute(RECEIVED_QUANTITY_SQL.format(ids=_placeholders(ids)), ids)
+    received = {purchase_order_id: quantity or 0 for purchase_order_id, quantity in cursor.fetchall()}
+    return {purchase_order_id: received.get(purchase_order_id, 0) for purchase_order_id in ids}
+
+
+def _over_receipt(purchase_order_id, ordered, received, quantity):
+    return HTTPException(
+        status_code=status.HTTP_400_BAD_REQUEST,
+        detail=f"Receiving {quantity:g} would exceed the {ordered or 0:g} ordered on "
+               f"Purchase Order {purchase_order_id} ({received:g} already received)"
+    )
+
+
+def check_line(purchase_order_id, order, product_id, supplier_id):
+    """400 unless a receipt's product and supplier (None: not given) match its locked order."""
+    for field, given, expected in (("product_id", product_id, order[1]), ("supplier_id", supplier_id, order[2])):
+        if given is not None and given != expected:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"{field} {given} does not match Purchase Order {purchase_order_id} ({expected})"
+            )
+
+
+def _update_statuses(cursor, orders, received):
+    statuses = {}
+    for purchase_order_id, order in orders.items():
+        current = order[5]
+        statuses[purchase_order_id] = (
+            _receipt_status(order[3], received[purchase_order_id])
+            if current in RECEIPT_STATUSES or current is None else current
+        )
+    for new_status in RECEIPT_STATUSES:
+        changed = sorted(purchase_order_id for purchase_order_id, order in orders.items()
+                         if statuses[purchase_order_id] == new_status and order[5] != new_status)
+        if changed:
+            cursor.execute(PURCHASE_ORDER_STATUS_SQL.format(ids=_placeholders(changed)), [new_status, *changed])
+    return statuses
+
+
+def sync_orders(cursor, orders, line=None):
+    """Re-derive the status of orders locked with lock_orders() after their receipts changed.
+
+    line is the (purchase_order_id, quantity) of the receipt just written,
+    if any. Raises 400 if an order now holds more than was ordered.
+    """
+    received = _received(cursor, sorted(orders))
+    for purchase_order_id, order in orders.items():
+        total = received[purchase_order_id]
+        if total <= (order[3] or 0) + QUANTITY_EPSILON:
+            continue
+        if line is not None and line[0] == purchase_order_id:
+            raise _over_receipt(purchase_order_id, order[3], total - line[1], line[1])
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Purchase Order {purchase_order_id} would hold {total:g} received, "
+                   f"more than the {order[3] or 0:g} ordered"
+        )
+    return _update_statuses(cursor, orders, received)
+
+
+def receive_lines(cursor, lines):
+    """Book (purchase_order_id, line) pairs in the caller's transaction.
+
+    A line needs quantity, received_date, user_id and unit_price (None
+    means the order's price). It may also carry product_id, supplier_id and
+    sub_total as on a /receive-product/ body; product and supplier must
+    then match the order. Inserts one tblreceiveproduct row per line, adds
+    the quantities to stock and moves each order to partial or received.
+    Raises 404 for an unknown order and 400 for a non-positive quantity, a
+    mismatched line or one that would take an order past its ordered
+    quantity.
+    """
+    if any(line.quantity <= 0 for _, line in lines):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Received quantities must be positive")
+    orders = lock_orders(cursor, [purchase_order_id for purchase_order_id, _ in lines])
+    received = _received(cursor, sorted(orders))
+
+    rows = []
+    deltas = {}
+    for purchase_order_id, line in lines:
+        _, product_id, supplier_id, ordered, order_price, _ = orders[purchase_order_id]
+        check_line(purchase_order_id, orders[purchase_order_id],
+                   getattr(line, "product_id", None), getattr(line, "supplier_id", None))
+        total = received[purchase_order_id] + line.quantity
+        if total > (ordered or 0) + QUANTITY_EPSILON:
+            raise _over_receipt(purchase_order_id, ordered, received[purchase_order_id], line.quantity)
+        received[purchase_order_id] = total
+        deltas[product_id] = deltas.get(product_id, 0) + line.quantity
+        unit_price = order_price if line.unit_price is None else line.unit_price
+        sub_total = getattr(line, "sub_total", None)
+        if sub_total is None:
+            sub_total = line.quantity * (unit_price or 0)
+        rows.append((product_id, line.quantity, unit_price, sub_total,
+                     supplier_id, line.received_date, line.user_id, purchase_order_id))
+
+    apply_stock_deltas(cursor, deltas)
+    receive_product_ids = bulk_insert(cursor, RECEIVE_PRODUCT_INSERT_SQL, rows)
+    statuses = _update_statuses(cursor, orders, received)
+
+    return PurchaseOrderReceiveResponse(
+        receive_product_ids=receive_product_ids,
+        purchase_orders=[
+            PurchaseOrderReceiptStatus(purchase_order_id=purchase_order_id, quantity=orders[purchase_order_id][3],
+                                       received_quantity=received[purchase_order_id],
+                                       status=statuses[purchase_order_id])
+            for purchase_order_id in sorted(orders)
+        ],
+    )
@@ -0,0 +1,57 @@
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from app.db import get_db
+from app.models.reports import AbcReportResponse, DailySalesResponse
+from app.sales_analysis import abc_analysis
+from datetime import date
+from typing import List, Optional
+import mysql.connector
+
+router = APIRouter(prefix="/reports", tags=["Reports"])
+
+# Reads tblsalesdaily only, so the cost grows with the number of days in
+# the range rather than the number of sales lines.
+DAILY_SALES_SQL = """
+    SELECT sales_date, SUM(quantity) AS quantity,
+           SUM(total_amount) AS total_amount, SUM(line_count) AS line_count
+    FROM tblsalesdaily
+    WHERE {conditions}
+    GROUP BY sales_date
+    HAVING SUM(line_count) > 0
+    ORDER BY sales_date
+"""
+
+@router.get("/sales/daily", response_model=List[DailySalesResponse])
+def get_daily_sales(date_from: date = Query(alias="from"), date_to: date = Query(alias="to"),
+                    product_id: Optional[int] = None, user_id: Optional[int] = None,
+                    conn=Depends(get_db)):
+    if date_from > date_to:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="'from' must not be after 'to'")
+
+    conditions = ["sales_date BETWEEN %s AND %s"]
+    params = [date_from, date_to]
+    if product_id is not None:
+        conditions.append("product_id = %s")
+        params.append(product_id)
+    if user_id is not None:
+        conditions.append("user_id = %s")
+        params.append(user_id)
+
+    cursor = conn.cursor(dictionary=True)
+    try:
+        cursor.execute(DAILY_SALES_SQL.format(conditions=" AND ".join(conditions)), tuple(params))
+        return [DailySalesResponse(**row) for row in cursor.fetchall()]
+    except mysql.connector.Error as err:
+        raise HTTPException(status_code=500, detail=f"Database error: {err}")
+    finally:
+        cursor.close()
+
+@router.get("/abc", response_model=AbcReportResponse)
+def get_abc_report(date_from: Optional[date] = Query(None, alias="from"),
+                   date_to: Optional[date] = Query(None, alias="to"), conn=Depends(get_db)):
+    if date_from is not None and date_to is not None and date_from > date_to:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="'from' must not be after 'to'")
+    try:
+        summary, products = abc_analysis(conn, date_from, date_to)
+        return AbcReportResponse(products=products, **summary)
+    except mysql.connector.Error as err:
+        raise HTTPException(status_code=500, detail=f"Database error: {err}")
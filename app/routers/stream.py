@@ -0,0 +1,104 @@
+from fastapi import APIRouter, Header, Query
+from fastapi.responses import StreamingResponse
+from app import outbox
+from typing import Optional
+import asyncio
+import os
+
+router = APIRouter(prefix="/stream", tags=["Stream"])
+
+# Seconds of silence before a keepalive comment, so proxies keep the stream open
+STREAM_HEARTBEAT = float(os.getenv("STREAM_HEARTBEAT", "15"))
+# Seconds to wait for the publisher's first read of the outbox before
+# closing the stream; the client reconnects after STREAM_RETRY_MS
+STREAM_START_TIMEOUT = float(os.getenv("STREAM_START_TIMEOUT", "30"))
+# Client reconnect delay (ms) sent in the SSE `retry` field
+STREAM_RETRY_MS = 1000
+
+
+def _event(event_id, event_type, data):
+    return f"id: {event_id}\nevent: {event_type}\ndata: {data}\n\n"
+
+
+async def _events(queue, resume):
+    try:
+        yield f"retry: {STREAM_RETRY_MS}\n\n"
+        # Subscribed before reading the table, so every event is either
+        # visible to the replay or still to come through the queue; the
+        # replayed ones are skipped when they come through it as well
+        starting = asyncio.ensure_future(outbox.publisher.position())
+        deadline = asyncio.get_running_loop().time() + STREAM_START_TIMEOUT
+        try:
+            while True:
+                remaining = deadline - asyncio.get_running_loop().time()
+                if remaining <= 0:
+                    # The database is unreachable; let the client retry
+                    return
+                done, _ = await asyncio.wait({starting}, timeout=min(STREAM_HEARTBEAT, remaining))
+                if done:
+                    break
+                yield ": keepalive\n\n"
+        finally:
+            starting.cancel()
+        watermark = starting.result()
+        resume = watermark if resume is None else resume
+        replayed = set()
+        oldest, _ = await asyncio.to_thread(outbox.bounds)
+        purged = resume < watermark and (oldest is None or resume + 1 < oldest)
+        rows = [] if purged else await asyncio.to_thread(
+            outbox.read_events, resume, outbox.OUTBOX_REPLAY_LIMIT + 1
+        )
+        if purged or len(rows) > outbox.OUTBOX_REPLAY_LIMIT:
+            # Purged or too far behind: reload the catalog, then follow on
+            yield _event(watermark, "reset", "{}")
+            resume = max(resume, watermark)
+        else:
+            for event_seq, event_type, payload in rows:
+                replayed.add(event_seq)
+                # Every event up to here is sent, or gone if below the watermark
+                event_id = max(resume, min(event_seq, watermark))
+                yield _event(event_id, event_type, outbox.event_data(event_seq, payload))
+            resume = max(resume, watermark)
+
+        while True:
+            try:
+                event = await asyncio.wait_for(queue.get(), STREAM_HEARTBEAT)
+            except asyncio.TimeoutError:
+                yield ": keepalive\n\n"
+                continue
+            if event is None:
+                # Dropped for falling behind; the client resumes from its Last-Event-ID
+                return
+            event_seq, event_type, data, event_watermark = event
+            if event_seq in replayed:
+                replayed.discard(event_seq)
+                continue
+            resume = max(resume, event_watermark)
+            yield _event(resume, event_type, data)
+    finally:
+        outbox.publisher.unsubscribe(queue)
+
+
+@router.get("/products")
+async def stream_products(
+    since: Optional[int] = Query(None, ge=0, description="Resume after this event id"),
+    last_event_id: Optional[str] = Header(None),
+):
+    """Server-sent events for product, price and stock changes.
+
+    Event ids are resume points: EventSource sends the last one back as
+    Last-Event-ID on reconnect and the events after it are replayed first.
+    A replay may repeat events already received; each event's data carries
+    its event_seq to drop them by. `reset` means the missed events are no
+    longer available and the client should reload /product/ before
+    applying further events.
+    """
+    resume = since
+    if last_event_id is not None and last_event_id.strip().isdigit():
+        resume = int(last_event_id)
+    queue = outbox.publisher.subscribe()
+    return StreamingResponse(
+        _events(queue, resume),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
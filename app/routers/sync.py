@@ -0,0 +1,158 @@
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from app import etag, idempotency
+from app.changelog import DELETE, UPSERT, next_seq, read_changes
+from app.db import MAX_BULK_ROWS, foreign_key_column, get_db
+from app.models.sync import (
+    SyncChangesResponse, SyncInvoiceResult, SyncStatus, SyncUpload, SyncUploadResponse,
+)
+from app.routers.tblcustomer import CUSTOMER_LIST_SQL
+from app.routers.tblinvoice import insert_checkout
+from app.routers.tblproduct import NAME_FIELDS, PRODUCT_LIST_SQL
+from app.stock import UnknownProduct, run_transaction
+from typing import Annotated
+import os
+import mysql.connector
+
+router = APIRouter(prefix="/sync", tags=["Sync"])
+
+# Invoices accepted per upload, and written per transaction within it
+SYNC_MAX_INVOICES = int(os.getenv("SYNC_MAX_INVOICES", "1000"))
+SYNC_CHUNK_SIZE = int(os.getenv("SYNC_CHUNK_SIZE", "50"))
+# Keeps "sync/<terminal_id>" within tblidempotency.endpoint
+MAX_TERMINAL_ID_LENGTH = 48
+MAX_CLIENT_REF_LENGTH = 255
+
+DEFAULT_CHANGES = 1000
+MAX_CHANGES = 5000
+ChangesLimit = Annotated[int, Query(ge=1, le=MAX_CHANGES)]
+
+# changelog table -> (response key, current rows by id, id column)
+CATALOG_TABLES = {
+    "tblproduct": ("products", PRODUCT_LIST_SQL + "WHERE p.product_id IN ({ids})", "product_id"),
+    "tblproductcategory": (
+        "categories",
+        "SELECT category_id, category_name FROM tblproductcategory WHERE category_id IN ({ids})",
+        "category_id",
+    ),
+    "tblproductunit": ("units", "SELECT unit_id, unit_name FROM tblproductunit WHERE unit_id IN ({ids})", "unit_id"),
+    "tblcustomer": ("customers", CUSTOMER_LIST_SQL + "WHERE customer_id IN ({ids})", "customer_id"),
+}
+
+def _rejected(invoice, detail):
+    return SyncInvoiceResult(client_ref=invoice.client_ref, status=SyncStatus.REJECTED, detail=detail)
+
+def _ingest(conn, cursor, endpoint, invoice):
+    """Write one queued invoice, or explain why not, without ending the chunk."""
+    if not invoice.client_ref or len(invoice.client_ref) > MAX_CLIENT_REF_LENGTH:
+        return _rejected(invoice, f"client_ref must be 1 to {MAX_CLIENT_REF_LENGTH} characters")
+    if not invoice.lines or len(invoice.lines) > MAX_BULK_ROWS:
+        return _rejected(invoice, f"An invoice needs between 1 and {MAX_BULK_ROWS} lines")
+
+    request_hash = idempotency.fingerprint(invoice)
+    # A rejected invoice is undone on its own; the rest of the chunk stays
+    cursor.execute("SAVEPOINT sync_invoice")
+    stored = idempotency.claim(cursor, endpoint, invoice.client_ref, request_hash)
+    if stored is not None:
+        stored_hash, _, body = stored
+        if stored_hash != request_hash:
+            return _rejected(invoice, "client_ref was already uploaded with different contents")
+        result = SyncInvoiceResult.model_validate_json(bytes(body))
+        result.status = SyncStatus.DUPLICATE
+        return result
+
+    try:
+        # The sale already happened at the till, so a stock count that has
+        # drifted below it is flagged for a recount rather than refused
+        invoice_id, sales_ids, oversold = insert_checkout(conn, cursor, invoice, oversell=True)
+    except UnknownProduct as err:
+        cursor.execute("ROLLBACK TO SAVEPOINT sync_invoice")
+        return _rejected(invoice, f"{err} {err.product_id}")
+    except mysql.connector.IntegrityError as err:
+        cursor.execute("ROLLBACK TO SAVEPOINT sync_invoice")
+        column = foreign_key_column(err)
+        return _rejected(invoice, f"Invalid {column}" if column else f"Database error: {err}")
+
+    result = SyncInvoiceResult(
+        client_ref=invoice.client_ref, status=SyncStatus.CREATED,
+        invoice_id=invoice_id, sales_ids=sales_ids, oversold=oversold,
+        detail=f"Stock is now below zero for product ID {', '.join(map(str, oversold))}" if oversold else None
+    )
+    idempotency.store(cursor, endpoint, invoice.client_ref, status.HTTP_201_CREATED,
+                      result.model_dump_json().encode())
+    return result
+
+@router.post("/invoices", response_model=SyncUploadResponse)
+def upload_invoices(upload: SyncUpload, conn=Depends(get_db)):
+    if not upload.terminal_id or len(upload.terminal_id) > MAX_TERMINAL_ID_LENGTH:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"terminal_id must be 1 to {MAX_TERMINAL_ID_LENGTH} characters"
+        )
+    if not upload.invoices or len(upload.invoices) > SYNC_MAX_INVOICES:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Send between 1 and {SYNC_MAX_INVOICES} invoices"
+        )
+
+    # client_ref is the idempotency key, scoped to the terminal
+    endpoint = "sync/" + upload.terminal_id
+    results = []
+    try:
+        for start in range(0, len(upload.invoices), SYNC_CHUNK_SIZE):
+            chunk = upload.invoices[start:start + SYNC_CHUNK_SIZE]
+            results.extend(run_transaction(
+                conn, lambda cursor, chunk=chunk: [_ingest(conn, cursor, endpoint, invoice) for invoice in chunk]
+            ))
+    except mysql.connector.Error as err:
+        # Chunks before this one are committed; uploading the same batch
+        # again reports them as duplicates and retries the rest
+        raise HTTPException(status_code=500, detail=f"Database error: {err}")
+    finally:
+        if any(result.status == SyncStatus.CREATED for result in results):
+            etag.bump("tblproduct")
+    return SyncUploadResponse(results=results)
+
+@router.get("/changes", response_model=SyncChangesResponse)
+def get_changes(since: int = Query(0, ge=0), limit: ChangesLimit = DEFAULT_CHANGES, conn=Depends(get_db)):
+    try:
+        entries = read_changes(conn, since, limit + 1)
+        has_more = len(entries) > limit
+        entries = entries[:limit]
+
+        # Last operation per row in this page; older ones are superseded
+        latest = {}
+        for entry in entries:
+            latest.setdefault(entry["table_name"], {})[entry["row_id"]] = entry["operation"]
+
+        # next_seq may stay behind a gap a late commit can still fill, so a
+        # full page only means "more" if the reader actually moves forward
+        resume = next_seq(since, entries)
+        changes = {"next_seq": resume, "has_more": has_more and resume > since}
+        deleted = {}
+        cursor = conn.cursor(dictionary=True)
+        try:
+            for table, (key, sql, id_column) in CATALOG_TABLES.items():
+                operations = latest.get(table, {})
+                ids = [row_id for row_id, operation in operations.items() if operation == UPSERT]
+                rows = []
+                if ids:
+                    cursor.execute(sql.format(ids=", ".join(["%s"] * len(ids))), ids)
+                    rows = cursor.fetchall()
+                found = {row[id_column] for row in rows}
+                # A row deleted after its upsert entry is a tombstone already
+                deleted[key] = [
+                    row_id for row_id, operation in operations.items()
+                    if operation == DELETE or row_id not in found
+                ]
+                changes[key] = rows
+        finally:
+            cursor.close()
+
+        for field, (column, names) in NAME_FIELDS.items():
+            lookup = names.get(conn)
+            for product in changes["products"]:
+                product[field] = lookup.get(product[column])
+
+        return SyncChangesResponse(deleted=deleted, **changes)
+    except mysql.connector.Error as err:
+        raise HTTPException(status_code=500, detail=f"Database error: {err}")
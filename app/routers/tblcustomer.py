@@ -1,49 +1,56 @@
-from fastapi import APIRouter, HTTPException, status
-from app.db import get_connection
+from fastapi import APIRouter, Depends, HTTPException, Response, status
+from app import etag
+from app.changelog import DELETE, record_change
+from app.db import get_db
+from app.pagination import DEFAULT_LIMIT, Keyset, PageLimit
+from app.fields import FieldsParam, Projection
+from app.serialization import json_item, json_response
 from app.models.tblcustomer import CustomerCreate, CustomerResponse
-from typing import List
+from typing import List, Optional
 import mysql.connector
 
 
 from app.models.tbluser import UserResponse
 router = APIRouter(prefix="/customer", tags=["Customer"])
 
-@router.get("/", response_model=List[CustomerResponse])
-def get_customers():
-    conn = get_connection()
+CUSTOMER_PROJECTION = Projection(CustomerResponse, "tblcustomer")
+CUSTOMER_LIST_SQL = CUSTOMER_PROJECTION.select()
+CUSTOMER_DETAIL_WHERE = "WHERE customer_id = %s"
+CUSTOMER_KEYSET = Keyset("customer_id")
+CUSTOMER_ETAG = Depends(etag.conditional("tblcustomer"))
+
+@router.get("/", response_model=List[CustomerResponse], dependencies=[CUSTOMER_ETAG])
+def get_customers(response: Response, limit: PageLimit = DEFAULT_LIMIT, after: Optional[str] = None,
+                  fields: FieldsParam = None, conn=Depends(get_db)):
+    requested = CUSTOMER_PROJECTION.parse(fields)
     cursor = conn.cursor(dictionary=True)
     try:
-        cursor.execute("""
-            SELECT customer_id, customer_code, customer_name, contact, address
-            FROM tblcustomer
-        """)
-        customers = cursor.fetchall()
-        return [CustomerResponse(**customer) for customer in customers]
+        base_sql = CUSTOMER_PROJECTION.select(requested, CUSTOMER_KEYSET.keys)
+        cursor.execute(*CUSTOMER_KEYSET.query(base_sql, after, limit))
+        customers = CUSTOMER_KEYSET.page(cursor.fetchall(), limit, response)
+        return json_response(customers, CustomerResponse, response, requested)
     except mysql.connector.Error as err:
         raise HTTPException(status_code=500, detail=f"Database error: {err}")
     finally:
         cursor.close()
-        conn.close()
 
-@router.get("/{customer_id}", response_model=CustomerResponse)
-def get_customer(customer_id: int):
-    conn = get_connection()
+@router.get("/{customer_id}", response_model=CustomerResponse, dependencies=[CUSTOMER_ETAG])
+def get_customer(customer_id: int, response: Response, fields: FieldsParam = None, conn=Depends(get_db)):
+    requested = CUSTOMER_PROJECTION.parse(fields)
     cursor = conn.cursor(dictionary=True)
     try:
-        cursor.execute("SELECT customer_id, customer_code, customer_name, contact, address FROM tblcustomer WHERE customer_id = %s", (customer_id,))
+        cursor.execute(CUSTOMER_PROJECTION.select(requested) + CUSTOMER_DETAIL_WHERE, (customer_id,))
         customer = cursor.fetchone()
         if not customer:
             raise HTTPException(status_code=404, detail="Customer not found")
-        return CustomerResponse(**customer)
+        return json_item(customer, CustomerResponse, response, requested)
     except mysql.connector.Error as err:
         raise HTTPException(status_code=500, detail=f"Database error: {err}")
     finally:
         cursor.close()
-        conn.close()
 
 @router.post("/", response_model=CustomerResponse, status_code=status.HTTP_201_CREATED)
-def create_customer(customer: CustomerCreate):
-    conn = get_connection()
+def create_customer(customer: CustomerCreate, conn=Depends(get_db)):
     cursor = conn.cursor(dictionary=True)
     try:
         # Check if customer_code is unique
@@ -59,7 +66,9 @@ def create_customer(customer: CustomerCreate):
             INSERT INTO tblcustomer (customer_code, customer_name, contact, address)
             VALUES (%s, %s, %s, %s)
         """, (customer.customer_code, customer.customer_name, customer.contact, customer.address))
+        record_change(conn, "tblcustomer", cursor.lastrowid)
         conn.commit()
+        etag.bump("tblcustomer")
         
         # Get the created customer ID
         customer_id = cursor.lastrowid
@@ -73,11 +82,9 @@ def create_customer(customer: CustomerCreate):
         raise HTTPException(status_code=500, detail=f"Database error: {err}")
     finally:
         cursor.close()
-        conn.close()
 
 @router.put("/{customer_id}", response_model=CustomerResponse)
-def update_customer(customer_id: int, customer: CustomerCreate):
-    conn = get_connection()
+def update_customer(customer_id: int, customer: CustomerCreate, conn=Depends(get_db)):
     cursor = conn.cursor(dictionary=True)
     try:
         # Check if customer exists
@@ -91,7 +98,9 @@ def update_customer(customer_id: int, customer: CustomerCreate):
             SET customer_code = %s, customer_name = %s, contact = %s, address = %s 
             WHERE customer_id = %s
         """, (customer.customer_code, customer.customer_name, customer.contact, customer.address, customer_id))
+        record_change(conn, "tblcustomer", customer_id)
         conn.commit()
+        etag.bump("tblcustomer")
         
         # Fetch the updated customer details
         cursor.execute("SELECT * FROM tblcustomer WHERE customer_id = %s", (customer_id,))
@@ -102,11 +111,9 @@ def update_customer(customer_id: int, customer: CustomerCreate):
         raise HTTPException(status_code=500, detail=f"Database error: {err}")
     finally:
         cursor.close()
-        conn.close()
 
 @router.delete("/{customer_id}", status_code=status.HTTP_200_OK)
-def delete_customer(customer_id: int):
-    conn = get_connection()
+def delete_customer(customer_id: int, conn=Depends(get_db)):
     cursor = conn.cursor(dictionary=True)
     try:
         # Check if customer exists
@@ -116,11 +123,12 @@ def delete_customer(customer_id: int):
         
         # Delete customer
         cursor.execute("DELETE FROM tblcustomer WHERE customer_id = %s", (customer_id,))
+        record_change(conn, "tblcustomer", customer_id, DELETE)
         conn.commit()
+        etag.bump("tblcustomer")
         
         return {"detail": "Customer deleted successfully"}
     except mysql.connector.Error as err:
         raise HTTPException(status_code=500, detail=f"Database error: {err}")
     finally:
         cursor.close()
-        conn.close()
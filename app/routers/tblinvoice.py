@@ -1,93 +1,237 @@
-from fastapi import APIRouter, HTTPException, status
-from app.db import get_connection
-from app.models.tblinvoice import InvoiceCreate, InvoiceResponse
+from fastapi import APIRouter, Depends, HTTPException, Response, status
+from app import cache, etag
+from app.db import MAX_BULK_ROWS, bulk_insert, foreign_key_column, get_async_db, get_db
+from app.idempotency import IdempotencyKey, run_idempotent
+from app.export import ExportFormat, export_response
+from app.filters import DateFrom, DateTo, Filters
+from app.pagination import DEFAULT_LIMIT, Keyset, PageLimit, SortParam, Sorts
+from app.fields import FieldsParam, IncludeParam, Projection, parse_include
+from app.serialization import json_item, json_response
+from app.models.tblinvoice import CheckoutCreate, CheckoutResponse, InvoiceCreate, InvoiceDetailResponse, InvoiceResponse
 from app.models.tblcustomer import CustomerResponse
-from typing import List
+from typing import List, Optional
+import aiomysql
 import mysql.connector
 from app.models.tbluser import UserResponse
+from app.models.tblsales import SaleResponse
+from app.routers.tblcustomer import CUSTOMER_LIST_SQL
+from app.routers.tblsales import SALE_INSERT_SQL
+from app.sales_summary import adjust_sales_daily
+from app.stock import InsufficientStock, UnknownProduct, apply_stock_deltas, run_transaction, stock_deltas
 
 router = APIRouter(prefix="/invoice", tags=["Invoice"])
+# Registered ahead of `router` when DB_DRIVER=async
+async_router = APIRouter(prefix="/invoice", tags=["Invoice"])
 
-@router.get("/", response_model=List[InvoiceResponse])
-def get_invoices():
-    conn = get_connection()
+# created_by comes from the in-process username cache instead of a tbluser join;
+# the customer join is only made when customer_name is requested
+INVOICE_PROJECTION = Projection(
+    InvoiceResponse, "tblinvoice i", alias="i",
+    columns={"customer_name": "c.customer_name"},
+    joins={"customer_name": "LEFT JOIN tblcustomer c ON i.customer_id = c.customer_id"},
+    derived={"created_by": ("user_id",)},
+)
+INVOICE_LIST_SQL = INVOICE_PROJECTION.select()
+INVOICE_KEYSET = Keyset("i.date_recorded", "i.invoice_id")
+# Not total_amount: see PRODUCT_SORTS on FLOAT keyset columns
+INVOICE_SORTS = Sorts(
+    "date_recorded",
+    date_recorded=INVOICE_KEYSET,
+    invoice_id=Keyset("i.invoice_id"),
+)
+
+# Hot lookups go through the per-connection prepared statement cache
+INVOICE_DETAIL_WHERE = "WHERE i.invoice_id = %s"
+INVOICE_DETAIL_SQL = INVOICE_LIST_SQL + INVOICE_DETAIL_WHERE
+INVOICE_INSERT_SQL = """
+    INSERT INTO tblinvoice (
+        customer_id, payment_type, total_amount, amount_tendered,
+        bank_account_name, bank_account_number, date_recorded, user_id
+    ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+"""
+INVOICE_UPDATE_SQL = """
+    UPDATE tblinvoice SET 
+        customer_id = %s, payment_type = %s, total_amount = %s, 
+        amount_tendered = %s, bank_account_name = %s, 
+        bank_account_number = %s, date_recorded = %s, user_id = %s 
+    WHERE invoice_id = %s
+"""
+
+# ?include= embeds related rows with one batched IN (...) query per kind,
+# however many invoices are on the page
+INVOICE_LINES_SQL = """
+    SELECT s.sales_id, s.invoice_id, s.product_id, s.quantity,
+           s.unit_price, s.sub_total, p.product_name
+    FROM tblsales s
+    LEFT JOIN tblproduct p ON s.product_id = p.product_id
+    WHERE s.invoice_id IN ({ids})
+    ORDER BY s.invoice_id, s.sales_id
+"""
+INVOICE_CUSTOMERS_SQL = CUSTOMER_LIST_SQL + "WHERE customer_id IN ({ids})"
+INVOICE_EXPORT_SQL = """
+    SELECT invoice_id, customer_id, payment_type, total_amount,
+           amount_tendered, bank_account_name, bank_account_number,
+           date_recorded, user_id
+    FROM tblinvoice
+    ORDER BY invoice_id
+"""
+# Invoice column each include is keyed on
+INCLUDE_KEYS = {"lines": "invoice_id", "customer": "customer_id"}
+
+def _attach_usernames(invoices, users):
+    if users is None:
+        return invoices
+    for invoice in invoices:
+        invoice["created_by"] = users.get(invoice["user_id"])
+    return invoices
+
+def _usernames(conn, requested):
+    return cache.usernames.get(conn) if INVOICE_PROJECTION.wants(requested, "created_by") else None
+
+def _include_queries(invoices, includes):
+    """(sql, params, attach) for each requested include."""
+    queries = []
+    if "lines" in includes:
+        for invoice in invoices:
+            invoice["lines"] = []
+        by_id = {invoice["invoice_id"]: invoice for invoice in invoices}
+
+        def attach_lines(rows):
+            for row in rows:
+                by_id[row["invoice_id"]]["lines"].append(row)
+
+        ids = list(by_id)
+        queries.append((INVOICE_LINES_SQL.format(ids=", ".join(["%s"] * len(ids))), ids, attach_lines))
+    if "customer" in includes:
+        ids = list({invoice["customer_id"] for invoice in invoices if invoice["customer_id"] is not None})
+
+        def attach_customers(rows):
+            customers = {row["customer_id"]: row for row in rows}
+            for invoice in invoices:
+                invoice["customer"] = customers.get(invoice["customer_id"])
+
+        if ids:
+            queries.append((INVOICE_CUSTOMERS_SQL.format(ids=", ".join(["%s"] * len(ids))), ids, attach_customers))
+        else:
+            attach_customers([])
+    return queries
+
+def _embed(conn, invoices, includes):
+    if not invoices or not includes:
+        return
     cursor = conn.cursor(dictionary=True)
     try:
-        cursor.execute("""
-            SELECT i.invoice_id, i.customer_id, i.payment_type, 
-                   i.total_amount, i.amount_tendered, 
-                   i.bank_account_name, i.bank_account_number, 
-                   i.date_recorded, i.user_id,
-                   c.customer_name AS customer_name,
-                   u.username AS created_by
-            FROM tblinvoice i
-            JOIN tblcustomer c ON i.customer_id = c.customer_id
-            JOIN tbluser u ON i.user_id = u.user_id
-        """)
-        invoices = cursor.fetchall()
-        return [InvoiceResponse(**invoice) for invoice in invoices]
+        for sql, params, attach in _include_queries(invoices, includes):
+            cursor.execute(sql, params)
+            attach(cursor.fetchall())
+    finally:
+        cursor.close()
+
+async def _embed_async(cursor, invoices, includes):
+    if not invoices or not includes:
+        return
+    for sql, params, attach in _include_queries(invoices, includes):
+        await cursor.execute(sql, params)
+        attach(await cursor.fetchall())
+
+def _output_fields(requested, includes):
+    return [*(requested or InvoiceResponse.model_fields), *includes]
+
+def invoice_filters(date_from: DateFrom = None, date_to: DateTo = None,
+                    customer_id: Optional[int] = None, user_id: Optional[int] = None):
+    return (Filters()
+            .date_range("i.date_recorded", date_from, date_to)
+            .equal("i.customer_id", customer_id)
+            .equal("i.user_id", user_id))
+
+@router.get("/", response_model=List[InvoiceDetailResponse])
+def get_invoices(response: Response, limit: PageLimit = DEFAULT_LIMIT, after: Optional[str] = None,
+                 fields: FieldsParam = None, include: IncludeParam = None, sort: SortParam = None,
+                 filters: Filters = Depends(invoice_filters), conn=Depends(get_db)):
+    requested = INVOICE_PROJECTION.parse(fields)
+    includes = parse_include(include, INCLUDE_KEYS)
+    keyset = INVOICE_SORTS.keyset(sort)
+    cursor = conn.cursor(dictionary=True)
+    try:
+        base_sql = INVOICE_PROJECTION.select(requested, [*keyset.keys, *(INCLUDE_KEYS[name] for name in includes)])
+        cursor.execute(*keyset.query(base_sql, after, limit, filters.conditions, filters.params))
+        invoices = keyset.page(cursor.fetchall(), limit, response)
+        _attach_usernames(invoices, _usernames(conn, requested))
+        _embed(conn, invoices, includes)
+        return json_response(invoices, InvoiceDetailResponse, response, _output_fields(requested, includes))
     except mysql.connector.Error as err:
         raise HTTPException(status_code=500, detail=f"Database error: {err}")
     finally:
         cursor.close()
-        conn.close()
 
-@router.get("/{invoice_id}", response_model=InvoiceResponse)
-def get_invoice(invoice_id: int):
-    conn = get_connection()
-    cursor = conn.cursor(dictionary=True)
+@async_router.get("/", response_model=List[InvoiceDetailResponse])
+async def get_invoices_async(response: Response, limit: PageLimit = DEFAULT_LIMIT,
+                             after: Optional[str] = None, fields: FieldsParam = None,
+                             include: IncludeParam = None, sort: SortParam = None,
+                             filters: Filters = Depends(invoice_filters), conn=Depends(get_async_db)):
+    requested = INVOICE_PROJECTION.parse(fields)
+    includes = parse_include(include, INCLUDE_KEYS)
+    keyset = INVOICE_SORTS.keyset(sort)
+    async with conn.cursor(aiomysql.DictCursor) as cursor:
+        try:
+            base_sql = INVOICE_PROJECTION.select(requested, [*keyset.keys, *(INCLUDE_KEYS[name] for name in includes)])
+            await cursor.execute(*keyset.query(base_sql, after, limit, filters.conditions, filters.params))
+            invoices = keyset.page(await cursor.fetchall(), limit, response)
+            users = None
+            if INVOICE_PROJECTION.wants(requested, "created_by"):
+                users = await cache.usernames.get_async(conn)
+            _attach_usernames(invoices, users)
+            await _embed_async(cursor, invoices, includes)
+            return json_response(invoices, InvoiceDetailResponse, response, _output_fields(requested, includes))
+        except aiomysql.Error as err:
+            raise HTTPException(status_code=500, detail=f"Database error: {err}")
+
+@router.get("/export")
+def export_invoices(format: ExportFormat = ExportFormat.NDJSON):
+    return export_response(INVOICE_EXPORT_SQL, (), format, "invoices")
+
+@router.get("/{invoice_id}", response_model=InvoiceDetailResponse)
+def get_invoice(invoice_id: int, response: Response, fields: FieldsParam = None,
+                include: IncludeParam = None, conn=Depends(get_db)):
+    requested = INVOICE_PROJECTION.parse(fields)
+    includes = parse_include(include, INCLUDE_KEYS)
     try:
-        cursor.execute("""
-            SELECT i.invoice_id, i.customer_id, i.payment_type, 
-                   i.total_amount, i.amount_tendered, 
-                   i.bank_account_name, i.bank_account_number, 
-                   i.date_recorded, i.user_id,
-                   c.customer_name AS customer_name,
-                   u.username AS created_by
-            FROM tblinvoice i
-            JOIN tblcustomer c ON i.customer_id = c.customer_id
-            JOIN tbluser u ON i.user_id = u.user_id
-            WHERE i.invoice_id = %s
-        """, (invoice_id,))
-        invoice = cursor.fetchone()
+        sql = INVOICE_PROJECTION.select(requested, [INCLUDE_KEYS[name] for name in includes]) + INVOICE_DETAIL_WHERE
+        invoice = conn.fetchone_prepared(sql, (invoice_id,))
         if not invoice:
             raise HTTPException(status_code=404, detail="Invoice not found")
-        return InvoiceResponse(**invoice)
+        _attach_usernames([invoice], _usernames(conn, requested))
+        _embed(conn, [invoice], includes)
+        return json_item(invoice, InvoiceDetailResponse, response, _output_fields(requested, includes))
     except mysql.connector.Error as err:
         raise HTTPException(status_code=500, detail=f"Database error: {err}")
-    finally:
-        cursor.close()
-        conn.close()
+
+def _integrity_error(err):
+    # Customer/user existence is enforced by the FOREIGN KEY constraints so
+    # the write is a single round trip; map violations to the old 400s.
+    column = foreign_key_column(err)
+    if column == "customer_id":
+        message = "Invalid customer ID"
+    elif column == "user_id":
+        message = "Invalid user ID"
+    elif column == "product_id":
+        message = "Invalid product ID"
+    else:
+        return HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail={"status": "error", "message": f"Database error: {err}"}
+        )
+    return HTTPException(
+        status_code=status.HTTP_400_BAD_REQUEST,
+        detail={"status": "error", "message": message}
+    )
 
 @router.post("/", response_model=InvoiceResponse, status_code=status.HTTP_201_CREATED)
-def create_invoice(invoice: InvoiceCreate):
-    conn = None
-    cursor = None
-    try:
-        conn = get_connection()
-        cursor = conn.cursor(dictionary=True)
-        
-        # Validate foreign keys
-        cursor.execute("SELECT customer_id FROM tblcustomer WHERE customer_id = %s", (invoice.customer_id,))
-        if not cursor.fetchone():
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail={"status": "error", "message": "Invalid customer ID"}
-            )
-            
-        cursor.execute("SELECT user_id FROM tbluser WHERE user_id = %s", (invoice.user_id,))
-        if not cursor.fetchone():
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail={"status": "error", "message": "Invalid user ID"}
-            )
-        
+def create_invoice(invoice: InvoiceCreate, idempotency_key: IdempotencyKey = None, conn=Depends(get_db)):
+    def work(cursor):
         # Insert new invoice
-        cursor.execute(
-            """INSERT INTO tblinvoice (
-                customer_id, payment_type, total_amount, amount_tendered,
-                bank_account_name, bank_account_number, date_recorded, user_id
-            ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s)""", 
+        insert_cursor = conn.execute_prepared(
+            INVOICE_INSERT_SQL,
             (
                 invoice.customer_id,
                 invoice.payment_type.value,
@@ -99,60 +243,108 @@ def create_invoice(invoice: InvoiceCreate):
                 invoice.user_id
             )
         )
-        conn.commit()
-        invoice_id = cursor.lastrowid
-        
         return InvoiceResponse(
-            invoice_id=invoice_id,
+            invoice_id=insert_cursor.lastrowid,
             **invoice.model_dump()
         )
-        
-    except MySQLConnectorError as err:
-        if conn:
-            conn.rollback()
+
+    try:
+        return run_idempotent(conn, "POST /invoice/", idempotency_key, invoice, work)
+    except mysql.connector.IntegrityError as err:
+        raise _integrity_error(err)
+    except mysql.connector.Error as err:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail={"status": "error", "message": f"Database error: {err}"}
         )
-    finally:
-        if cursor:
-            cursor.close()
-        if conn:
-            conn.close()
 
-@router.put("/{invoice_id}", response_model=InvoiceResponse)
-def update_invoice(invoice_id: int, invoice: InvoiceCreate):
-    conn = get_connection()
-    cursor = conn.cursor(dictionary=True)
+def insert_checkout(conn, cursor, cart, oversell=False):
+    """Write a cart's invoice, lines, stock and summary rows.
+
+    Runs inside the caller's transaction; returns (invoice_id, sales_ids,
+    oversold), where oversold lists the products taken below zero stock.
+    Raises UnknownProduct for a product_id that does not exist and, unless
+    oversell is set (see apply_stock_deltas), InsufficientStock when a
+    line would oversell.
+    """
+    # Stock first, in product_id order (see apply_stock_deltas); the FK
+    # checks on the sales insert then hit rows this transaction already
+    # holds instead of upgrading shared locks.
+    oversold = apply_stock_deltas(cursor, stock_deltas(cart.lines, -1), oversell)
+    insert_cursor = conn.execute_prepared(
+        INVOICE_INSERT_SQL,
+        (
+            cart.customer_id,
+            cart.payment_type.value,
+            cart.total_amount,
+            cart.amount_tendered,
+            cart.bank_account_name,
+            cart.bank_account_number,
+            cart.date_recorded,
+            cart.user_id
+        )
+    )
+    invoice_id = insert_cursor.lastrowid
+    sales_ids = bulk_insert(cursor, SALE_INSERT_SQL, [
+        (invoice_id, line.product_id, line.quantity, line.unit_price, line.sub_total)
+        for line in cart.lines
+    ])
+    adjust_sales_daily(cursor, "s.invoice_id = %s", (invoice_id,), 1)
+    return invoice_id, sales_ids, oversold
+
+@router.post("/checkout", response_model=CheckoutResponse, status_code=status.HTTP_201_CREATED)
+def checkout(cart: CheckoutCreate, idempotency_key: IdempotencyKey = None, conn=Depends(get_db)):
+    if not cart.lines or len(cart.lines) > MAX_BULK_ROWS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail={"status": "error", "message": f"A cart needs between 1 and {MAX_BULK_ROWS} lines"}
+        )
+
+    def work(cursor):
+        invoice_id, sales_ids, _ = insert_checkout(conn, cursor, cart)
+
+        # Built inside the transaction so a retried request replays it
+        invoice = cart.model_dump(exclude={"lines"})
+        return CheckoutResponse(
+            invoice_id=invoice_id,
+            created_by=cache.usernames.get(conn).get(cart.user_id),
+            lines=[
+                SaleResponse(sales_id=sales_id, invoice_id=invoice_id, **line.model_dump())
+                for sales_id, line in zip(sales_ids, cart.lines)
+            ],
+            **invoice
+        )
+
     try:
-        # Check if invoice exists
-        cursor.execute("SELECT * FROM tblinvoice WHERE invoice_id = %s", (invoice_id,))
-        existing_invoice = cursor.fetchone()
-        if not existing_invoice:
-            raise HTTPException(status_code=404, detail="Invoice not found")
-        
-        # Validate foreign keys
-        cursor.execute("SELECT customer_id FROM tblcustomer WHERE customer_id = %s", (invoice.customer_id,))
-        if not cursor.fetchone():
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail={"status": "error", "message": "Invalid customer ID"}
-            )
-            
-        cursor.execute("SELECT user_id FROM tbluser WHERE user_id = %s", (invoice.user_id,))
-        if not cursor.fetchone():
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail={"status": "error", "message": "Invalid user ID"}
-            )
-        
-        # Update invoice
-        cursor.execute(
-            """UPDATE tblinvoice SET 
-                customer_id = %s, payment_type = %s, total_amount = %s, 
-                amount_tendered = %s, bank_account_name = %s, 
-                bank_account_number = %s, date_recorded = %s, user_id = %s 
-            WHERE invoice_id = %s""",
+        result = run_idempotent(conn, "POST /invoice/checkout", idempotency_key, cart, work)
+        etag.bump("tblproduct")
+        return result
+
+    except InsufficientStock as err:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail={"status": "error", "message": str(err)}
+        )
+    except UnknownProduct as err:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail={"status": "error", "message": str(err)}
+        )
+    except mysql.connector.IntegrityError as err:
+        raise _integrity_error(err)
+    except mysql.connector.Error as err:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail={"status": "error", "message": f"Database error: {err}"}
+        )
+
+@router.put("/{invoice_id}", response_model=InvoiceResponse)
+def update_invoice(invoice_id: int, invoice: InvoiceCreate, conn=Depends(get_db)):
+    def work(cursor):
+        # The invoice's lines may move to another day or cashier bucket
+        adjust_sales_daily(cursor, "s.invoice_id = %s", (invoice_id,), -1)
+        update_cursor = conn.execute_prepared(
+            INVOICE_UPDATE_SQL,
             (
                 invoice.customer_id,
                 invoice.payment_type.value,
@@ -165,22 +357,26 @@ def update_invoice(invoice_id: int, invoice: InvoiceCreate):
                 invoice_id
             )
         )
-        conn.commit()
-        
+        # rowcount is the matched row count (FOUND_ROWS), so 0 means no such invoice
+        if update_cursor.rowcount == 0:
+            raise HTTPException(status_code=404, detail="Invoice not found")
+        adjust_sales_daily(cursor, "s.invoice_id = %s", (invoice_id,), 1)
+
+    try:
+        run_transaction(conn, work)
+
         return InvoiceResponse(
             invoice_id=invoice_id,
             **invoice.model_dump()
         )
         
+    except mysql.connector.IntegrityError as err:
+        raise _integrity_error(err)
     except mysql.connector.Error as err:
         raise HTTPException(status_code=500, detail=f"Database error: {err}")
-    finally:
-        cursor.close()
-        conn.close()
 
 @router.delete("/{invoice_id}", status_code=status.HTTP_200_OK)
-def delete_invoice(invoice_id: int):
-    conn = get_connection()
+def delete_invoice(invoice_id: int, conn=Depends(get_db)):
     cursor = conn.cursor(dictionary=True)
     try:
         # Check if invoice exists
@@ -196,5 +392,4 @@ def delete_invoice(invoice_id: int):
     except mysql.connector.Error as err:
         raise HTTPException(status_code=500, detail=f"Database error: {err}")
     finally:
-        cursor.close()
-        conn.close()
\ No newline at end of file
+        cursor.close()
\ No newline at end of file
@@ -1,206 +1,289 @@
-from fastapi import APIRouter, HTTPException, status
-from app.db import get_connection
-from app.models.tblproduct import ProductCreate, ProductResponse
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
+from app import cache, etag, outbox, product_index
+from app.changelog import DELETE, record_change
+from app.db import ER_DUP_ENTRY, foreign_key_column, get_async_db, get_db
+from app.filters import Filters
+from app.pagination import DEFAULT_LIMIT, Keyset, PageLimit, SortParam, Sorts
+from app.fields import FieldsParam, Projection
+from app.serialization import json_item, json_response
+from app.models.tblproduct import LowStockCountResponse, ProductCreate, ProductLookupResponse, ProductResponse
 from app.models.tblproductcategory import ProductCategoryResponse
 from app.models.tblproductunit import ProductUnitResponse
-from typing import List
+from typing import List, Optional
+import aiomysql
 import mysql.connector
 
 router = APIRouter(prefix="/product", tags=["Product"])
+# Registered ahead of `router` when DB_DRIVER=async
+async_router = APIRouter(prefix="/product", tags=["Product"])
 
-@router.get("/", response_model=List[ProductResponse])
-def get_products():
-    conn = get_connection()
+# unit, category and created_by come from the in-process reference caches
+# instead of joining tblproductunit, tblproductcategory and tbluser
+PRODUCT_PROJECTION = Projection(
+    ProductResponse, "tblproduct p", alias="p",
+    derived={"unit": ("unit_id",), "category": ("category_id",), "created_by": ("user_id",)},
+)
+NAME_FIELDS = {
+    "unit": ("unit_id", cache.unit_names),
+    "category": ("category_id", cache.category_names),
+    "created_by": ("user_id", cache.usernames),
+}
+PRODUCT_LIST_SQL = PRODUCT_PROJECTION.select()
+PRODUCT_KEYSET = Keyset("p.product_id")
+# unit_price is a single-precision FLOAT: a cursor value comes back as a
+# double that never equals the stored value, so it cannot be a keyset column
+PRODUCT_SORTS = Sorts(
+    "product_id",
+    product_id=PRODUCT_KEYSET,
+    product_name=Keyset("p.product_name", "p.product_id"),
+)
+# low_stock is a stored generated column (unit_in_stock <= reorder_level)
+# with its own index, so both reads only touch flagged products
+LOW_STOCK_CONDITION = "p.low_stock = 1"
+LOW_STOCK_COUNT_SQL = "SELECT COUNT(*) AS count FROM tblproduct p WHERE " + LOW_STOCK_CONDITION
+
+# Responses also carry unit, category and username names
+PRODUCT_ETAG = Depends(etag.conditional("tblproduct", "tblproductunit", "tblproductcategory", "tbluser"))
+LOOKUP_ETAG = Depends(etag.conditional("tblproduct", "tblproductunit", "tblproductcategory"))
+
+# Hot lookups go through the per-connection prepared statement cache
+PRODUCT_BY_ID_WHERE = "WHERE p.product_id = %s"
+PRODUCT_BY_ID_SQL = PRODUCT_LIST_SQL + PRODUCT_BY_ID_WHERE
+PRODUCT_EXISTS_SQL = "SELECT product_id FROM tblproduct WHERE product_id = %s"
+PRODUCT_INSERT_SQL = """
+    INSERT INTO tblproduct (produce_code, product_name, unit_id, 
+                            category_id, unit_in_stock, unit_price, 
+                            discount_percentage, reorder_level, user_id) 
+    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+"""
+PRODUCT_UPDATE_SQL = """
+    UPDATE tblproduct 
+    SET produce_code = %s, product_name = %s, unit_id = %s, 
+        category_id = %s, unit_in_stock = %s, unit_price = %s, 
+        discount_percentage = %s, reorder_level = %s, user_id = %s 
+    WHERE product_id = %s
+"""
+
+def _attach_names(products, names):
+    for field, lookup in names.items():
+        column = NAME_FIELDS[field][0]
+        for product in products:
+            product[field] = lookup.get(product[column])
+    return products
+
+def _reference_names(conn, requested=None):
+    # Only the caches behind requested name fields are consulted
+    return {
+        field: names.get(conn)
+        for field, (_, names) in NAME_FIELDS.items()
+        if PRODUCT_PROJECTION.wants(requested, field)
+    }
+
+async def _reference_names_async(conn, requested=None):
+    return {
+        field: await names.get_async(conn)
+        for field, (_, names) in NAME_FIELDS.items()
+        if PRODUCT_PROJECTION.wants(requested, field)
+    }
+
+def product_filters(category_id: Optional[int] = None):
+    return Filters().equal("p.category_id", category_id)
+
+@router.get("/", response_model=List[ProductResponse], dependencies=[PRODUCT_ETAG])
+def get_products(response: Response, limit: PageLimit = DEFAULT_LIMIT, after: Optional[str] = None,
+                 fields: FieldsParam = None, sort: SortParam = None,
+                 filters: Filters = Depends(product_filters), conn=Depends(get_db)):
+    requested = PRODUCT_PROJECTION.parse(fields)
+    keyset = PRODUCT_SORTS.keyset(sort)
     cursor = conn.cursor(dictionary=True)
     try:
-        cursor.execute("""
-            SELECT p.product_id, p.produce_code, p.product_name, 
-                   p.unit_id, p.category_id, p.user_id, 
-                   pu.unit_name AS unit, pc.category_name AS category, 
-                   p.unit_in_stock, p.unit_price, 
-                   p.discount_percentage, p.reorder_level, 
-                   u.username AS created_by
-            FROM tblproduct p
-            JOIN tblproductunit pu ON p.unit_id = pu.unit_id
-            JOIN tblproductcategory pc ON p.category_id = pc.category_id
-            JOIN tbluser u ON p.user_id = u.user_id
-        """)
-        products = cursor.fetchall()
-        return [ProductResponse(**product) for product in products]
+        base_sql = PRODUCT_PROJECTION.select(requested, keyset.keys)
+        cursor.execute(*keyset.query(base_sql, after, limit, filters.conditions, filters.params))
+        products = keyset.page(cursor.fetchall(), limit, response)
+        _attach_names(products, _reference_names(conn, requested))
+        return json_response(products, ProductResponse, response, requested)
     except mysql.connector.Error as err:
         raise HTTPException(status_code=500, detail=f"Database error: {err}")
     finally:
         cursor.close()
-        conn.close()
 
-@router.post("/", response_model=ProductResponse, status_code=status.HTTP_201_CREATED)
-def create_product(product: ProductCreate):
-    conn = get_connection()
+@async_router.get("/", response_model=List[ProductResponse], dependencies=[PRODUCT_ETAG])
+async def get_products_async(response: Response, limit: PageLimit = DEFAULT_LIMIT,
+                             after: Optional[str] = None, fields: FieldsParam = None,
+                             sort: SortParam = None, filters: Filters = Depends(product_filters),
+                             conn=Depends(get_async_db)):
+    requested = PRODUCT_PROJECTION.parse(fields)
+    keyset = PRODUCT_SORTS.keyset(sort)
+    async with conn.cursor(aiomysql.DictCursor) as cursor:
+        try:
+            base_sql = PRODUCT_PROJECTION.select(requested, keyset.keys)
+            await cursor.execute(*keyset.query(base_sql, after, limit, filters.conditions, filters.params))
+            products = keyset.page(await cursor.fetchall(), limit, response)
+            _attach_names(products, await _reference_names_async(conn, requested))
+            return json_response(products, ProductResponse, response, requested)
+        except aiomysql.Error as err:
+            raise HTTPException(status_code=500, detail=f"Database error: {err}")
+
+@router.get("/low-stock", response_model=List[ProductResponse], dependencies=[PRODUCT_ETAG])
+def get_low_stock_products(response: Response, limit: PageLimit = DEFAULT_LIMIT, after: Optional[str] = None,
+                           fields: FieldsParam = None, sort: SortParam = None,
+                           filters: Filters = Depends(product_filters), conn=Depends(get_db)):
+    requested = PRODUCT_PROJECTION.parse(fields)
+    keyset = PRODUCT_SORTS.keyset(sort)
     cursor = conn.cursor(dictionary=True)
     try:
-        # 1. Check if produce_code is unique
-        cursor.execute(
-            "SELECT product_id FROM tblproduct WHERE produce_code = %s", 
-            (product.produce_code,)
+        base_sql = PRODUCT_PROJECTION.select(requested, keyset.keys)
+        cursor.execute(*keyset.query(base_sql, after, limit, [LOW_STOCK_CONDITION, *filters.conditions],
+                                     filters.params))
+        products = keyset.page(cursor.fetchall(), limit, response)
+        _attach_names(products, _reference_names(conn, requested))
+        return json_response(products, ProductResponse, response, requested)
+    except mysql.connector.Error as err:
+        raise HTTPException(status_code=500, detail=f"Database error: {err}")
+    finally:
+        cursor.close()
+
+@router.get("/low-stock/count", response_model=LowStockCountResponse,
+            dependencies=[Depends(etag.conditional("tblproduct"))])
+def get_low_stock_count(conn=Depends(get_db)):
+    try:
+        return LowStockCountResponse(**conn.fetchone_prepared(LOW_STOCK_COUNT_SQL))
+    except mysql.connector.Error as err:
+        raise HTTPException(status_code=500, detail=f"Database error: {err}")
+
+def _lookup_response(product, conn):
+    return ProductLookupResponse(
+        unit=cache.unit_names.get(conn).get(product["unit_id"]),
+        category=cache.category_names.get(conn).get(product["category_id"]),
+        **product
+    )
+
+# Served from the in-process product index; see app/product_index.py
+@router.get("/by-code/{produce_code}", response_model=ProductLookupResponse, dependencies=[LOOKUP_ETAG])
+def get_product_by_code(produce_code: str, conn=Depends(get_db)):
+    try:
+        product = product_index.products.by_code(conn, produce_code)
+        if product is None:
+            raise HTTPException(status_code=404, detail="Product not found")
+        return _lookup_response(product, conn)
+    except mysql.connector.Error as err:
+        raise HTTPException(status_code=500, detail=f"Database error: {err}")
+
+@router.get("/search", response_model=List[ProductLookupResponse], dependencies=[LOOKUP_ETAG])
+def search_products(q: str = Query(min_length=1, max_length=50), limit: int = Query(20, ge=1, le=100),
+                    conn=Depends(get_db)):
+    try:
+        return [_lookup_response(product, conn) for product in product_index.products.search(conn, q, limit)]
+    except mysql.connector.Error as err:
+        raise HTTPException(status_code=500, detail=f"Database error: {err}")
+
+def _integrity_error(err, product):
+    # Referential checks are left to the FOREIGN KEY / UNIQUE constraints so
+    # a write costs one round trip; map the violation back to the old messages.
+    if err.errno == ER_DUP_ENTRY:
+        return HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Product with this produce code already exists"
         )
-        if cursor.fetchone():
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Product with this produce code already exists"
-            )
-        
-        # 2. Validate unit_id
-        cursor.execute("SELECT unit_id FROM tblproductunit WHERE unit_id = %s", (product.unit_id,))
-        if not cursor.fetchone():
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail=f"Unit ID {product.unit_id} does not exist"
-            )
-        
-        # 3. Validate category_id
-        cursor.execute("SELECT category_id FROM tblproductcategory WHERE category_id = %s", (product.category_id,))
-        if not cursor.fetchone():
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail=f"Category ID {product.category_id} does not exist"
-            )
-        
-        # 4. Validate user_id
-        cursor.execute("SELECT user_id FROM tbluser WHERE user_id = %s", (product.user_id,))
-        if not cursor.fetchone():
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail=f"User ID {product.user_id} does not exist"
-            )
-
-        # 5. Insert new product
-        cursor.execute(
-            """
-            INSERT INTO tblproduct (produce_code, product_name, unit_id, 
-                                    category_id, unit_in_stock, unit_price, 
-                                    discount_percentage, reorder_level, user_id) 
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
-            """, 
+    column = foreign_key_column(err)
+    if column == "unit_id":
+        detail = f"Unit ID {product.unit_id} does not exist"
+    elif column == "category_id":
+        detail = f"Category ID {product.category_id} does not exist"
+    elif column == "user_id":
+        detail = f"User ID {product.user_id} does not exist"
+    else:
+        return HTTPException(status_code=500, detail=f"Database error: {err}")
+    return HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=detail)
+
+@router.post("/", response_model=ProductResponse, status_code=status.HTTP_201_CREATED)
+def create_product(product: ProductCreate, conn=Depends(get_db)):
+    try:
+        insert_cursor = conn.execute_prepared(
+            PRODUCT_INSERT_SQL,
             (product.produce_code, product.product_name, product.unit_id,
              product.category_id, product.unit_in_stock, product.unit_price,
              product.discount_percentage, product.reorder_level, product.user_id)
         )
+        record_change(conn, "tblproduct", insert_cursor.lastrowid)
+        outbox.record_product(conn, insert_cursor.lastrowid)
         conn.commit()
+        etag.bump("tblproduct")
+        product_index.products.upsert({"product_id": insert_cursor.lastrowid, **product.model_dump()})
         
-        # 6. Fetch and return the newly created product
-        new_product_id = cursor.lastrowid
-        cursor.execute("SELECT * FROM tblproduct WHERE product_id = %s", (new_product_id,))
-        new_product = cursor.fetchone()
-        
-        return ProductResponse(**new_product)
+        return ProductResponse(product_id=insert_cursor.lastrowid, **product.model_dump())
 
+    except mysql.connector.IntegrityError as err:
+        conn.rollback()
+        raise _integrity_error(err, product)
     except mysql.connector.Error as err:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Database error: {err}"
         )
-    finally:
-        cursor.close()
-        conn.close()
 
 
-@router.get("/{product_id}", response_model=ProductResponse)
-def get_product(product_id: int):
-    conn = get_connection()
-    cursor = conn.cursor(dictionary=True)
+@router.get("/{product_id}", response_model=ProductResponse, dependencies=[PRODUCT_ETAG])
+def get_product(product_id: int, response: Response, fields: FieldsParam = None, conn=Depends(get_db)):
+    requested = PRODUCT_PROJECTION.parse(fields)
     try:
-        cursor.execute("SELECT * FROM tblproduct WHERE product_id = %s", (product_id,))
-        product = cursor.fetchone()
+        sql = PRODUCT_PROJECTION.select(requested) + PRODUCT_BY_ID_WHERE
+        product = conn.fetchone_prepared(sql, (product_id,))
         if not product:
             raise HTTPException(status_code=404, detail="Product not found")
-        return ProductResponse(**product)
+        _attach_names([product], _reference_names(conn, requested))
+        return json_item(product, ProductResponse, response, requested)
     except mysql.connector.Error as err:
         raise HTTPException(status_code=500, detail=f"Database error: {err}")
-    finally:
-        cursor.close()
 
 
 @router.put("/{product_id}", response_model=ProductResponse)
-def update_product(product_id: int, product: ProductCreate):
-    conn = get_connection()
-    cursor = conn.cursor(dictionary=True)
+def update_product(product_id: int, product: ProductCreate, conn=Depends(get_db)):
     try:
-        # Check if product exists
-        cursor.execute("SELECT product_id FROM tblproduct WHERE product_id = %s", (product_id,))
-        existing_product = cursor.fetchone()
-        
-        if not existing_product:
-            raise HTTPException(status_code=404, detail="Product not found")
-        
-        # Validate unit_id
-        cursor.execute("SELECT unit_id FROM tblproductunit WHERE unit_id = %s", (product.unit_id,))
-        if not cursor.fetchone():
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail=f"Unit ID {product.unit_id} does not exist"
-            )
-        
-        # Validate category_id
-        cursor.execute("SELECT category_id FROM tblproductcategory WHERE category_id = %s", (product.category_id,))
-        if not cursor.fetchone():
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail=f"Category ID {product.category_id} does not exist"
-            )
-        
-        # Validate user_id
-        cursor.execute("SELECT user_id FROM tbluser WHERE user_id = %s", (product.user_id,))
-        if not cursor.fetchone():
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail=f"User ID {product.user_id} does not exist"
-            )
-
-        # Update product details
-        cursor.execute(
-            """
-            UPDATE tblproduct 
-            SET produce_code = %s, product_name = %s, unit_id = %s, 
-                category_id = %s, unit_in_stock = %s, unit_price = %s, 
-                discount_percentage = %s, reorder_level = %s, user_id = %s 
-            WHERE product_id = %s
-            """, 
+        update_cursor = conn.execute_prepared(
+            PRODUCT_UPDATE_SQL,
             (product.produce_code, product.product_name, product.unit_id,
              product.category_id, product.unit_in_stock, product.unit_price,
              product.discount_percentage, product.reorder_level, product.user_id, product_id)
         )
+        # rowcount is the matched row count (FOUND_ROWS), so 0 means no such product
+        if update_cursor.rowcount == 0:
+            raise HTTPException(status_code=404, detail="Product not found")
+        record_change(conn, "tblproduct", product_id)
+        outbox.record_product(conn, product_id)
         conn.commit()
+        etag.bump("tblproduct")
+        product_index.products.upsert({"product_id": product_id, **product.model_dump()})
         
-        # Fetch and return the updated product
-        cursor.execute("SELECT * FROM tblproduct WHERE product_id = %s", (product_id,))
-        updated_product = cursor.fetchone()
-        
-        return ProductResponse(**updated_product)
+        return ProductResponse(product_id=product_id, **product.model_dump())
 
+    except mysql.connector.IntegrityError as err:
+        conn.rollback()
+        raise _integrity_error(err, product)
     except mysql.connector.Error as err:
         raise HTTPException(status_code=500, detail=f"Database error: {err}")
-    finally:
-        cursor.close()
-        conn.close()
 
 
 @router.delete("/{product_id}", status_code=status.HTTP_200_OK)
-def delete_product(product_id: int):
-    conn = get_connection()
+def delete_product(product_id: int, conn=Depends(get_db)):
     cursor = conn.cursor(dictionary=True)
     try:
         # Check if product exists
-        cursor.execute("SELECT product_id FROM tblproduct WHERE product_id = %s", (product_id,))
-        existing_product = cursor.fetchone()
+        existing_product = conn.fetchone_prepared(PRODUCT_EXISTS_SQL, (product_id,))
         
         if not existing_product:
             raise HTTPException(status_code=404, detail="Product not found")
         
         # Delete product
         cursor.execute("DELETE FROM tblproduct WHERE product_id = %s", (product_id,))
+        record_change(conn, "tblproduct", product_id, DELETE)
+        outbox.record_product_deleted(conn, product_id)
         conn.commit()
+        etag.bump("tblproduct")
+        product_index.products.remove(product_id)
         
         return {"detail": "Product deleted successfully"}
     except mysql.connector.Error as err:
         raise HTTPException(status_code=500, detail=f"Database error: {err}")
-
+    finally:
+        cursor.close()
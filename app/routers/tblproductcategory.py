@@ -1,44 +1,38 @@
-from fastapi import APIRouter, HTTPException, status
-from app.db import get_connection
+from fastapi import APIRouter, Depends, HTTPException, status
+from app import cache, etag
+from app.changelog import DELETE, record_change
+from app.db import get_db
 from app.models.tblproductcategory import ProductCategoryCreate, ProductCategoryResponse
 from typing import List
 import mysql.connector
 
 router = APIRouter(prefix="/product-category", tags=["Product Category"])
 
-@router.get("/", response_model=List[ProductCategoryResponse])
-def get_product_categories():
-    conn = get_connection()
-    cursor = conn.cursor(dictionary=True)
+CATEGORY_ETAG = Depends(etag.conditional("tblproductcategory"))
+
+@router.get("/", response_model=List[ProductCategoryResponse], dependencies=[CATEGORY_ETAG])
+def get_product_categories(conn=Depends(get_db)):
     try:
-        cursor.execute("SELECT category_id, category_name FROM tblproductcategory")
-        categories = cursor.fetchall()
-        return [ProductCategoryResponse(**category) for category in categories]
+        categories = cache.category_names.get(conn)
+        return [
+            ProductCategoryResponse(category_id=category_id, category_name=category_name)
+            for category_id, category_name in categories.items()
+        ]
     except mysql.connector.Error as err:
         raise HTTPException(status_code=500, detail=f"Database error: {err}")
-    finally:
-        cursor.close()
-        conn.close()
 
-@router.get("/{category_id}", response_model=ProductCategoryResponse)
-def get_product_category(category_id: int):
-    conn = get_connection()
-    cursor = conn.cursor(dictionary=True)
+@router.get("/{category_id}", response_model=ProductCategoryResponse, dependencies=[CATEGORY_ETAG])
+def get_product_category(category_id: int, conn=Depends(get_db)):
     try:
-        cursor.execute("SELECT category_id, category_name FROM tblproductcategory WHERE category_id = %s", (category_id,))
-        category = cursor.fetchone()
-        if not category:
+        categories = cache.category_names.get(conn)
+        if category_id not in categories:
             raise HTTPException(status_code=404, detail="Product category not found")
-        return ProductCategoryResponse(**category)
+        return ProductCategoryResponse(category_id=category_id, category_name=categories[category_id])
     except mysql.connector.Error as err:
         raise HTTPException(status_code=500, detail=f"Database error: {err}")
-    finally:
-        cursor.close()
-        conn.close()
 
 @router.post("/", response_model=ProductCategoryResponse, status_code=status.HTTP_201_CREATED)
-def create_product_category(category: ProductCategoryCreate):
-    conn = get_connection()
+def create_product_category(category: ProductCategoryCreate, conn=Depends(get_db)):
     cursor = conn.cursor(dictionary=True)
     try:
         # First check if category with same name already exists
@@ -59,7 +53,10 @@ def create_product_category(category: ProductCategoryCreate):
             "INSERT INTO tblproductcategory (category_name) VALUES (%s)", 
             (category.category_name,)
         )
+        record_change(conn, "tblproductcategory", cursor.lastrowid)
         conn.commit()
+        cache.category_names.invalidate()
+        etag.bump("tblproductcategory")
         category_id = cursor.lastrowid
         
         return ProductCategoryResponse(
@@ -75,12 +72,10 @@ def create_product_category(category: ProductCategoryCreate):
         )
     finally:
         cursor.close()
-        conn.close()
 
 
 @router.put("/{category_id}", response_model=ProductCategoryResponse)
-def update_product_category(category_id: int, category: ProductCategoryCreate):
-    conn = get_connection()
+def update_product_category(category_id: int, category: ProductCategoryCreate, conn=Depends(get_db)):
     cursor = conn.cursor(dictionary=True)
     try:
         # Check if category exists
@@ -98,7 +93,10 @@ def update_product_category(category_id: int, category: ProductCategoryCreate):
             "UPDATE tblproductcategory SET category_name = %s WHERE category_id = %s", 
             (category.category_name, category_id)
         )
+        record_change(conn, "tblproductcategory", category_id)
         conn.commit()
+        cache.category_names.invalidate()
+        etag.bump("tblproductcategory")
         
         return ProductCategoryResponse(
             category_id=category_id, 
@@ -113,11 +111,9 @@ def update_product_category(category_id: int, category: ProductCategoryCreate):
         )
     finally:
         cursor.close()
-        conn.close()
 
 @router.delete("/{category_id}", status_code=status.HTTP_200_OK)
-def delete_product_category(category_id: int):
-    conn = get_connection()
+def delete_product_category(category_id: int, conn=Depends(get_db)):
     cursor = conn.cursor()
     try:
         # Check if category exists
@@ -138,7 +134,10 @@ def delete_product_category(category_id: int):
             "DELETE FROM tblproductcategory WHERE category_id = %s", 
             (category_id,)
         )
+        record_change(conn, "tblproductcategory", category_id, DELETE)
         conn.commit()
+        cache.category_names.invalidate()
+        etag.bump("tblproductcategory")
         
         return {"message": "Product category deleted successfully"}
     
@@ -151,4 +150,3 @@ def delete_product_category(category_id: int):
     
     finally:
         cursor.close()
-        conn.close()
@@ -1,43 +1,35 @@
-from fastapi import APIRouter, HTTPException, status
-from app.db import get_connection
+from fastapi import APIRouter, Depends, HTTPException, status
+from app import cache, etag
+from app.changelog import DELETE, record_change
+from app.db import get_db
 from app.models.tblproductunit import ProductUnitCreate, ProductUnitResponse
 from typing import List
 import mysql.connector
 
 router= APIRouter(prefix="/product-unit", tags=["Product Unit"])
-@router.get("/", response_model=List[ProductUnitResponse])
-def get_product_units():
-    conn = get_connection()
-    cursor = conn.cursor(dictionary=True)
+
+UNIT_ETAG = Depends(etag.conditional("tblproductunit"))
+
+@router.get("/", response_model=List[ProductUnitResponse], dependencies=[UNIT_ETAG])
+def get_product_units(conn=Depends(get_db)):
     try:
-        cursor.execute("SELECT unit_id, unit_name FROM tblproductunit")
-        units = cursor.fetchall()
-        return [ProductUnitResponse(**unit) for unit in units]
+        units = cache.unit_names.get(conn)
+        return [ProductUnitResponse(unit_id=unit_id, unit_name=unit_name) for unit_id, unit_name in units.items()]
     except mysql.connector.Error as err:
         raise HTTPException(status_code=500, detail=f"Database error: {err}")
-    finally:
-        cursor.close()
-        conn.close()
 
-@router.get("/{unit_id}", response_model=ProductUnitResponse)
-def get_product_unit(unit_id: int):
-    conn = get_connection()
-    cursor = conn.cursor(dictionary=True)
+@router.get("/{unit_id}", response_model=ProductUnitResponse, dependencies=[UNIT_ETAG])
+def get_product_unit(unit_id: int, conn=Depends(get_db)):
     try:
-        cursor.execute("SELECT unit_id, unit_name FROM tblproductunit WHERE unit_id = %s", (unit_id,))
-        unit = cursor.fetchone()
-        if not unit:
+        units = cache.unit_names.get(conn)
+        if unit_id not in units:
             raise HTTPException(status_code=404, detail="Product unit not found")
-        return ProductUnitResponse(**unit)
+        return ProductUnitResponse(unit_id=unit_id, unit_name=units[unit_id])
     except mysql.connector.Error as err:
         raise HTTPException(status_code=500, detail=f"Database error: {err}")
-    finally:
-        cursor.close()
-        conn.close()
 
 @router.post("/", response_model=ProductUnitResponse, status_code=status.HTTP_201_CREATED)
-def create_product_unit(unit: ProductUnitCreate):
-    conn = get_connection()
+def create_product_unit(unit: ProductUnitCreate, conn=Depends(get_db)):
     cursor = conn.cursor(dictionary=True)
     try:
         # First check if unit with same name already exists
@@ -58,7 +50,10 @@ def create_product_unit(unit: ProductUnitCreate):
             "INSERT INTO tblproductunit (unit_name) VALUES (%s)", 
             (unit.unit_name,)
         )
+        record_change(conn, "tblproductunit", cursor.lastrowid)
         conn.commit()
+        cache.unit_names.invalidate()
+        etag.bump("tblproductunit")
         
         # Get the ID of the newly created unit
         unit_id = cursor.lastrowid
@@ -67,11 +62,9 @@ def create_product_unit(unit: ProductUnitCreate):
         raise HTTPException(status_code=500, detail=f"Database error: {err}")
     finally:
         cursor.close()
-        conn.close()
 
 @router.put("/{unit_id}", response_model=ProductUnitResponse)
-def update_product_unit(unit_id: int, unit: ProductUnitCreate):
-    conn = get_connection()
+def update_product_unit(unit_id: int, unit: ProductUnitCreate, conn=Depends(get_db)):
     cursor = conn.cursor(dictionary=True)
     try:
         # Check if the unit exists
@@ -86,18 +79,19 @@ def update_product_unit(unit_id: int, unit: ProductUnitCreate):
             "UPDATE tblproductunit SET unit_name = %s WHERE unit_id = %s", 
             (unit.unit_name, unit_id)
         )
+        record_change(conn, "tblproductunit", unit_id)
         conn.commit()
+        cache.unit_names.invalidate()
+        etag.bump("tblproductunit")
         
         return ProductUnitResponse(unit_id=unit_id, **unit.dict())
     except mysql.connector.Error as err:
         raise HTTPException(status_code=500, detail=f"Database error: {err}")
     finally:
         cursor.close()
-        conn.close()
 
 @router.delete("/{unit_id}", status_code=status.HTTP_200_OK)
-def delete_product_unit(unit_id: int):
-    conn = get_connection()
+def delete_product_unit(unit_id: int, conn=Depends(get_db)):
     cursor = conn.cursor(dictionary=True)
     try:
         # Check if the unit exists
@@ -112,7 +106,10 @@ def delete_product_unit(unit_id: int):
         
         # Delete the unit
         cursor.execute("DELETE FROM tblproductunit WHERE unit_id = %s", (unit_id,))
+        record_change(conn, "tblproductunit", unit_id, DELETE)
         conn.commit()
+        cache.unit_names.invalidate()
+        etag.bump("tblproductunit")
         
         return {"detail": f"Product unit with ID {unit_id} deleted successfully"}
     
@@ -124,4 +121,3 @@ def delete_product_unit(unit_id: int):
     
     finally:
         cursor.close()
-        conn.close()
@@ -1,51 +1,89 @@
-from fastapi import APIRouter, HTTPException, status
-from app.db import get_connection
-from app.models.tblpurchaseorder import PurchaseOrderCreate, PurchaseOrderResponse, PurchaseOrderUpdate
+from fastapi import APIRouter, Depends, HTTPException, Response, status
+from app import etag
+from app.db import MAX_BULK_ROWS, bulk_insert, get_db, integrity_http_exception
+from app.idempotency import IdempotencyKey, run_idempotent
+from app.receiving import receive_lines
+from app.filters import DateFrom, DateTo, Filters
+from app.pagination import DEFAULT_LIMIT, Keyset, PageLimit, SortParam, Sorts
+from app.fields import FieldsParam, Projection
+from app.serialization import json_item, json_response
+from app.models.tblpurchaseorder import (
+    PurchaseOrderBulkResponse, PurchaseOrderCreate, PurchaseOrderDeliveryLine, PurchaseOrderReceiptLine,
+    PurchaseOrderReceiveResponse, PurchaseOrderResponse, PurchaseOrderUpdate,
+)
 from app.models.tblproduct import ProductResponse
 from app.models.tblsupplier import SupplierResponse
 from app.models.tbluser import UserResponse
-from typing import List
+from typing import List, Optional
 import mysql.connector
 
 router = APIRouter(prefix="/purchase-order", tags=["Purchase Order"])
 
+# Every PurchaseOrderResponse field lives on tblpurchaseorder, so no join is needed
+PURCHASE_ORDER_PROJECTION = Projection(PurchaseOrderResponse, "tblpurchaseorder po", alias="po")
+PURCHASE_ORDER_LIST_SQL = PURCHASE_ORDER_PROJECTION.select()
+PURCHASE_ORDER_DETAIL_WHERE = "WHERE po.purchase_order_id = %s"
+PURCHASE_ORDER_KEYSET = Keyset("po.purchase_order_id")
+PURCHASE_ORDER_SORTS = Sorts(
+    "purchase_order_id",
+    purchase_order_id=PURCHASE_ORDER_KEYSET,
+    order_date=Keyset("po.order_date", "po.purchase_order_id"),
+)
+PURCHASE_ORDER_INSERT_SQL = """
+    INSERT INTO tblpurchaseorder (supplier_id, product_id, 
+                                  quantity, unit_price, 
+                                  sub_total, order_date, 
+                                  user_id)
+    VALUES (%s, %s, %s, %s, %s, %s, %s)
+"""
+
+
+def _check_lines(lines):
+    if not lines or len(lines) > MAX_BULK_ROWS:
+        raise HTTPException(status_code=400, detail=f"Send between 1 and {MAX_BULK_ROWS} receipt lines")
+
+
+def _receive(conn, endpoint, idempotency_key, payload, lines):
+    try:
+        result = run_idempotent(conn, endpoint, idempotency_key, payload,
+                                lambda cursor: receive_lines(cursor, lines))
+        etag.bump("tblproduct")
+        return result
+    except mysql.connector.IntegrityError as err:
+        raise integrity_http_exception(err)
+    except mysql.connector.Error as err:
+        raise HTTPException(status_code=500, detail=f"Database error: {err}")
+
+
+def purchase_order_filters(date_from: DateFrom = None, date_to: DateTo = None,
+                           status: Optional[str] = None, supplier_id: Optional[int] = None):
+    return (Filters()
+            .date_range("po.order_date", date_from, date_to)
+            .equal("po.status", status)
+            .equal("po.supplier_id", supplier_id))
+
 @router.get("/", response_model=List[PurchaseOrderResponse])
-def get_purchase_orders():
-    conn = get_connection()
+def get_purchase_orders(response: Response, limit: PageLimit = DEFAULT_LIMIT, after: Optional[str] = None,
+                        fields: FieldsParam = None, sort: SortParam = None,
+                        filters: Filters = Depends(purchase_order_filters), conn=Depends(get_db)):
+    requested = PURCHASE_ORDER_PROJECTION.parse(fields)
+    keyset = PURCHASE_ORDER_SORTS.keyset(sort)
     cursor = conn.cursor(dictionary=True)
     try:
-        cursor.execute("""
-            SELECT po.purchase_order_id, po.supplier_id, po.product_id, 
-                   po.quantity, po.unit_price, po.sub_total, 
-                   po.order_date, po.user_id,
-                   s.supplier_name AS supplier_name,
-                   p.product_name AS product_name,
-                   u.username AS ordered_by
-            FROM tblpurchaseorder po
-            JOIN tblsupplier s ON po.supplier_id = s.supplier_id
-            JOIN tblproduct p ON po.product_id = p.product_id
-            JOIN tbluser u ON po.user_id = u.user_id
-        """)
-        purchase_orders = cursor.fetchall()
-        return [PurchaseOrderResponse(**po) for po in purchase_orders]
+        base_sql = PURCHASE_ORDER_PROJECTION.select(requested, keyset.keys)
+        cursor.execute(*keyset.query(base_sql, after, limit, filters.conditions, filters.params))
+        purchase_orders = keyset.page(cursor.fetchall(), limit, response)
+        return json_response(purchase_orders, PurchaseOrderResponse, response, requested)
     except mysql.connector.Error as err:
         raise HTTPException(status_code=500, detail=f"Database error: {err}")
     finally:
         cursor.close()
-        conn.close()
 
 @router.post("/", response_model=PurchaseOrderResponse, status_code=status.HTTP_201_CREATED)
-def create_purchase_order(purchase_order: PurchaseOrderCreate):
-    conn = get_connection()
+def create_purchase_order(purchase_order: PurchaseOrderCreate, conn=Depends(get_db)):
     cursor = conn.cursor(dictionary=True)
     try:
-        cursor.execute("""
-            INSERT INTO tblpurchaseorder (supplier_id, product_id, 
-                                          quantity, unit_price, 
-                                          sub_total, order_date, 
-                                          user_id)
-            VALUES (%s, %s, %s, %s, %s, %s, %s)
-        """, (
+        cursor.execute(PURCHASE_ORDER_INSERT_SQL, (
             purchase_order.supplier_id,
             purchase_order.product_id,
             purchase_order.quantity,
@@ -64,12 +102,52 @@ def create_purchase_order(purchase_order: PurchaseOrderCreate):
         raise HTTPException(status_code=500, detail=f"Database error: {err}")
     finally:
         cursor.close()
-        conn.close()
+
+
+@router.post("/bulk", response_model=PurchaseOrderBulkResponse, status_code=status.HTTP_201_CREATED)
+def create_purchase_orders_bulk(purchase_orders: List[PurchaseOrderCreate], conn=Depends(get_db)):
+    if not purchase_orders or len(purchase_orders) > MAX_BULK_ROWS:
+        raise HTTPException(status_code=400, detail=f"Send between 1 and {MAX_BULK_ROWS} purchase orders")
+    cursor = conn.cursor()
+    try:
+        purchase_order_ids = bulk_insert(cursor, PURCHASE_ORDER_INSERT_SQL, [
+            (po.supplier_id, po.product_id, po.quantity, po.unit_price,
+             po.sub_total, po.order_date, po.user_id)
+            for po in purchase_orders
+        ])
+        conn.commit()
+        return PurchaseOrderBulkResponse(purchase_order_ids=purchase_order_ids)
+    except mysql.connector.IntegrityError as err:
+        conn.rollback()
+        raise integrity_http_exception(err)
+    except mysql.connector.Error as err:
+        conn.rollback()
+        raise HTTPException(status_code=500, detail=f"Database error: {err}")
+    finally:
+        cursor.close()
+
+
+@router.post("/receive", response_model=PurchaseOrderReceiveResponse, status_code=status.HTTP_201_CREATED)
+def receive_delivery(lines: List[PurchaseOrderDeliveryLine], idempotency_key: IdempotencyKey = None,
+                     conn=Depends(get_db)):
+    """Receive a delivery spanning several purchase orders in one transaction."""
+    _check_lines(lines)
+    return _receive(conn, "POST /purchase-order/receive", idempotency_key, lines,
+                    [(line.purchase_order_id, line) for line in lines])
+
+
+@router.post("/{purchase_order_id}/receive", response_model=PurchaseOrderReceiveResponse,
+             status_code=status.HTTP_201_CREATED)
+def receive_purchase_order(purchase_order_id: int, lines: List[PurchaseOrderReceiptLine],
+                           idempotency_key: IdempotencyKey = None, conn=Depends(get_db)):
+    """Receive all or part of a purchase order, as one or more receipt lines."""
+    _check_lines(lines)
+    return _receive(conn, f"POST /purchase-order/{purchase_order_id}/receive", idempotency_key, lines,
+                    [(purchase_order_id, line) for line in lines])
 
 
 @router.put("/{purchase_order_id}", response_model=PurchaseOrderResponse)
-def update_purchase_order(purchase_order_id: int, purchase_order: PurchaseOrderUpdate):
-    conn = get_connection()
+def update_purchase_order(purchase_order_id: int, purchase_order: PurchaseOrderUpdate, conn=Depends(get_db)):
     cursor = conn.cursor(dictionary=True)
     try:
         # Check if purchase order exists
@@ -104,12 +182,10 @@ def update_purchase_order(purchase_order_id: int, purchase_order: PurchaseOrderU
         raise HTTPException(status_code=500, detail=f"Database error: {err}")
     finally:
         cursor.close()
-        conn.close()
 
 
 @router.delete("/{purchase_order_id}", status_code=status.HTTP_200_OK)
-def delete_purchase_order(purchase_order_id: int):
-    conn = get_connection()
+def delete_purchase_order(purchase_order_id: int, conn=Depends(get_db)):
     cursor = conn.cursor(dictionary=True)
     try:
         # Check if purchase order exists
@@ -126,34 +202,19 @@ def delete_purchase_order(purchase_order_id: int):
         raise HTTPException(status_code=500, detail=f"Database error: {err}")
     finally:
         cursor.close()
-        conn.close()
 
 @router.get("/{purchase_order_id}", response_model=PurchaseOrderResponse)
-def get_purchase_order(purchase_order_id: int):
-    conn = get_connection()
+def get_purchase_order(purchase_order_id: int, response: Response, fields: FieldsParam = None,
+                       conn=Depends(get_db)):
+    requested = PURCHASE_ORDER_PROJECTION.parse(fields)
     cursor = conn.cursor(dictionary=True)
     try:
-        cursor.execute("""
-            SELECT po.purchase_order_id, po.supplier_id, po.product_id, 
-                   po.quantity, po.unit_price, po.sub_total, 
-                   po.order_date, po.user_id,
-                   s.supplier_name AS supplier_name,
-                   p.product_name AS product_name,
-                   u.username AS ordered_by
-            FROM tblpurchaseorder po
-            JOIN tblsupplier s ON po.supplier_id = s.supplier_id
-            JOIN tblproduct p ON po.product_id = p.product_id
-            JOIN tbluser u ON po.user_id = u.user_id
-            WHERE po.purchase_order_id = %s
-        """, (purchase_order_id,))
+        cursor.execute(PURCHASE_ORDER_PROJECTION.select(requested) + PURCHASE_ORDER_DETAIL_WHERE, (purchase_order_id,))
         purchase_order = cursor.fetchone()
         if not purchase_order:
             raise HTTPException(status_code=404, detail="Purchase Order not found")
-        return PurchaseOrderResponse(**purchase_order)
+        return json_item(purchase_order, PurchaseOrderResponse, response, requested)
     except mysql.connector.Error as err:
         raise HTTPException(status_code=500, detail=f"Database error: {err}")
     finally:
         cursor.close()
-        conn.close()
-        cursor.close()
-        
\ No newline at end of file
@@ -1,150 +1,197 @@
-from fastapi import APIRouter, HTTPException, status
-from app.db import get_connection
-from app.models.tblreceiveproduct import ReceiveProductCreate, ReceiveProductResponse, ReceiveProductUpdate
+from fastapi import APIRouter, Depends, HTTPException, Response, status
+from app import etag
+from app.db import MAX_BULK_ROWS, get_db, integrity_http_exception
+from app.idempotency import IdempotencyKey, run_idempotent
+from app.receiving import check_line, lock_orders, receive_lines, sync_orders
+from app.stock import InsufficientStock, apply_stock_deltas, replace_deltas, run_transaction
+from app.filters import DateFrom, DateTo, Filters
+from app.pagination import DEFAULT_LIMIT, Keyset, PageLimit, SortParam, Sorts
+from app.fields import FieldsParam, Projection
+from app.serialization import json_item, json_response
+from app.models.tblreceiveproduct import ReceiveProductBulkResponse, ReceiveProductCreate, ReceiveProductResponse, ReceiveProductUpdate
 from app.models.tblsupplier import SupplierResponse
 from app.models.tblproduct import ProductResponse
 from app.models.tbluser import UserResponse
-from typing import List
+from typing import List, Optional
 import mysql.connector
 router = APIRouter(prefix="/receive-product", tags=["Receive Product"])
 
+# Every ReceiveProductResponse field lives on tblreceiveproduct, so no join is needed
+RECEIVE_PRODUCT_PROJECTION = Projection(ReceiveProductResponse, "tblreceiveproduct rp", alias="rp")
+RECEIVE_PRODUCT_LIST_SQL = RECEIVE_PRODUCT_PROJECTION.select()
+RECEIVE_PRODUCT_DETAIL_WHERE = "WHERE rp.receive_product_id = %s"
+RECEIVE_PRODUCT_KEYSET = Keyset("rp.receive_product_id")
+RECEIVE_PRODUCT_SORTS = Sorts(
+    "receive_product_id",
+    receive_product_id=RECEIVE_PRODUCT_KEYSET,
+    received_date=Keyset("rp.received_date", "rp.receive_product_id"),
+)
+RECEIPT_LINE_FOR_UPDATE_SQL = """
+    SELECT product_id, quantity, purchase_order_id, supplier_id FROM tblreceiveproduct
+    WHERE receive_product_id = %s FOR UPDATE
+"""
+
+def receive_product_filters(date_from: DateFrom = None, date_to: DateTo = None,
+                            purchase_order_id: Optional[int] = None, supplier_id: Optional[int] = None):
+    return (Filters()
+            .date_range("rp.received_date", date_from, date_to)
+            .equal("rp.purchase_order_id", purchase_order_id)
+            .equal("rp.supplier_id", supplier_id))
+
 @router.get("/", response_model=List[ReceiveProductResponse])
-def get_receive_products():
-    conn = get_connection()
+def get_receive_products(response: Response, limit: PageLimit = DEFAULT_LIMIT, after: Optional[str] = None,
+                         fields: FieldsParam = None, sort: SortParam = None,
+                         filters: Filters = Depends(receive_product_filters), conn=Depends(get_db)):
+    requested = RECEIVE_PRODUCT_PROJECTION.parse(fields)
+    keyset = RECEIVE_PRODUCT_SORTS.keyset(sort)
     cursor = conn.cursor(dictionary=True)
     try:
-        cursor.execute("""
-             SELECT rp.receive_product_id, rp.product_id, 
-           rp.quantity, rp.unit_price, rp.sub_total, 
-           rp.supplier_id, rp.received_date, 
-           rp.user_id, rp.purchase_order_id,
-           s.supplier_name AS supplier_name,
-           p.product_name AS product_name,
-           u.username AS received_by
-    FROM tblreceiveproduct rp
-    JOIN tblsupplier s ON rp.supplier_id = s.supplier_id
-    JOIN tblproduct p ON rp.product_id = p.product_id
-    JOIN tbluser u ON rp.user_id = u.user_id
-        """)
-
-  
-        receive_products = cursor.fetchall()
-        return [ReceiveProductResponse(**rp) for rp in receive_products]
+        base_sql = RECEIVE_PRODUCT_PROJECTION.select(requested, keyset.keys)
+        cursor.execute(*keyset.query(base_sql, after, limit, filters.conditions, filters.params))
+        receive_products = keyset.page(cursor.fetchall(), limit, response)
+        return json_response(receive_products, ReceiveProductResponse, response, requested)
     except mysql.connector.Error as err:
         raise HTTPException(status_code=500, detail=f"Database error: {err}")
     finally:
         cursor.close()
-        conn.close()
 
 @router.post("/", response_model=ReceiveProductResponse, status_code=status.HTTP_201_CREATED)
-def create_receive_product(receive_product: ReceiveProductCreate):
-    conn = get_connection()
-    cursor = conn.cursor(dictionary=True)
-    try:
-        cursor.execute("""
-            INSERT INTO tblreceiveproduct (product_id, quantity, 
-                                           unit_price, sub_total, 
-                                           supplier_id, received_date, 
-                                           user_id, purchase_order_id)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-        """, (
-            receive_product.product_id,
-            receive_product.quantity,
-            receive_product.unit_price,
-            receive_product.sub_total,
-            receive_product.supplier_id,
-            receive_product.received_date,
-            receive_product.user_id,
-            receive_product.purchase_order_id
-        ))
-        conn.commit()
-        receive_product_id = cursor.lastrowid
-        
+def create_receive_product(receive_product: ReceiveProductCreate, idempotency_key: IdempotencyKey = None,
+                           conn=Depends(get_db)):
+    def work(cursor):
+        # Books stock and the purchase order status like /purchase-order/{id}/receive
+        receipt = receive_lines(cursor, [(receive_product.purchase_order_id, receive_product)])
+
         # Fetch the newly created receive product
-        cursor.execute("SELECT * FROM tblreceiveproduct WHERE receive_product_id = %s", (receive_product_id,))
-        new_receive_product = cursor.fetchone()
-        return ReceiveProductResponse(**new_receive_product)
+        select_cursor = conn.cursor(dictionary=True)
+        try:
+            select_cursor.execute("SELECT * FROM tblreceiveproduct WHERE receive_product_id = %s",
+                                  (receipt.receive_product_ids[0],))
+            return ReceiveProductResponse(**select_cursor.fetchone())
+        finally:
+            select_cursor.close()
+
+    try:
+        result = run_idempotent(conn, "POST /receive-product/", idempotency_key, receive_product, work)
+        etag.bump("tblproduct")
+        return result
+    except mysql.connector.IntegrityError as err:
+        raise integrity_http_exception(err)
     except mysql.connector.Error as err:
         raise HTTPException(status_code=500, detail=f"Database error: {err}")
-    finally:
-        cursor.close()
-        conn.close()
 
-@router.put("/{receive_product_id}", response_model=ReceiveProductResponse)
-def update_receive_product(receive_product_id: int, receive_product: ReceiveProductUpdate):
-    conn = get_connection()
-    cursor = conn.cursor(dictionary=True)
+@router.post("/bulk", response_model=ReceiveProductBulkResponse, status_code=status.HTTP_201_CREATED)
+def create_receive_products_bulk(receive_products: List[ReceiveProductCreate],
+                                 idempotency_key: IdempotencyKey = None, conn=Depends(get_db)):
+    if not receive_products or len(receive_products) > MAX_BULK_ROWS:
+        raise HTTPException(status_code=400, detail=f"Send between 1 and {MAX_BULK_ROWS} receipts")
+
+    def work(cursor):
+        receipt = receive_lines(cursor, [(rp.purchase_order_id, rp) for rp in receive_products])
+        return ReceiveProductBulkResponse(receive_product_ids=receipt.receive_product_ids)
+
     try:
+        result = run_idempotent(conn, "POST /receive-product/bulk", idempotency_key, receive_products, work)
+        etag.bump("tblproduct")
+        return result
+    except mysql.connector.IntegrityError as err:
+        raise integrity_http_exception(err)
+    except mysql.connector.Error as err:
+        raise HTTPException(status_code=500, detail=f"Database error: {err}")
+
+@router.put("/{receive_product_id}", response_model=ReceiveProductResponse)
+def update_receive_product(receive_product_id: int, receive_product: ReceiveProductUpdate, conn=Depends(get_db)):
+    # Only the fields sent are changed; the rest keep their stored values
+    supplied = receive_product.model_dump(exclude_none=True)
+    if receive_product.quantity is not None and receive_product.quantity <= 0:
+        raise HTTPException(status_code=400, detail="Received quantities must be positive")
+
+    def work(cursor):
         # Check if receive product exists
-        cursor.execute("SELECT receive_product_id FROM tblreceiveproduct WHERE receive_product_id = %s", (receive_product_id,))
-        if not cursor.fetchone():
+        cursor.execute(RECEIPT_LINE_FOR_UPDATE_SQL, (receive_product_id,))
+        old_line = cursor.fetchone()
+        if not old_line:
             raise HTTPException(status_code=404, detail="Receive Product not found")
-        
+        if not supplied:
+            raise HTTPException(status_code=400, detail="No fields to update")
+
+        old_product_id, old_quantity, old_purchase_order_id, old_supplier_id = old_line
+        purchase_order_id = supplied.get("purchase_order_id", old_purchase_order_id)
+        # Orders before products, as in receive_lines()
+        orders = lock_orders(cursor, {old_purchase_order_id, purchase_order_id})
+        if {"product_id", "supplier_id", "purchase_order_id"} & supplied.keys():
+            check_line(purchase_order_id, orders[purchase_order_id],
+                       supplied.get("product_id", old_product_id), supplied.get("supplier_id", old_supplier_id))
+
+        # Take the old quantity back out of stock and add the new one
+        quantity = supplied.get("quantity", old_quantity)
+        new_line = (supplied.get("product_id", old_product_id), quantity)
+        apply_stock_deltas(cursor, replace_deltas((old_product_id, old_quantity), new_line, 1))
+
         # Update the receive product
-        cursor.execute("""
-            UPDATE tblreceiveproduct 
-            SET product_id = %s, quantity = %s, unit_price = %s, 
-                sub_total = %s, supplier_id = %s, received_date = %s, 
-                user_id = %s, purchase_order_id = %s
-            WHERE receive_product_id = %s
-        """, (
-            receive_product.product_id,
-            receive_product.quantity,
-            receive_product.unit_price,
-            receive_product.sub_total,
-            receive_product.supplier_id,
-            receive_product.received_date,
-            receive_product.user_id,
-            receive_product.purchase_order_id,
-            receive_product_id
-        ))
-        conn.commit()
-        
+        cursor.execute(
+            f"UPDATE tblreceiveproduct SET {', '.join(f'{field} = %s' for field in supplied)} "
+            "WHERE receive_product_id = %s",
+            (*supplied.values(), receive_product_id)
+        )
+        sync_orders(cursor, orders, (purchase_order_id, quantity))
+
+    try:
+        run_transaction(conn, work)
+        etag.bump("tblproduct")
+
         # Fetch the updated receive product
-        cursor.execute("SELECT * FROM tblreceiveproduct WHERE receive_product_id = %s", (receive_product_id,))
-        updated_receive_product = cursor.fetchone()
+        updated_receive_product = conn.fetchone_prepared(
+            "SELECT * FROM tblreceiveproduct WHERE receive_product_id = %s", (receive_product_id,)
+        )
         return ReceiveProductResponse(**updated_receive_product)
+    except InsufficientStock as err:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(err))
+    except mysql.connector.IntegrityError as err:
+        raise integrity_http_exception(err)
     except mysql.connector.Error as err:
         raise HTTPException(status_code=500, detail=f"Database error: {err}")
-    finally:
-        cursor.close()
-        conn.close()
 
 @router.delete("/{receive_product_id}", status_code=status.HTTP_200_OK)
-def delete_receive_product(receive_product_id: int):
-    conn = get_connection()
-    cursor = conn.cursor(dictionary=True)
-    try:
+def delete_receive_product(receive_product_id: int, conn=Depends(get_db)):
+    def work(cursor):
         # Check if receive product exists
-        cursor.execute("SELECT receive_product_id FROM tblreceiveproduct WHERE receive_product_id = %s", (receive_product_id,))
-        if not cursor.fetchone():
+        cursor.execute(RECEIPT_LINE_FOR_UPDATE_SQL, (receive_product_id,))
+        old_line = cursor.fetchone()
+        if not old_line:
             raise HTTPException(status_code=404, detail="Receive Product not found")
-        
-        # Delete the receive product
+
+        orders = lock_orders(cursor, [old_line[2]])
+
+        # Undoing the receipt takes its quantity back out of stock
+        apply_stock_deltas(cursor, replace_deltas(old_line[:2], None, 1))
         cursor.execute("DELETE FROM tblreceiveproduct WHERE receive_product_id = %s", (receive_product_id,))
-        conn.commit()
-        
+        sync_orders(cursor, orders)
+
+    try:
+        run_transaction(conn, work)
+        etag.bump("tblproduct")
         return {"status": "success", "message": "Receive Product deleted successfully"}
+    except InsufficientStock as err:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(err))
     except mysql.connector.Error as err:
         raise HTTPException(status_code=500, detail=f"Database error: {err}")
-    finally:
-        cursor.close()
-        conn.close()
 
 @router.get("/{receive_product_id}", response_model=ReceiveProductResponse)
-def get_receive_product(receive_product_id: int):
-    conn = get_connection()
+def get_receive_product(receive_product_id: int, response: Response, fields: FieldsParam = None,
+                        conn=Depends(get_db)):
+    requested = RECEIVE_PRODUCT_PROJECTION.parse(fields)
     cursor = conn.cursor(dictionary=True)
     try:
         # Check if receive product exists
-        cursor.execute("SELECT * FROM tblreceiveproduct WHERE receive_product_id = %s", (receive_product_id,))
+        cursor.execute(RECEIVE_PRODUCT_PROJECTION.select(requested) + RECEIVE_PRODUCT_DETAIL_WHERE,
+                       (receive_product_id,))
         receive_product = cursor.fetchone()
         if not receive_product:
             raise HTTPException(status_code=404, detail="Receive Product not found")
         
-        return ReceiveProductResponse(**receive_product)
+        return json_item(receive_product, ReceiveProductResponse, response, requested)
     except mysql.connector.Error as err:
         raise HTTPException(status_code=500, detail=f"Database error: {err}")
     finally:
-        cursor.close()
-        conn.close()
\ No newline at end of file
+        cursor.close()
\ No newline at end of file
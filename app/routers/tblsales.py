@@ -1,152 +1,237 @@
-from fastapi import APIRouter, HTTPException, status
-from app.db import get_connection
-from app.models.tblsales import SaleCreate, SaleResponse, SaleUpdate
+from fastapi import APIRouter, Depends, HTTPException, Response, status
+from app import etag
+from app.db import MAX_BULK_ROWS, bulk_insert, get_async_db, get_db, integrity_http_exception
+from app.idempotency import IdempotencyKey, run_idempotent
+from app.export import ExportFormat, export_response
+from app.stock import (
+    InsufficientStock, UnknownProduct, apply_stock_deltas, replace_deltas, run_transaction, stock_deltas,
+)
+from app.filters import Filters
+from app.pagination import DEFAULT_LIMIT, Keyset, PageLimit, SortParam, Sorts
+from app.fields import FieldsParam, Projection
+from app.serialization import json_item, json_response
+from app.sales_summary import adjust_sales_daily, adjust_sales_daily_for_ids
+from app.models.tblsales import SaleBulkResponse, SaleCreate, SaleResponse, SaleUpdate
 from app.models.tblinvoice import InvoiceResponse
 from app.models.tblproduct import ProductResponse
-from typing import List
+from typing import List, Optional
+import aiomysql
 import mysql.connector
 
 router = APIRouter(prefix="/sales", tags=["Sales"])
+# Registered ahead of `router` when DB_DRIVER=async
+async_router = APIRouter(prefix="/sales", tags=["Sales"])
+
+# Every SaleResponse field lives on tblsales, so no join is needed
+SALES_PROJECTION = Projection(SaleResponse, "tblsales s", alias="s")
+SALES_LIST_SQL = SALES_PROJECTION.select()
+SALES_KEYSET = Keyset("s.sales_id")
+SALES_SORTS = Sorts("sales_id", sales_id=SALES_KEYSET)
+
+# Hot lookups go through the per-connection prepared statement cache
+SALE_BY_ID_SQL = "SELECT * FROM tblsales WHERE sales_id = %s"
+SALE_DETAIL_WHERE = "WHERE s.sales_id = %s"
+SALE_LINE_FOR_UPDATE_SQL = "SELECT product_id, quantity FROM tblsales WHERE sales_id = %s FOR UPDATE"
+SALE_DETAIL_SQL = SALES_LIST_SQL + SALE_DETAIL_WHERE
+SALES_EXPORT_SQL = """
+    SELECT s.sales_id, s.invoice_id, s.product_id, s.quantity,
+           s.unit_price, s.sub_total, i.date_recorded
+    FROM tblsales s
+    JOIN tblinvoice i ON s.invoice_id = i.invoice_id
+    ORDER BY s.sales_id
+"""
+SALE_INSERT_SQL = """
+    INSERT INTO tblsales (invoice_id, product_id, quantity, 
+                          unit_price, sub_total)
+    VALUES (%s, %s, %s, %s, %s)
+"""
+
+def sales_filters(invoice_id: Optional[int] = None, product_id: Optional[int] = None):
+    return Filters().equal("s.invoice_id", invoice_id).equal("s.product_id", product_id)
 
 @router.get("/", response_model=List[SaleResponse])
-def get_sales():
-    conn = get_connection()
+def get_sales(response: Response, limit: PageLimit = DEFAULT_LIMIT, after: Optional[str] = None,
+              fields: FieldsParam = None, sort: SortParam = None,
+              filters: Filters = Depends(sales_filters), conn=Depends(get_db)):
+    requested = SALES_PROJECTION.parse(fields)
+    keyset = SALES_SORTS.keyset(sort)
     cursor = conn.cursor(dictionary=True)
     try:
-        cursor.execute("""
-            SELECT s.sales_id, s.invoice_id, s.product_id, s.quantity, 
-                   s.unit_price, s.sub_total, i.date_recorded,
-                   i.invoice_id AS invoice_number,
-                   p.product_name AS product_name
-            FROM tblsales s
-            JOIN tblinvoice i ON s.invoice_id = i.invoice_id
-            JOIN tblproduct p ON s.product_id = p.product_id
-        """)
-        sales = cursor.fetchall()
-        return [SaleResponse(**sale) for sale in sales]
+        base_sql = SALES_PROJECTION.select(requested, keyset.keys)
+        cursor.execute(*keyset.query(base_sql, after, limit, filters.conditions, filters.params))
+        sales = keyset.page(cursor.fetchall(), limit, response)
+        return json_response(sales, SaleResponse, response, requested)
     except mysql.connector.Error as err:
         raise HTTPException(status_code=500, detail=f"Database error: {err}")
     finally:
         cursor.close()
-        conn.close()
+
+@async_router.get("/", response_model=List[SaleResponse])
+async def get_sales_async(response: Response, limit: PageLimit = DEFAULT_LIMIT,
+                          after: Optional[str] = None, fields: FieldsParam = None,
+                          sort: SortParam = None, filters: Filters = Depends(sales_filters),
+                          conn=Depends(get_async_db)):
+    requested = SALES_PROJECTION.parse(fields)
+    keyset = SALES_SORTS.keyset(sort)
+    async with conn.cursor(aiomysql.DictCursor) as cursor:
+        try:
+            base_sql = SALES_PROJECTION.select(requested, keyset.keys)
+            await cursor.execute(*keyset.query(base_sql, after, limit, filters.conditions, filters.params))
+            sales = keyset.page(await cursor.fetchall(), limit, response)
+            return json_response(sales, SaleResponse, response, requested)
+        except aiomysql.Error as err:
+            raise HTTPException(status_code=500, detail=f"Database error: {err}")
+
+@router.get("/export")
+def export_sales(format: ExportFormat = ExportFormat.NDJSON):
+    return export_response(SALES_EXPORT_SQL, (), format, "sales")
 
 @router.get("/{sales_id}", response_model=SaleResponse)
-def get_sale(sales_id: int):
-    conn = get_connection()
-    cursor = conn.cursor(dictionary=True)
+def get_sale(sales_id: int, response: Response, fields: FieldsParam = None, conn=Depends(get_db)):
+    requested = SALES_PROJECTION.parse(fields)
     try:
-        cursor.execute("""
-            SELECT s.sales_id, s.invoice_id, s.product_id, s.quantity, 
-                   s.unit_price, s.sub_total, i.date_recorded,
-                   i.invoice_id AS invoice_number,
-                   p.product_name AS product_name
-            FROM tblsales s
-            JOIN tblinvoice i ON s.invoice_id = i.invoice_id
-            JOIN tblproduct p ON s.product_id = p.product_id
-            WHERE s.sales_id = %s
-        """, (sales_id,))
-        sale = cursor.fetchone()
+        sale = conn.fetchone_prepared(SALES_PROJECTION.select(requested) + SALE_DETAIL_WHERE, (sales_id,))
         if not sale:
             raise HTTPException(status_code=404, detail="Sale not found")
-        return SaleResponse(**sale)
+        return json_item(sale, SaleResponse, response, requested)
     except mysql.connector.Error as err:
         raise HTTPException(status_code=500, detail=f"Database error: {err}")
-    finally:
-        cursor.close()
-        conn.close()
 
 @router.post("/", response_model=SaleResponse, status_code=status.HTTP_201_CREATED)
-def create_sale(sale: SaleCreate):
-    conn = get_connection()
-    cursor = conn.cursor(dictionary=True)
-    try:
-        cursor.execute("""
-            INSERT INTO tblsales (invoice_id, product_id, quantity, 
-                                  unit_price, sub_total)
-            VALUES (%s, %s, %s, %s, %s)
-        """, (
+def create_sale(sale: SaleCreate, idempotency_key: IdempotencyKey = None, conn=Depends(get_db)):
+    def work(cursor):
+        apply_stock_deltas(cursor, stock_deltas([sale], -1))
+        insert_cursor = conn.execute_prepared(SALE_INSERT_SQL, (
             sale.invoice_id,
             sale.product_id,
             sale.quantity,
             sale.unit_price,
             sale.sub_total
         ))
-        conn.commit()
-        sales_id = cursor.lastrowid
-        
+        adjust_sales_daily(cursor, "s.sales_id = %s", (insert_cursor.lastrowid,), 1)
+
         # Fetch the newly created sale
-        cursor.execute("SELECT * FROM tblsales WHERE sales_id = %s", (sales_id,))
-        new_sale = cursor.fetchone()
+        new_sale = conn.fetchone_prepared(SALE_BY_ID_SQL, (insert_cursor.lastrowid,))
         return SaleResponse(**new_sale)
+
+    try:
+        result = run_idempotent(conn, "POST /sales/", idempotency_key, sale, work)
+        etag.bump("tblproduct")
+        return result
+    except InsufficientStock as err:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(err))
+    except UnknownProduct:
+        # As integrity_http_exception() words the FK violation
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid product_id")
+    except mysql.connector.IntegrityError as err:
+        raise integrity_http_exception(err)
     except mysql.connector.Error as err:
         raise HTTPException(status_code=500, detail=f"Database error: {err}")
-    finally:
-        cursor.close()
-        conn.close()
 
-@router.put("/{sales_id}", response_model=SaleResponse)
-def update_sale(sales_id: int, sale: SaleUpdate):
-    conn = get_connection()
-    cursor = conn.cursor(dictionary=True)
+@router.post("/bulk", response_model=SaleBulkResponse, status_code=status.HTTP_201_CREATED)
+def create_sales_bulk(sales: List[SaleCreate], idempotency_key: IdempotencyKey = None,
+                      conn=Depends(get_db)):
+    if not sales or len(sales) > MAX_BULK_ROWS:
+        raise HTTPException(status_code=400, detail=f"Send between 1 and {MAX_BULK_ROWS} sales")
+
+    def work(cursor):
+        apply_stock_deltas(cursor, stock_deltas(sales, -1))
+        sales_ids = bulk_insert(cursor, SALE_INSERT_SQL, [
+            (sale.invoice_id, sale.product_id, sale.quantity, sale.unit_price, sale.sub_total)
+            for sale in sales
+        ])
+        adjust_sales_daily_for_ids(cursor, sales_ids, 1)
+        return SaleBulkResponse(sales_ids=sales_ids)
+
     try:
-        # Check if sale exists
-        cursor.execute("SELECT sales_id FROM tblsales WHERE sales_id = %s", (sales_id,))
-        if not cursor.fetchone():
-            raise HTTPException(status_code=404, detail="Sale not found")
+        result = run_idempotent(conn, "POST /sales/bulk", idempotency_key, sales, work)
+        etag.bump("tblproduct")
+        return result
+    except InsufficientStock as err:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(err))
+    except UnknownProduct:
+        # As integrity_http_exception() words the FK violation
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid product_id")
+    except mysql.connector.IntegrityError as err:
+        raise integrity_http_exception(err)
+    except mysql.connector.Error as err:
+        raise HTTPException(status_code=500, detail=f"Database error: {err}")
 
-        update_fields = []
-        update_values = []
-
-        if sale.invoice_id is not None:
-            update_fields.append("invoice_id = %s")
-            update_values.append(sale.invoice_id)
-        if sale.product_id is not None:
-            update_fields.append("product_id = %s")
-            update_values.append(sale.product_id)
-        if sale.quantity is not None:
-            update_fields.append("quantity = %s")
-            update_values.append(sale.quantity)
-        if sale.unit_price is not None:
-            update_fields.append("unit_price = %s")
-            update_values.append(sale.unit_price)
-        if sale.sub_total is not None:
-            update_fields.append("sub_total = %s")
-            update_values.append(sale.sub_total)
+@router.put("/{sales_id}", response_model=SaleResponse)
+def update_sale(sales_id: int, sale: SaleUpdate, conn=Depends(get_db)):
+    update_fields = []
+    update_values = []
 
+    if sale.invoice_id is not None:
+        update_fields.append("invoice_id = %s")
+        update_values.append(sale.invoice_id)
+    if sale.product_id is not None:
+        update_fields.append("product_id = %s")
+        update_values.append(sale.product_id)
+    if sale.quantity is not None:
+        update_fields.append("quantity = %s")
+        update_values.append(sale.quantity)
+    if sale.unit_price is not None:
+        update_fields.append("unit_price = %s")
+        update_values.append(sale.unit_price)
+    if sale.sub_total is not None:
+        update_fields.append("sub_total = %s")
+        update_values.append(sale.sub_total)
+
+    def work(cursor):
+        # Check if sale exists
+        cursor.execute(SALE_LINE_FOR_UPDATE_SQL, (sales_id,))
+        old_line = cursor.fetchone()
+        if not old_line:
+            raise HTTPException(status_code=404, detail="Sale not found")
         if not update_fields:
             raise HTTPException(status_code=400, detail="No fields to update")
 
+        # Put the old quantity back and take the new one
+        new_line = (old_line[0] if sale.product_id is None else sale.product_id,
+                    old_line[1] if sale.quantity is None else sale.quantity)
+        apply_stock_deltas(cursor, replace_deltas(old_line, new_line, -1))
+
+        # Move the line out of its old summary bucket and into the new one
+        adjust_sales_daily(cursor, "s.sales_id = %s", (sales_id,), -1)
         update_query = f"UPDATE tblsales SET {', '.join(update_fields)} WHERE sales_id = %s"
-        update_values.append(sales_id)
+        cursor.execute(update_query, (*update_values, sales_id))
+        adjust_sales_daily(cursor, "s.sales_id = %s", (sales_id,), 1)
 
-        cursor.execute(update_query, tuple(update_values))
-        conn.commit()
+    try:
+        run_transaction(conn, work)
+        etag.bump("tblproduct")
 
         # Fetch the updated sale
-        cursor.execute("SELECT * FROM tblsales WHERE sales_id = %s", (sales_id,))
-        updated_sale = cursor.fetchone()
+        updated_sale = conn.fetchone_prepared(SALE_BY_ID_SQL, (sales_id,))
         return SaleResponse(**updated_sale)
+    except InsufficientStock as err:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(err))
+    except UnknownProduct:
+        # As integrity_http_exception() words the FK violation
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid product_id")
+    except mysql.connector.IntegrityError as err:
+        raise integrity_http_exception(err)
     except mysql.connector.Error as err:
         raise HTTPException(status_code=500, detail=f"Database error: {err}")
-    finally:
-        cursor.close()
-        conn.close()
 
 @router.delete("/{sales_id}", status_code=status.HTTP_200_OK)
-def delete_sale(sales_id: int):
-    conn = get_connection()
-    cursor = conn.cursor(dictionary=True)
-    try:
+def delete_sale(sales_id: int, conn=Depends(get_db)):
+    def work(cursor):
         # Check if sale exists
-        cursor.execute("SELECT sales_id FROM tblsales WHERE sales_id = %s", (sales_id,))
-        if not cursor.fetchone():
+        cursor.execute(SALE_LINE_FOR_UPDATE_SQL, (sales_id,))
+        old_line = cursor.fetchone()
+        if not old_line:
             raise HTTPException(status_code=404, detail="Sale not found")
 
+        # Voiding the line returns its quantity to stock
+        apply_stock_deltas(cursor, replace_deltas(old_line, None, -1))
+        adjust_sales_daily(cursor, "s.sales_id = %s", (sales_id,), -1)
         cursor.execute("DELETE FROM tblsales WHERE sales_id = %s", (sales_id,))
-        conn.commit()
+
+    try:
+        run_transaction(conn, work)
+        etag.bump("tblproduct")
         return {"status": "success", "message": "Sale deleted successfully"}
     except mysql.connector.Error as err:
         raise HTTPException(status_code=500, detail=f"Database error: {err}")
-    finally:
-        cursor.close()
-        conn.close()
\ No newline at end of file
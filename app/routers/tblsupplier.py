@@ -1,29 +1,36 @@
-from fastapi import APIRouter, HTTPException, status
-from app.db import get_connection
+from fastapi import APIRouter, Depends, HTTPException, Response, status
+from app.db import get_db
+from app.pagination import DEFAULT_LIMIT, Keyset, PageLimit
+from app.fields import FieldsParam, Projection
+from app.serialization import json_item, json_response
 from app.models.tblsupplier import SupplierCreate, SupplierResponse, SupplierUpdate
-from typing import List
+from typing import List, Optional
 import mysql.connector
 router = APIRouter(prefix="/supplier", tags=["Supplier"])
 
+SUPPLIER_PROJECTION = Projection(SupplierResponse, "tblsupplier")
+SUPPLIER_KEYSET = Keyset("supplier_id")
+SUPPLIER_DETAIL_WHERE = "WHERE supplier_id = %s"
+
 
 @router.get("/", response_model=List[SupplierResponse])
-def get_suppliers():
-    conn = get_connection()
+def get_suppliers(response: Response, limit: PageLimit = DEFAULT_LIMIT, after: Optional[str] = None,
+                  fields: FieldsParam = None, conn=Depends(get_db)):
+    requested = SUPPLIER_PROJECTION.parse(fields)
     cursor = conn.cursor(dictionary=True)
     try:
-        cursor.execute("SELECT * FROM tblsupplier")
-        suppliers = cursor.fetchall()
-        return [SupplierResponse(**supplier) for supplier in suppliers]
+        base_sql = SUPPLIER_PROJECTION.select(requested, SUPPLIER_KEYSET.keys)
+        cursor.execute(*SUPPLIER_KEYSET.query(base_sql, after, limit))
+        suppliers = SUPPLIER_KEYSET.page(cursor.fetchall(), limit, response)
+        return json_response(suppliers, SupplierResponse, response, requested)
     except mysql.connector.Error as err:
         raise HTTPException(status_code=500, detail=f"Database error: {err}")
     finally:
         cursor.close()
-        conn.close()
 
 
 @router.post("/", response_model=SupplierResponse, status_code=status.HTTP_201_CREATED)
-def create_supplier(supplier: SupplierCreate):
-    conn = get_connection()
+def create_supplier(supplier: SupplierCreate, conn=Depends(get_db)):
     cursor = conn.cursor(dictionary=True)
     try:
         cursor.execute("""
@@ -52,11 +59,9 @@ def create_supplier(supplier: SupplierCreate):
         raise HTTPException(status_code=500, detail=f"Database error: {err}")
     finally:
         cursor.close()
-        conn.close()
 
 @router.put("/{supplier_id}", response_model=SupplierResponse)
-def update_supplier(supplier_id: int, supplier: SupplierUpdate):
-    conn = get_connection()
+def update_supplier(supplier_id: int, supplier: SupplierUpdate, conn=Depends(get_db)):
     cursor = conn.cursor(dictionary=True)
     try:
         # Check if supplier exists
@@ -92,11 +97,9 @@ def update_supplier(supplier_id: int, supplier: SupplierUpdate):
         raise HTTPException(status_code=500, detail=f"Database error: {err}")
     finally:
         cursor.close()
-        conn.close()
 
 @router.delete("/{supplier_id}", status_code=status.HTTP_200_OK)
-def delete_supplier(supplier_id: int):
-    conn = get_connection()
+def delete_supplier(supplier_id: int, conn=Depends(get_db)):
     cursor = conn.cursor(dictionary=True)
     try:
         # Check if supplier exists
@@ -113,20 +116,18 @@ def delete_supplier(supplier_id: int):
         raise HTTPException(status_code=500, detail=f"Database error: {err}")
     finally:
         cursor.close()
-        conn.close()
 
 @router.get("/{supplier_id}", response_model=SupplierResponse)
-def get_supplier(supplier_id: int):
-    conn = get_connection()
+def get_supplier(supplier_id: int, response: Response, fields: FieldsParam = None, conn=Depends(get_db)):
+    requested = SUPPLIER_PROJECTION.parse(fields)
     cursor = conn.cursor(dictionary=True)
     try:
-        cursor.execute("SELECT * FROM tblsupplier WHERE supplier_id = %s", (supplier_id,))
+        cursor.execute(SUPPLIER_PROJECTION.select(requested) + SUPPLIER_DETAIL_WHERE, (supplier_id,))
         supplier = cursor.fetchone()
         if not supplier:
             raise HTTPException(status_code=404, detail="Supplier not found")
-        return SupplierResponse(**supplier)
+        return json_item(supplier, SupplierResponse, response, requested)
     except mysql.connector.Error as err:
         raise HTTPException(status_code=500, detail=f"Database error: {err}")
     finally:
-        cursor.close()
-        conn.close()
\ No newline at end of file
+        cursor.close()
\ No newline at end of file
@@ -1,30 +1,34 @@
-from fastapi import APIRouter, HTTPException, status
-from app.db import get_connection
+from fastapi import APIRouter, Depends, HTTPException, status
+from app import cache, etag
+from app.changelog import DELETE, record_change
+from app.db import get_db
 from app.models.tbluser import UserCreate, UserResponse
 from typing import List
 import mysql.connector
 
 router=APIRouter(prefix="/user", tags=["User"])
+
+USER_LIST_SQL = "SELECT user_id, username, fullname, designation, contact, account_type FROM tbluser"
+USER_BY_ID_SQL = USER_LIST_SQL + " WHERE user_id = %s"
+USER_BY_USERNAME_SQL = "SELECT user_id FROM tbluser WHERE username = %s"
+
 @router.get("/", response_model=List[UserResponse])
-def get_users():
-    conn = get_connection()
+def get_users(conn=Depends(get_db)):
     cursor = conn.cursor(dictionary=True)
     try:
-        cursor.execute("SELECT user_id, username, fullname, designation, contact, account_type FROM tbluser")
+        cursor.execute(USER_LIST_SQL)
         users = cursor.fetchall()
         return [UserResponse(**user) for user in users]
     except mysql.connector.Error as err:
         raise HTTPException(status_code=500, detail=f"Database error: {err}")
     finally:
         cursor.close()
-        conn.close()
 
 @router.get("/{user_id}", response_model=UserResponse)
-def get_user(user_id: int):
-    conn = get_connection()
+def get_user(user_id: int, conn=Depends(get_db)):
     cursor = conn.cursor(dictionary=True)
     try:
-        cursor.execute("SELECT user_id, username, fullname, designation, contact, account_type FROM tbluser WHERE user_id = %s", (user_id,))
+        cursor.execute(USER_BY_ID_SQL, (user_id,))
         user = cursor.fetchone()
         if not user:
             raise HTTPException(status_code=404, detail="User not found")
@@ -33,18 +37,13 @@ def get_user(user_id: int):
         raise HTTPException(status_code=500, detail=f"Database error: {err}")
     finally:
         cursor.close()
-        conn.close()
 
 @router.post("/", response_model=UserResponse, status_code=status.HTTP_201_CREATED)
-def create_user(user: UserCreate):
-    conn = get_connection()
+def create_user(user: UserCreate, conn=Depends(get_db)):
     cursor = conn.cursor(dictionary=True)
     try:
         # First check if username already exists
-        cursor.execute(
-            "SELECT user_id FROM tbluser WHERE username = %s", 
-            (user.username,)
-        )
+        cursor.execute(USER_BY_USERNAME_SQL, (user.username,))
         existing_user = cursor.fetchone()
         
         if existing_user:
@@ -58,13 +57,16 @@ def create_user(user: UserCreate):
             "INSERT INTO tbluser (username, password, fullname, designation, contact, account_type) VALUES (%s, %s, %s, %s, %s, %s)", 
             (user.username, user.password, user.fullname, user.designation.value, user.contact, user.account_type.value)
         )
+        record_change(conn, "tbluser", cursor.lastrowid)
         conn.commit()
+        cache.usernames.invalidate()
+        etag.bump("tbluser")
         
         # Get the ID of the newly created user
         user_id = cursor.lastrowid
         
         # Fetch the newly created user details
-        cursor.execute("SELECT user_id, username, fullname, designation, contact, account_type FROM tbluser WHERE user_id = %s", (user_id,))
+        cursor.execute(USER_BY_ID_SQL, (user_id,))
         new_user = cursor.fetchone()
         
         return UserResponse(**new_user)
@@ -72,12 +74,10 @@ def create_user(user: UserCreate):
         raise HTTPException(status_code=500, detail=f"Database error: {err}")
     finally:
         cursor.close()
-        conn.close()
 
 
 @router.put("/{user_id}", response_model=UserResponse)
-def update_user(user_id: int, user: UserCreate):
-    conn = get_connection()
+def update_user(user_id: int, user: UserCreate, conn=Depends(get_db)):
     cursor = conn.cursor(dictionary=True)
     try:
         # Check if user exists
@@ -92,10 +92,13 @@ def update_user(user_id: int, user: UserCreate):
             "UPDATE tbluser SET username = %s, fullname = %s, designation = %s, contact = %s, account_type = %s WHERE user_id = %s",
             (user.username, user.fullname, user.designation.value, user.contact, user.account_type.value, user_id)
         )
+        record_change(conn, "tbluser", user_id)
         conn.commit()
+        cache.usernames.invalidate()
+        etag.bump("tbluser")
         
         # Fetch the updated user details
-        cursor.execute("SELECT user_id, username, fullname, designation, contact, account_type FROM tbluser WHERE user_id = %s", (user_id,))
+        cursor.execute(USER_BY_ID_SQL, (user_id,))
         updated_user = cursor.fetchone()
         
         return UserResponse(**updated_user)
@@ -103,12 +106,10 @@ def update_user(user_id: int, user: UserCreate):
         raise HTTPException(status_code=500, detail=f"Database error: {err}")
     finally:
         cursor.close()
-        conn.close()
 
 
 @router.delete("/{user_id}", status_code=status.HTTP_200_OK)
-def delete_user(user_id: int):
-    conn = get_connection()
+def delete_user(user_id: int, conn=Depends(get_db)):
     cursor = conn.cursor(dictionary=True)
     try:
         # Check if user exists
@@ -120,11 +121,13 @@ def delete_user(user_id: int):
         
         # Delete the user
         cursor.execute("DELETE FROM tbluser WHERE user_id = %s", (user_id,))
+        record_change(conn, "tbluser", user_id, DELETE)
         conn.commit()
+        cache.usernames.invalidate()
+        etag.bump("tbluser")
         
         return {"detail": "User deleted successfully"}
     except mysql.connector.Error as err:
         raise HTTPException(status_code=500, detail=f"Database error: {err}")
     finally:
-        cursor.close()
-        conn.close()
\ No newline at end of file
+        cursor.close()
\ No newline at end of file
@@ -0,0 +1,167 @@
+"""Top-seller / ABC analysis over the full sales history.
+
+Sales lines are read through an unbuffered cursor in chunks and folded into
+per-product totals with np.bincount, so memory is bounded by the highest
+product_id rather than the number of lines, and no Python code runs per row.
+"""
+import os
+
+import numpy as np
+
+# Cumulative revenue share (before the SKU itself) below which a SKU is A / B
+ABC_A_SHARE = float(os.getenv("ABC_A_SHARE", "0.8"))
+ABC_B_SHARE = float(os.getenv("ABC_B_SHARE", "0.95"))
+
+# Sales lines pulled from the server per fetchmany() call
+ANALYSIS_CHUNK_SIZE = int(os.getenv("ANALYSIS_CHUNK_SIZE", "50000"))
+
+SALES_LINES_SQL = """
+    SELECT s.product_id, s.quantity, s.sub_total
+    FROM tblsales s
+"""
+
+# Average purchase price per product, used as unit cost for the margin
+UNIT_COST_SQL = """
+    SELECT product_id, SUM(sub_total) / SUM(quantity)
+    FROM tblreceiveproduct
+    WHERE product_id IS NOT NULL
+    GROUP BY product_id
+    HAVING SUM(quantity) > 0
+"""
+
+PRODUCT_NAMES_SQL = """
+    SELECT p.product_id, p.product_name, c.category_name
+    FROM tblproduct p
+    LEFT JOIN tblproductcategory c ON p.category_id = c.category_id
+"""
+
+
+def _add(total, ids, weights):
+    sums = np.bincount(ids, weights=weights)
+    if len(sums) > len(total):
+        total = np.pad(total, (0, len(sums) - len(total)))
+    total[:len(sums)] += sums
+    return total
+
+
+def sales_lines_query(date_from=None, date_to=None):
+    """The (sql, params) reading the sales lines in a date range."""
+    sql = SALES_LINES_SQL
+    conditions, params = ["s.product_id IS NOT NULL"], []
+    if date_from is not None or date_to is not None:
+        sql += " JOIN tblinvoice i ON s.invoice_id = i.invoice_id"
+        if date_from is not None:
+            conditions.append("i.date_recorded >= %s")
+            params.append(date_from)
+        if date_to is not None:
+            conditions.append("i.date_recorded <= %s")
+            params.append(date_to)
+    sql += " WHERE " + " AND ".join(conditions)
+    return sql, tuple(params)
+
+
+def sales_totals(conn, date_from=None, date_to=None):
+    """Return (quantity, revenue, lines) arrays indexed by product_id."""
+    sql, params = sales_lines_query(date_from, date_to)
+    quantity = np.zeros(0)
+    revenue = np.zeros(0)
+    lines = np.zeros(0)
+    # Unbuffered: if this raises half-way the pool discards the connection
+    cursor = conn.cursor(buffered=False)
+    try:
+        cursor.execute(sql, params)
+        while True:
+            rows = cursor.fetchmany(ANALYSIS_CHUNK_SIZE)
+            if not rows:
+                break
+            chunk = np.array(rows, dtype=np.float64)
+            # NULL quantity / sub_total arrive as NaN and count as zero
+            chunk = np.nan_to_num(chunk)
+            ids = chunk[:, 0].astype(np.int64)
+            quantity = _add(quantity, ids, chunk[:, 1])
+            revenue = _add(revenue, ids, chunk[:, 2])
+            lines = _add(lines, ids, None)
+    finally:
+        cursor.close()
+    return quantity, revenue, lines
+
+
+def unit_costs(conn, size):
+    """Average receipt price per product_id; NaN where nothing was received."""
+    cost = np.full(size, np.nan)
+    cursor = conn.cursor()
+    try:
+        cursor.execute(UNIT_COST_SQL)
+        for product_id, average in cursor.fetchall():
+            if product_id < size:
+                cost[product_id] = average
+    finally:
+        cursor.close()
+    return cost
+
+
+def _ranks(values):
+    """1-based descending rank; NaN values get rank 0."""
+    order = np.argsort(-np.nan_to_num(values, nan=-np.inf), kind="stable")
+    ranks = np.empty(len(values), dtype=np.int64)
+    ranks[order] = np.arange(1, len(values) + 1)
+    ranks[np.isnan(values)] = 0
+    return ranks
+
+
+def abc_analysis(conn, date_from=None, date_to=None):
+    """Classify every product sold in the range; returns (summary, products).
+
+    products is sorted by revenue, descending, and each entry carries its
+    revenue share, cumulative share, ABC class and quantity / margin ranks.
+    """
+    quantity, revenue, lines = sales_totals(conn, date_from, date_to)
+    sold = np.flatnonzero(lines)
+    cost = unit_costs(conn, len(quantity))[sold]
+    quantity, revenue, lines = quantity[sold], revenue[sold], lines[sold]
+    margin = revenue - quantity * cost
+
+    order = np.argsort(-revenue, kind="stable")
+    total_revenue = float(revenue.sum())
+    share = revenue[order] / total_revenue if total_revenue else np.zeros(len(order))
+    cumulative = np.cumsum(share)
+    before = cumulative - share
+    classes = np.where(before < ABC_A_SHARE, "A", np.where(before < ABC_B_SHARE, "B", "C"))
+    quantity_rank = _ranks(quantity)[order]
+    margin_rank = _ranks(margin)[order]
+
+    names = {}
+    cursor = conn.cursor()
+    try:
+        cursor.execute(PRODUCT_NAMES_SQL)
+        for product_id, product_name, category_name in cursor.fetchall():
+            names[product_id] = (product_name, category_name)
+    finally:
+        cursor.close()
+
+    products = []
+    for i, index in enumerate(order):
+        product_id = int(sold[index])
+        product_name, category_name = names.get(product_id, (None, None))
+        item_margin = margin[index]
+        products.append({
+            "product_id": product_id,
+            "product_name": product_name,
+            "category_name": category_name,
+            "quantity": float(quantity[index]),
+            "revenue": float(revenue[index]),
+            "margin": None if np.isnan(item_margin) else float(item_margin),
+            "line_count": int(lines[index]),
+            "revenue_share": float(share[i]),
+            "cumulative_share": float(cumulative[i]),
+            "abc_class": str(classes[i]),
+            "quantity_rank": int(quantity_rank[i]),
+            "margin_rank": int(margin_rank[i]) or None,
+        })
+
+    summary = {
+        "total_revenue": total_revenue,
+        "total_lines": int(lines.sum()),
+        "product_count": len(products),
+    }
+    return summary, products
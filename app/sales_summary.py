@@ -0,0 +1,111 @@
+"""Daily sales summary (tblsalesdaily), kept in step with tblsales.
+
+Every handler that inserts, changes or deletes sales lines - or moves an
+invoice to another day or cashier - calls adjust_sales_daily() inside its
+own transaction: once with sign -1 before the change for lines that already
+exist, once with sign +1 after it. Reports then read one row per
+(day, product, user) instead of every sales line.
+
+    python -m app.sales_summary --rebuild [--from YYYY-MM-DD] [--to YYYY-MM-DD]
+
+recomputes the summary from tblsales, for backfilling after the migration
+or repairing float drift.
+"""
+import argparse
+import sys
+from datetime import date
+
+import mysql.connector
+
+from app.db import BULK_INSERT_CHUNK_SIZE, DB_CONFIG
+
+# Lines on invoices without a date or product cannot be bucketed; user_id 0
+# stands for "no user" because primary key columns cannot be NULL.
+_SUMMARY_SELECT = """
+    SELECT i.date_recorded, s.product_id, COALESCE(i.user_id, 0),
+           SUM(s.quantity) * %s, SUM(s.sub_total) * %s, COUNT(*) * %s
+    FROM tblsales s
+    JOIN tblinvoice i ON s.invoice_id = i.invoice_id
+    WHERE i.date_recorded IS NOT NULL AND s.product_id IS NOT NULL AND {condition}
+    GROUP BY i.date_recorded, s.product_id, COALESCE(i.user_id, 0)
+"""
+_SUMMARY_UPSERT = """
+    INSERT INTO tblsalesdaily (sales_date, product_id, user_id, quantity, total_amount, line_count)
+""" + _SUMMARY_SELECT + """
+    ON DUPLICATE KEY UPDATE
+        quantity = quantity + VALUES(quantity),
+        total_amount = total_amount + VALUES(total_amount),
+        line_count = line_count + VALUES(line_count)
+"""
+
+
+def adjust_sales_daily(cursor, condition, params, sign):
+    """Add (sign=+1) or remove (sign=-1) the lines matching `condition`.
+
+    `condition` is SQL over the aliases s (tblsales) and i (tblinvoice).
+    Runs in the caller's transaction.
+    """
+    cursor.execute(_SUMMARY_UPSERT.format(condition=condition), (sign, sign, sign, *params))
+
+
+def adjust_sales_daily_for_ids(cursor, sales_ids, sign):
+    for start in range(0, len(sales_ids), BULK_INSERT_CHUNK_SIZE):
+        chunk = sales_ids[start:start + BULK_INSERT_CHUNK_SIZE]
+        placeholders = ", ".join(["%s"] * len(chunk))
+        adjust_sales_daily(cursor, f"s.sales_id IN ({placeholders})", chunk, sign)
+
+
+def _date_range(column, date_from, date_to):
+    conditions, params = ["1 = 1"], []
+    if date_from is not None:
+        conditions.append(f"{column} >= %s")
+        params.append(date_from)
+    if date_to is not None:
+        conditions.append(f"{column} <= %s")
+        params.append(date_to)
+    return " AND ".join(conditions), params
+
+
+def rebuild(conn, date_from=None, date_to=None):
+    """Recompute the summary rows for [date_from, date_to] in one transaction."""
+    cursor = conn.cursor()
+    try:
+        where, params = _date_range("sales_date", date_from, date_to)
+        cursor.execute(f"DELETE FROM tblsalesdaily WHERE {where}", tuple(params))
+        where, params = _date_range("i.date_recorded", date_from, date_to)
+        adjust_sales_daily(cursor, where, params, 1)
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m app.sales_summary",
+                                     description="Maintain the daily sales summary")
+    parser.add_argument("--rebuild", action="store_true", required=True,
+                        help="recompute tblsalesdaily from tblsales")
+    parser.add_argument("--from", dest="date_from", type=date.fromisoformat)
+    parser.add_argument("--to", dest="date_to", type=date.fromisoformat)
+    args = parser.parse_args(argv)
+
+    try:
+        conn = mysql.connector.connect(**DB_CONFIG)
+    except mysql.connector.Error as err:
+        print(f"Database connection error: {err}", file=sys.stderr)
+        return 1
+    try:
+        rebuild(conn, args.date_from, args.date_to)
+        print("Daily sales summary rebuilt")
+        return 0
+    except mysql.connector.Error as err:
+        print(f"Rebuild failed: {err}", file=sys.stderr)
+        return 1
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
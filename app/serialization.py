@@ -0,0 +1,72 @@
+"""Fast path for large list responses.
+
+Returning models from a handler costs two Pydantic passes per row: one to
+build the model and one when FastAPI validates and serializes it again
+against response_model. Rows read from MySQL already have the right types,
+so list handlers instead project each row onto the model's fields (filling
+defaults for fields the query does not return) and encode the result with
+orjson into a Response, which FastAPI sends as is. response_model stays on
+the route for the OpenAPI schema.
+"""
+from decimal import Decimal
+
+import orjson
+from fastapi import Response
+
+_projections = {}
+
+
+def _default(value):
+    if isinstance(value, Decimal):
+        return float(value)
+    raise TypeError
+
+
+def _projection(model):
+    fields = _projections.get(model)
+    if fields is None:
+        fields = [
+            (name, None if field.is_required() else field.get_default(call_default_factory=True))
+            for name, field in model.model_fields.items()
+        ]
+        _projections[model] = fields
+    return fields
+
+
+def _selected(model, fields):
+    projection = _projection(model)
+    if fields is None:
+        return projection
+    fields = set(fields)
+    return [(name, default) for name, default in projection if name in fields]
+
+
+def _headers(response):
+    # FastAPI does not merge headers set on the injected Response (keyset
+    # cursor, ETag) into a Response the handler returns itself
+    if response is None:
+        return None
+    return {
+        name: value for name, value in response.headers.items()
+        if name not in ("content-length", "content-type")
+    }
+
+
+def json_response(rows, model, response=None, fields=None):
+    """Encode DB rows as a JSON list of `model` objects.
+
+    `fields` restricts the output to those keys (see app.fields).
+    """
+    selected = _selected(model, fields)
+    content = orjson.dumps(
+        [{name: row.get(name, default) for name, default in selected} for row in rows],
+        default=_default,
+    )
+    return Response(content=content, media_type="application/json", headers=_headers(response))
+
+
+def json_item(row, model, response=None, fields=None):
+    """Single-object counterpart of json_response()."""
+    selected = _selected(model, fields)
+    content = orjson.dumps({name: row.get(name, default) for name, default in selected}, default=_default)
+    return Response(content=content, media_type="application/json", headers=_headers(response))
@@ -0,0 +1,154 @@
+import os
+import random
+import time
+
+import mysql.connector
+
+from app.changelog import record_changes
+from app.metrics import Counter
+from app.outbox import record_stock
+
+ER_LOCK_WAIT_TIMEOUT = 1205
+ER_LOCK_DEADLOCK = 1213
+RETRYABLE_ERRORS = {ER_LOCK_WAIT_TIMEOUT: "lock_wait_timeout", ER_LOCK_DEADLOCK: "deadlock"}
+
+# Extra attempts after the first for a transaction InnoDB aborted
+TRANSACTION_RETRIES = int(os.getenv("DB_TRANSACTION_RETRIES", "3"))
+# Backoff ceiling (seconds) for the first retry; doubles per attempt
+TRANSACTION_RETRY_DELAY = float(os.getenv("DB_TRANSACTION_RETRY_DELAY", "0.02"))
+
+transaction_retries = Counter(
+    "pos_db_transaction_retries_total",
+    "Transactions re-run after InnoDB aborted them, by reason",
+    ["reason"],
+)
+transaction_retries_exhausted = Counter(
+    "pos_db_transaction_retries_exhausted_total",
+    "Transactions that still failed after the last retry, by reason",
+    ["reason"],
+)
+
+
+class InsufficientStock(Exception):
+    def __init__(self, product_id):
+        super().__init__(f"Insufficient stock for product ID {product_id}")
+        self.product_id = product_id
+
+
+class UnknownProduct(Exception):
+    def __init__(self, product_id):
+        super().__init__("Invalid product ID")
+        self.product_id = product_id
+
+
+PRODUCT_EXISTS_SQL = "SELECT 1 FROM tblproduct WHERE product_id = %s"
+OVERSOLD_SQL = "SELECT product_id FROM tblproduct WHERE product_id IN ({ids}) AND unit_in_stock < 0"
+
+
+def stock_deltas(lines, sign):
+    """Sum line quantities per product_id, multiplied by sign (+1 / -1)."""
+    deltas = {}
+    for line in lines:
+        deltas[line.product_id] = deltas.get(line.product_id, 0) + sign * line.quantity
+    return deltas
+
+
+def replace_deltas(old, new, sign):
+    """Stock deltas for replacing line `old` with `new`.
+
+    Both are (product_id, quantity) or None (a create or a delete); sign is
+    as for stock_deltas(). The old line's effect is reversed and the new
+    one applied, so editing a product or quantity, or deleting the line,
+    leaves unit_in_stock as if only the new line had ever existed.
+    """
+    deltas = {}
+    for line, line_sign in ((old, -sign), (new, sign)):
+        if line is None or line[0] is None:
+            continue
+        product_id, quantity = line
+        deltas[product_id] = deltas.get(product_id, 0) + line_sign * (quantity or 0)
+    return deltas
+
+
+def apply_stock_deltas(cursor, deltas, oversell=False):
+    """Apply relative stock changes inside the caller's transaction.
+
+    Rows are updated in product_id order so concurrent multi-line carts take
+    their row locks in the same order. A decrement only matches while enough
+    stock is left, so two cashiers can never both sell the last unit. The
+    resulting levels are queued for /stream/products and logged for
+    /sync/changes in the same transaction.
+
+    Stock is touched before the caller inserts its lines, so the lines' FK
+    on product_id never gets to reject an unknown product; an update that
+    matches no row is told apart here instead. Raises UnknownProduct for a
+    product that does not exist and InsufficientStock for one that would
+    go below zero.
+
+    With oversell=True decrements are applied whatever the stock level,
+    for sales that already happened (offline terminals), and the products
+    left below zero are returned so the caller can flag them; otherwise
+    the result is always empty.
+    """
+    for product_id in sorted(deltas):
+        delta = deltas[product_id]
+        if delta < 0 and not oversell:
+            cursor.execute(
+                """UPDATE tblproduct SET unit_in_stock = unit_in_stock + %s
+                WHERE product_id = %s AND unit_in_stock >= %s""",
+                (delta, product_id, -delta)
+            )
+        elif delta:
+            cursor.execute(
+                "UPDATE tblproduct SET unit_in_stock = unit_in_stock + %s WHERE product_id = %s",
+                (delta, product_id)
+            )
+        else:
+            continue
+        # rowcount is matched rows (CLIENT_FOUND_ROWS), so 0 is never "unchanged"
+        if cursor.rowcount == 0:
+            cursor.execute(PRODUCT_EXISTS_SQL, (product_id,))
+            if not cursor.fetchall():
+                raise UnknownProduct(product_id)
+            raise InsufficientStock(product_id)
+    changed = [product_id for product_id, delta in deltas.items() if delta]
+    record_stock(cursor, changed)
+    record_changes(cursor, "tblproduct", changed)
+
+    sold = sorted(product_id for product_id, delta in deltas.items() if delta < 0)
+    if not oversell or not sold:
+        return []
+    cursor.execute(OVERSOLD_SQL.format(ids=", ".join(["%s"] * len(sold))), sold)
+    return sorted(product_id for (product_id,) in cursor.fetchall())
+
+
+def run_transaction(conn, work):
+    """Run work(cursor) and commit, re-running it on deadlock/lock timeout.
+
+    work must only touch the database through the given cursor/connection,
+    because a retried attempt starts again from a rolled-back transaction.
+    Retries back off with full jitter so colliding cashiers spread out.
+    """
+    attempt = 0
+    while True:
+        cursor = conn.cursor()
+        try:
+            result = work(cursor)
+            conn.commit()
+            return result
+        except mysql.connector.Error as err:
+            conn.rollback()
+            reason = RETRYABLE_ERRORS.get(err.errno)
+            if reason is None:
+                raise
+            if attempt >= TRANSACTION_RETRIES:
+                transaction_retries_exhausted.inc(reason)
+                raise
+            attempt += 1
+            transaction_retries.inc(reason)
+            time.sleep(random.uniform(0, TRANSACTION_RETRY_DELAY * 2 ** attempt))
+        except BaseException:
+            conn.rollback()
+            raise
+        finally:
+            cursor.close()
@@ -0,0 +1,97 @@
+"""Rows per second for list responses, old path vs. app.serialization.
+
+    python -m bench.serialization [--rows 50000] [--repeat 3]
+
+"before" is what the list handlers used to do: build Model(**row) per row,
+then let FastAPI validate the list against response_model, dump it in JSON
+mode and encode it with json.dumps (JSONResponse). "after" is
+json_response(). Rows are synthetic but have the column types MySQL
+returns for each router's list query, so no database is needed.
+"""
+import argparse
+import json
+import time
+from datetime import date, timedelta
+from enum import Enum
+from typing import List, Union, get_args, get_origin
+
+from pydantic import EmailStr, TypeAdapter
+
+from app.models.tblcustomer import CustomerResponse
+from app.models.tblinvoice import InvoiceResponse
+from app.models.tblproduct import ProductResponse
+from app.models.tblpurchaseorder import PurchaseOrderResponse
+from app.models.tblreceiveproduct import ReceiveProductResponse
+from app.models.tblsales import SaleResponse
+from app.models.tblsupplier import SupplierResponse
+from app.serialization import json_response
+
+ROUTERS = [
+    ("/product/", ProductResponse),
+    ("/customer/", CustomerResponse),
+    ("/supplier/", SupplierResponse),
+    ("/invoice/", InvoiceResponse),
+    ("/sales/", SaleResponse),
+    ("/purchase-order/", PurchaseOrderResponse),
+    ("/receive-product/", ReceiveProductResponse),
+]
+
+
+def _sample(annotation, i):
+    if get_origin(annotation) is Union:
+        annotation = next(arg for arg in get_args(annotation) if arg is not type(None))
+    if isinstance(annotation, type) and issubclass(annotation, Enum):
+        members = list(annotation)
+        return members[i % len(members)].value
+    if annotation is int:
+        return i + 1
+    if annotation is float:
+        return (i % 1000) * 1.25
+    if annotation is date:
+        return date(2024, 1, 1) + timedelta(days=i % 365)
+    if annotation is EmailStr:
+        return f"contact{i}@example.com"
+    return f"value {i}"
+
+
+def make_rows(model, count):
+    fields = [(name, field.annotation) for name, field in model.model_fields.items()]
+    return [{name: _sample(annotation, i) for name, annotation in fields} for i in range(count)]
+
+
+def before(model, adapter, rows):
+    objects = [model(**row) for row in rows]
+    validated = adapter.validate_python(objects, from_attributes=True)
+    return json.dumps(adapter.dump_python(validated, mode="json")).encode()
+
+
+def after(model, adapter, rows):
+    return json_response(rows, model).body
+
+
+def best_rate(fn, model, adapter, rows, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(model, adapter, rows)
+        best = min(best, time.perf_counter() - start)
+    return len(rows) / best
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m bench.serialization")
+    parser.add_argument("--rows", type=int, default=50000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args(argv)
+
+    print(f"{'router':<20}{'before rows/s':>16}{'after rows/s':>16}{'speedup':>10}")
+    for path, model in ROUTERS:
+        rows = make_rows(model, args.rows)
+        adapter = TypeAdapter(List[model])
+        old = best_rate(before, model, adapter, rows, args.repeat)
+        new = best_rate(after, model, adapter, rows, args.repeat)
+        print(f"{path:<20}{old:>16,.0f}{new:>16,.0f}{new / old:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
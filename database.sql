@@ -1,3 +1,6 @@
+-- Fresh install: load this file, then run `python -m app.migrate` to bring
+-- the schema up to date. Later schema changes live in migrations/.
+
 -- Create database
 CREATE DATABASE IF NOT EXISTS pos_system;
 USE pos_system;
@@ -37,6 +40,7 @@ CREATE TABLE IF NOT EXISTS tblproduct (
     discount_percentage FLOAT,
     reorder_level FLOAT,
     user_id INT(11),
+    UNIQUE KEY uq_tblproduct_produce_code (produce_code),
     FOREIGN KEY (unit_id) REFERENCES tblproductunit(unit_id),
     FOREIGN KEY (category_id) REFERENCES tblproductcategory(category_id),
     FOREIGN KEY (user_id) REFERENCES tbluser(user_id)
@@ -0,0 +1,110 @@
+-- Baseline schema, matching database.sql. Databases created from that file
+-- already have these tables, so every statement is IF NOT EXISTS.
+
+CREATE TABLE IF NOT EXISTS tblproductcategory (
+    category_id INT(11) AUTO_INCREMENT PRIMARY KEY,
+    category_name VARCHAR(25)
+);
+
+CREATE TABLE IF NOT EXISTS tblproductunit (
+    unit_id INT(11) AUTO_INCREMENT PRIMARY KEY,
+    unit_name VARCHAR(15)
+);
+
+CREATE TABLE IF NOT EXISTS tbluser (
+    user_id INT(11) AUTO_INCREMENT PRIMARY KEY,
+    username VARCHAR(30) UNIQUE,
+    password VARCHAR(30),
+    fullname VARCHAR(50),
+    designation INT(1),
+    contact VARCHAR(15),
+    account_type INT(1)
+);
+
+CREATE TABLE IF NOT EXISTS tblproduct (
+    product_id INT(11) AUTO_INCREMENT PRIMARY KEY,
+    produce_code VARCHAR(25),
+    product_name VARCHAR(50),
+    unit_id INT(11),
+    category_id INT(11),
+    unit_in_stock FLOAT,
+    unit_price FLOAT,
+    discount_percentage FLOAT,
+    reorder_level FLOAT,
+    user_id INT(11),
+    FOREIGN KEY (unit_id) REFERENCES tblproductunit(unit_id),
+    FOREIGN KEY (category_id) REFERENCES tblproductcategory(category_id),
+    FOREIGN KEY (user_id) REFERENCES tbluser(user_id)
+);
+
+CREATE TABLE IF NOT EXISTS tblcustomer (
+    customer_id INT(11) AUTO_INCREMENT PRIMARY KEY,
+    customer_code VARCHAR(25),
+    customer_name VARCHAR(50),
+    contact VARCHAR(15),
+    address VARCHAR(100)
+);
+
+CREATE TABLE IF NOT EXISTS tblsupplier (
+    supplier_id INT(11) AUTO_INCREMENT PRIMARY KEY,
+    supplier_code VARCHAR(15),
+    supplier_name VARCHAR(50),
+    supplier_contact VARCHAR(15),
+    supplier_address VARCHAR(100),
+    supplier_email VARCHAR(50)
+);
+
+CREATE TABLE IF NOT EXISTS tblinvoice (
+    invoice_id INT(11) AUTO_INCREMENT PRIMARY KEY,
+    customer_id INT(11),
+    payment_type INT(1),
+    total_amount FLOAT,
+    amount_tendered FLOAT,
+    bank_account_name VARCHAR(50),
+    bank_account_number VARCHAR(25),
+    date_recorded DATE,
+    user_id INT(11),
+    FOREIGN KEY (customer_id) REFERENCES tblcustomer(customer_id),
+    FOREIGN KEY (user_id) REFERENCES tbluser(user_id)
+);
+
+CREATE TABLE IF NOT EXISTS tblsales (
+    sales_id INT(11) AUTO_INCREMENT PRIMARY KEY,
+    invoice_id INT(11),
+    product_id INT(11),
+    quantity FLOAT,
+    unit_price FLOAT,
+    sub_total FLOAT,
+    FOREIGN KEY (invoice_id) REFERENCES tblinvoice(invoice_id),
+    FOREIGN KEY (product_id) REFERENCES tblproduct(product_id)
+);
+
+CREATE TABLE IF NOT EXISTS tblreceiveproduct (
+    receive_product_id INT(11) AUTO_INCREMENT PRIMARY KEY,
+    product_id INT(11),
+    quantity FLOAT,
+    unit_price FLOAT,
+    sub_total FLOAT,
+    supplier_id INT(11),
+    received_date DATE,
+    user_id INT(11),
+    purchase_order_id INT(11) NOT NULL,
+    FOREIGN KEY (product_id) REFERENCES tblproduct(product_id),
+    FOREIGN KEY (supplier_id) REFERENCES tblsupplier(supplier_id),
+    FOREIGN KEY (user_id) REFERENCES tbluser(user_id)
+);
+
+CREATE TABLE IF NOT EXISTS tblpurchaseorder (
+    purchase_order_id INT(11) AUTO_INCREMENT PRIMARY KEY,
+    product_id INT(11),
+    quantity FLOAT,
+    unit_price FLOAT,
+    sub_total FLOAT,
+    supplier_id INT(11),
+    order_date DATE,
+    user_id INT(11),
+    status VARCHAR(20) DEFAULT 'pending',
+    FOREIGN KEY (product_id) REFERENCES tblproduct(product_id),
+    FOREIGN KEY (supplier_id) REFERENCES tblsupplier(supplier_id),
+    FOREIGN KEY (user_id) REFERENCES tbluser(user_id)
+);
@@ -0,0 +1,6 @@
+-- Formerly updatesupplier.sql. One ALTER per column so a database that
+-- already has some of them only skips those (duplicate column is ignored).
+
+ALTER TABLE tblsupplier ADD COLUMN contact_person VARCHAR(50) AFTER supplier_email;
+ALTER TABLE tblsupplier ADD COLUMN bank_account_name VARCHAR(50) AFTER contact_person;
+ALTER TABLE tblsupplier ADD COLUMN bank_account_number VARCHAR(25) AFTER bank_account_name;
@@ -0,0 +1,6 @@
+-- One product per produce_code. The product router relies on this
+-- constraint instead of probing for an existing produce_code before every
+-- write, and /product/by-code looks products up through it.
+-- Remove duplicate codes first if this fails with "Duplicate entry".
+
+ALTER TABLE tblproduct ADD UNIQUE KEY uq_tblproduct_produce_code (produce_code);
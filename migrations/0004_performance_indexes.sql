@@ -0,0 +1,17 @@
+-- Secondary indexes for the lookups and list orderings the routers run.
+-- Foreign key columns are already indexed by InnoDB.
+
+-- Uniqueness probes on create
+ALTER TABLE tblcustomer ADD INDEX idx_tblcustomer_customer_code (customer_code);
+ALTER TABLE tblproductcategory ADD INDEX idx_tblproductcategory_category_name (category_name);
+ALTER TABLE tblproductunit ADD INDEX idx_tblproductunit_unit_name (unit_name);
+ALTER TABLE tblsupplier ADD INDEX idx_tblsupplier_supplier_code (supplier_code);
+
+-- Invoice list pages on (date_recorded, invoice_id); InnoDB appends the PK
+ALTER TABLE tblinvoice ADD INDEX idx_tblinvoice_date_recorded (date_recorded);
+
+-- Purchase order status / date filters and receipts per purchase order
+ALTER TABLE tblpurchaseorder ADD INDEX idx_tblpurchaseorder_status (status);
+ALTER TABLE tblpurchaseorder ADD INDEX idx_tblpurchaseorder_order_date (order_date);
+ALTER TABLE tblreceiveproduct ADD INDEX idx_tblreceiveproduct_received_date (received_date);
+ALTER TABLE tblreceiveproduct ADD INDEX idx_tblreceiveproduct_purchase_order_id (purchase_order_id);
@@ -0,0 +1,13 @@
+-- One row per (day, product, cashier), maintained by the sales and invoice
+-- handlers. Backfill existing history with:
+--   python -m app.sales_summary --rebuild
+
+CREATE TABLE IF NOT EXISTS tblsalesdaily (
+    sales_date DATE NOT NULL,
+    product_id INT(11) NOT NULL,
+    user_id INT(11) NOT NULL,
+    quantity DOUBLE NOT NULL DEFAULT 0,
+    total_amount DOUBLE NOT NULL DEFAULT 0,
+    line_count INT NOT NULL DEFAULT 0,
+    PRIMARY KEY (sales_date, product_id, user_id)
+);
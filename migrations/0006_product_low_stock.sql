@@ -0,0 +1,7 @@
+-- Low-stock flag maintained by MySQL on every write to the row, whichever
+-- path changes unit_in_stock or reorder_level (sales, receipts, product
+-- updates). The index makes /product/low-stock and its count a range scan
+-- over the flagged products only.
+
+ALTER TABLE tblproduct ADD COLUMN low_stock TINYINT(1) AS (unit_in_stock <= reorder_level) STORED;
+ALTER TABLE tblproduct ADD INDEX idx_tblproduct_low_stock (low_stock);
@@ -0,0 +1,12 @@
+-- Indexes behind the list filters and sort keys. Each serves the filter
+-- and the keyset order together; InnoDB appends the PK to every index.
+
+-- /invoice/?customer_id= and ?user_id= page on (date_recorded, invoice_id)
+ALTER TABLE tblinvoice ADD INDEX idx_tblinvoice_customer_date (customer_id, date_recorded);
+ALTER TABLE tblinvoice ADD INDEX idx_tblinvoice_user_date (user_id, date_recorded);
+
+-- /purchase-order/?status=&sort=order_date
+ALTER TABLE tblpurchaseorder ADD INDEX idx_tblpurchaseorder_status_order_date (status, order_date);
+
+-- /product/?sort=product_name
+ALTER TABLE tblproduct ADD INDEX idx_tblproduct_product_name (product_name);
@@ -0,0 +1,16 @@
+-- Idempotency-Key records for the create endpoints (see app/idempotency.py).
+-- A row is inserted and given its response inside the write's own
+-- transaction, so it exists exactly when the write committed. Expire old
+-- keys with:
+--   python -m app.idempotency --purge
+
+CREATE TABLE IF NOT EXISTS tblidempotency (
+    endpoint VARCHAR(64) NOT NULL,
+    idempotency_key VARCHAR(255) NOT NULL,
+    request_hash CHAR(64) NOT NULL,
+    status_code SMALLINT NULL,
+    response_body MEDIUMBLOB NULL,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (endpoint, idempotency_key),
+    INDEX idx_tblidempotency_created_at (created_at)
+);
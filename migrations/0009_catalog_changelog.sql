@@ -0,0 +1,24 @@
+-- Change feed for the /sync delta endpoint (see app/changelog.py). The
+-- catalog write handlers append one row per created, updated or deleted
+-- product, category, unit or customer in the same transaction as the
+-- write. Superseded entries are removed with:
+--   python -m app.changelog --compact
+
+CREATE TABLE IF NOT EXISTS tblchangelog (
+    change_seq BIGINT AUTO_INCREMENT PRIMARY KEY,
+    table_name VARCHAR(32) NOT NULL,
+    row_id INT(11) NOT NULL,
+    operation ENUM('upsert', 'delete') NOT NULL,
+    changed_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    INDEX idx_tblchangelog_row (table_name, row_id, change_seq)
+);
+
+-- Existing rows, so a terminal syncing from 0 gets the whole catalog
+INSERT INTO tblchangelog (table_name, row_id, operation)
+SELECT 'tblproductcategory', category_id, 'upsert' FROM tblproductcategory;
+INSERT INTO tblchangelog (table_name, row_id, operation)
+SELECT 'tblproductunit', unit_id, 'upsert' FROM tblproductunit;
+INSERT INTO tblchangelog (table_name, row_id, operation)
+SELECT 'tblproduct', product_id, 'upsert' FROM tblproduct;
+INSERT INTO tblchangelog (table_name, row_id, operation)
+SELECT 'tblcustomer', customer_id, 'upsert' FROM tblcustomer;
@@ -0,0 +1,13 @@
+-- Product, price and stock events for GET /stream/products (see
+-- app/outbox.py). Written by the product handlers and apply_stock_deltas()
+-- in the same transaction as the change. Expire old events with:
+--   python -m app.outbox --purge
+
+CREATE TABLE IF NOT EXISTS tbloutbox (
+    event_seq BIGINT AUTO_INCREMENT PRIMARY KEY,
+    event_type VARCHAR(16) NOT NULL,
+    product_id INT(11) NOT NULL,
+    payload TEXT NOT NULL,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    INDEX idx_tbloutbox_created_at (created_at)
+);
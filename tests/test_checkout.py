@@ -0,0 +1,72 @@
+"""Checkout error mapping, against a stand-in connection (no database needed)."""
+import datetime
+
+import pytest
+from fastapi import HTTPException
+
+from app.models.tblinvoice import CheckoutCreate
+from app.routers.tblinvoice import checkout
+
+
+class FakeCursor:
+    """Answers the stock UPDATE and the existence check from `stock`."""
+
+    def __init__(self, stock):
+        self.stock = stock
+        self.rowcount = -1
+        self._rows = []
+
+    def execute(self, sql, params=()):
+        sql = " ".join(sql.split())
+        if sql.startswith("UPDATE tblproduct"):
+            product_id = params[1]
+            enough = len(params) < 3 or self.stock.get(product_id, 0) >= params[2]
+            self.rowcount = int(product_id in self.stock and enough)
+        elif sql.startswith("SELECT 1 FROM tblproduct"):
+            self._rows = [(1,)] if params[0] in self.stock else []
+        else:
+            raise AssertionError(f"unexpected statement: {sql}")
+
+    def fetchall(self):
+        rows, self._rows = self._rows, []
+        return rows
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    def __init__(self, stock):
+        self.stock = stock
+
+    def cursor(self, *args, **kwargs):
+        return FakeCursor(self.stock)
+
+    def commit(self):
+        raise AssertionError("a rejected cart must not commit")
+
+    def rollback(self):
+        pass
+
+
+def _cart(*lines):
+    return CheckoutCreate(
+        customer_id=1, payment_type=1, total_amount=10, amount_tendered=10,
+        date_recorded=datetime.date(2024, 1, 1), user_id=1,
+        lines=[{"product_id": product_id, "quantity": quantity, "unit_price": 5, "sub_total": 5 * quantity}
+               for product_id, quantity in lines],
+    )
+
+
+def test_unknown_product_is_a_bad_request():
+    with pytest.raises(HTTPException) as raised:
+        checkout(_cart((1, 1), (999, 1)), None, FakeConnection({1: 10}))
+    assert raised.value.status_code == 400
+    assert raised.value.detail == {"status": "error", "message": "Invalid product ID"}
+
+
+def test_short_stock_is_a_conflict():
+    with pytest.raises(HTTPException) as raised:
+        checkout(_cart((1, 20)), None, FakeConnection({1: 10}))
+    assert raised.value.status_code == 409
+    assert raised.value.detail["message"] == "Insufficient stock for product ID 1"
@@ -0,0 +1,290 @@
+"""EXPLAIN the routers' read queries and fail on unexpected full table scans.
+
+    POS_TEST_DB_NAME=pos_plans python -m pytest tests/test_query_plans.py
+
+Needs a MySQL server reachable with the usual DB_HOST / DB_USER /
+DB_PASSWORD settings; without POS_TEST_DB_NAME the plan checks are
+skipped. The named database is dropped and recreated, migrated and seeded with a few
+thousand rows per table, so that the optimizer weighs the indexes against
+a realistic table rather than scanning a handful of sample rows. Every
+query below is built from the SQL the application actually sends; a plan
+row with access type ALL on a table not listed as an allowed scan fails
+the test, so a dropped index or a query rewritten around one shows up
+before it reaches production.
+
+test_every_query_is_checked needs no database: it fails when a module
+under app/ defines a SELECT as a *_SQL constant that no check runs.
+"""
+import datetime
+import importlib
+import os
+import pathlib
+
+import mysql.connector
+import pytest
+
+from app import cache, etag, idempotency, migrate, outbox, product_index, stock
+from app.changelog import CHANGES_SQL
+from app.db import AUTO_INCREMENT_STEP_SQL, DB_CONFIG
+from app.pagination import encode_cursor
+from app.receiving import PARTIAL, PENDING, PURCHASE_ORDER_LOCK_SQL, RECEIVED, RECEIVED_QUANTITY_SQL
+from app.routers.reports import DAILY_SALES_SQL
+from app.routers.tblcustomer import CUSTOMER_KEYSET, CUSTOMER_LIST_SQL
+from app.routers.tblinvoice import (
+    INVOICE_CUSTOMERS_SQL, INVOICE_DETAIL_SQL, INVOICE_EXPORT_SQL, INVOICE_KEYSET, INVOICE_LINES_SQL,
+    INVOICE_LIST_SQL,
+)
+from app.routers.tblproduct import (
+    LOW_STOCK_CONDITION, LOW_STOCK_COUNT_SQL, PRODUCT_BY_ID_SQL, PRODUCT_EXISTS_SQL, PRODUCT_KEYSET,
+    PRODUCT_LIST_SQL, PRODUCT_SORTS,
+)
+from app.routers.tblpurchaseorder import (
+    PURCHASE_ORDER_DETAIL_WHERE, PURCHASE_ORDER_KEYSET, PURCHASE_ORDER_LIST_SQL, PURCHASE_ORDER_SORTS,
+)
+from app.routers.tblreceiveproduct import (
+    RECEIPT_LINE_FOR_UPDATE_SQL, RECEIVE_PRODUCT_DETAIL_WHERE, RECEIVE_PRODUCT_KEYSET, RECEIVE_PRODUCT_LIST_SQL,
+)
+from app.routers.tblsales import (
+    SALE_BY_ID_SQL, SALE_DETAIL_SQL, SALE_LINE_FOR_UPDATE_SQL, SALES_EXPORT_SQL, SALES_KEYSET, SALES_LIST_SQL,
+)
+from app.routers.tblsupplier import SUPPLIER_DETAIL_WHERE, SUPPLIER_KEYSET, SUPPLIER_PROJECTION
+from app.routers.tbluser import USER_BY_ID_SQL, USER_BY_USERNAME_SQL, USER_LIST_SQL
+from app.sales_analysis import PRODUCT_NAMES_SQL, UNIT_COST_SQL, sales_lines_query
+
+TEST_DB_NAME = os.getenv("POS_TEST_DB_NAME")
+
+PAGE = 100
+
+# Seeded rows per table; reference tables stay small, as they are in use
+REFERENCE_ROWS = 50
+SUPPLIER_ROWS = 200
+PRODUCT_ROWS = 2000
+CUSTOMER_ROWS = 2000
+INVOICE_ROWS = 5000
+SALES_ROWS = 10000
+PURCHASE_ORDER_ROWS = 2000
+RECEIPT_ROWS = 4000
+DAILY_ROWS = 5000
+EVENT_ROWS = 5000
+IDEMPOTENCY_ROWS = 5000
+# Seeded dates cover a year; the checks below ask for a month of it
+FIRST_DATE = datetime.date(2023, 7, 1)
+DAYS = 366
+
+
+def _page(keyset, base_sql, *cursor_values, conditions=(), params=()):
+    return keyset.query(base_sql, encode_cursor(cursor_values), PAGE, conditions, params)
+
+
+# (label, sql, params, tables allowed to be scanned in full)
+CHECKS = [
+    ("product list", *_page(PRODUCT_KEYSET, PRODUCT_LIST_SQL, 1), ()),
+    ("product by id", PRODUCT_BY_ID_SQL, (1,), ()),
+    ("product exists", PRODUCT_EXISTS_SQL, (1,), ()),
+    ("low stock list",
+     *PRODUCT_KEYSET.query(PRODUCT_LIST_SQL, None, PAGE, conditions=[LOW_STOCK_CONDITION]), ()),
+    ("low stock count", LOW_STOCK_COUNT_SQL, (), ()),
+    ("products by category", *_page(PRODUCT_KEYSET, PRODUCT_LIST_SQL, 1,
+                                    conditions=["p.category_id = %s"], params=[1]), ()),
+    ("products by name", *_page(PRODUCT_SORTS.keyset("product_name"), PRODUCT_LIST_SQL, "A", 1), ()),
+    ("product index by code", product_index.PRODUCT_BY_CODE_SQL, ("P000001",), ()),
+    ("product index by ids", product_index.PRODUCT_BY_IDS_SQL.format(ids="%s, %s"), (1, 2), ()),
+    ("customer list", *_page(CUSTOMER_KEYSET, CUSTOMER_LIST_SQL, 1), ()),
+    ("customer by code", "SELECT customer_id FROM tblcustomer WHERE customer_code = %s", ("C000001",), ()),
+    ("supplier list", *_page(SUPPLIER_KEYSET, SUPPLIER_PROJECTION.select(), 1), ()),
+    ("supplier detail", SUPPLIER_PROJECTION.select() + SUPPLIER_DETAIL_WHERE, (1,), ()),
+    ("category by name", "SELECT category_id FROM tblproductcategory WHERE category_name = %s", ("Category 1",), ()),
+    ("unit by name", "SELECT unit_id FROM tblproductunit WHERE unit_name = %s", ("Unit 1",), ()),
+    ("user by id", USER_BY_ID_SQL, (1,), ()),
+    ("user by username", USER_BY_USERNAME_SQL, ("user1",), ()),
+    ("invoice list", *_page(INVOICE_KEYSET, INVOICE_LIST_SQL, "2024-01-01", 1), ()),
+    ("invoice detail", INVOICE_DETAIL_SQL, (1,), ()),
+    ("invoice lines include", INVOICE_LINES_SQL.format(ids="%s, %s"), (1, 2), ()),
+    ("invoice customers include", INVOICE_CUSTOMERS_SQL.format(ids="%s, %s"), (1, 2), ()),
+    ("invoices by customer", *_page(INVOICE_KEYSET, INVOICE_LIST_SQL, "2024-01-01", 1,
+                                    conditions=["i.customer_id = %s"], params=[1]), ()),
+    ("invoices by user and date", *_page(INVOICE_KEYSET, INVOICE_LIST_SQL, "2024-01-01", 1,
+                                         conditions=["i.user_id = %s", "i.date_recorded <= %s"],
+                                         params=[1, "2024-01-31"]), ()),
+    ("sales list", *_page(SALES_KEYSET, SALES_LIST_SQL, 1), ()),
+    ("sale detail", SALE_DETAIL_SQL, (1,), ()),
+    ("sale by id", SALE_BY_ID_SQL, (1,), ()),
+    ("sale line lock", SALE_LINE_FOR_UPDATE_SQL, (1,), ()),
+    ("sales by invoice", *_page(SALES_KEYSET, SALES_LIST_SQL, 1, conditions=["s.invoice_id = %s"], params=[1]), ()),
+    ("purchase order list", *_page(PURCHASE_ORDER_KEYSET, PURCHASE_ORDER_LIST_SQL, 1), ()),
+    ("purchase order detail", PURCHASE_ORDER_LIST_SQL + PURCHASE_ORDER_DETAIL_WHERE, (1,), ()),
+    ("purchase orders by status and date",
+     *_page(PURCHASE_ORDER_SORTS.keyset("order_date"), PURCHASE_ORDER_LIST_SQL, "2024-01-01", 1,
+            conditions=["po.status = %s"], params=[PENDING]), ()),
+    ("purchase orders by status", "SELECT purchase_order_id FROM tblpurchaseorder WHERE status = %s", (PENDING,), ()),
+    ("receive product list", *_page(RECEIVE_PRODUCT_KEYSET, RECEIVE_PRODUCT_LIST_SQL, 1), ()),
+    ("receive product detail", RECEIVE_PRODUCT_LIST_SQL + RECEIVE_PRODUCT_DETAIL_WHERE, (1,), ()),
+    ("receipt line lock", RECEIPT_LINE_FOR_UPDATE_SQL, (1,), ()),
+    ("receipts by purchase order",
+     "SELECT receive_product_id FROM tblreceiveproduct WHERE purchase_order_id = %s", (1,), ()),
+    ("purchase order receive lock", PURCHASE_ORDER_LOCK_SQL.format(ids="%s, %s"), (1, 2), ()),
+    ("purchase order received totals", RECEIVED_QUANTITY_SQL.format(ids="%s, %s"), (1, 2), ()),
+    ("stock product exists", stock.PRODUCT_EXISTS_SQL, (1,), ()),
+    ("stock oversold", stock.OVERSOLD_SQL.format(ids="%s, %s"), (1, 2), ()),
+    # The claim itself is a plain INSERT, which has no access path to check
+    ("idempotency lookup", idempotency.STORED_SQL, ("POST /invoice/", "key-1"), ()),
+    ("idempotency store", idempotency.STORE_SQL, (201, b"{}", "POST /invoice/", "key-1"), ()),
+    ("sync changes", CHANGES_SQL, (300, 0, PAGE), ()),
+    ("etag change log position", etag.CHANGELOG_POSITION_SQL, (etag.ETAG_RECENT_ENTRIES,), ()),
+    ("bulk insert id step", AUTO_INCREMENT_STEP_SQL, (), ()),
+    ("outbox bounds", outbox.BOUNDS_SQL, (), ()),
+    ("outbox events", outbox.EVENTS_SQL, (EVENT_ROWS - PAGE, PAGE), ()),
+    ("outbox gaps", outbox.RANGES_SQL.format(ranges="event_seq BETWEEN %s AND %s OR event_seq BETWEEN %s AND %s"),
+     (10, 12, 20, 25), ()),
+    ("product index events", product_index.INDEX_EVENTS_SQL, (300, EVENT_ROWS - PAGE, PAGE), ()),
+    ("product index events start", product_index.INDEX_EVENTS_START_SQL, (300,), ()),
+    ("daily sales report", DAILY_SALES_SQL.format(conditions="sales_date BETWEEN %s AND %s"),
+     ("2024-01-01", "2024-01-31"), ()),
+    ("abc sales lines by date", *sales_lines_query("2024-01-01", "2024-01-31"), ()),
+    # Reference caches, the product index, exports and the all-time ABC
+    # report read the whole table on purpose
+    ("category cache", cache.category_names.sql, (), ("tblproductcategory",)),
+    ("unit cache", cache.unit_names.sql, (), ("tblproductunit",)),
+    ("username cache", cache.usernames.sql, (), ("tbluser",)),
+    ("product index load", product_index.PRODUCT_INDEX_SQL, (), ("tblproduct",)),
+    ("user list", USER_LIST_SQL, (), ("tbluser",)),
+    ("sales export", SALES_EXPORT_SQL, (), ("s",)),
+    ("invoice export", INVOICE_EXPORT_SQL, (), ("tblinvoice",)),
+    ("abc sales lines", *sales_lines_query(), ("s",)),
+    ("abc unit costs", UNIT_COST_SQL, (), ("tblreceiveproduct",)),
+    ("abc product names", PRODUCT_NAMES_SQL, (), ("p",)),
+]
+
+
+def _date(i):
+    return FIRST_DATE + datetime.timedelta(days=i % DAYS)
+
+
+def _insert(cursor, table, columns, rows):
+    cursor.executemany(
+        f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join(['%s'] * len(columns))})",
+        rows
+    )
+
+
+def seed(conn):
+    """Fill every queried table; ids run from 1 in a fresh database."""
+    cursor = conn.cursor()
+    try:
+        _insert(cursor, "tblproductcategory", ["category_name"],
+                [(f"Category {i}",) for i in range(1, REFERENCE_ROWS + 1)])
+        _insert(cursor, "tblproductunit", ["unit_name"],
+                [(f"Unit {i}",) for i in range(1, REFERENCE_ROWS + 1)])
+        _insert(cursor, "tbluser", ["username", "password", "fullname", "designation", "contact", "account_type"],
+                [(f"user{i}", "secret", f"User {i}", 1, "555-0100", 1) for i in range(1, REFERENCE_ROWS + 1)])
+        _insert(cursor, "tblsupplier", ["supplier_code", "supplier_name"],
+                [(f"S{i:04d}", f"Supplier {i}") for i in range(1, SUPPLIER_ROWS + 1)])
+        # One product in twenty is at or below its reorder level
+        _insert(cursor, "tblproduct",
+                ["produce_code", "product_name", "unit_id", "category_id", "unit_in_stock", "unit_price",
+                 "discount_percentage", "reorder_level", "user_id"],
+                [(f"P{i:06d}", f"Product {i:06d}", i % REFERENCE_ROWS + 1, i % REFERENCE_ROWS + 1,
+                  i % 100, 1 + i % 500, 0, 4, i % REFERENCE_ROWS + 1) for i in range(1, PRODUCT_ROWS + 1)])
+        _insert(cursor, "tblcustomer", ["customer_code", "customer_name"],
+                [(f"C{i:06d}", f"Customer {i}") for i in range(1, CUSTOMER_ROWS + 1)])
+        _insert(cursor, "tblinvoice",
+                ["customer_id", "payment_type", "total_amount", "amount_tendered", "date_recorded", "user_id"],
+                [(i % CUSTOMER_ROWS + 1, 1, 10, 10, _date(i), i % REFERENCE_ROWS + 1)
+                 for i in range(1, INVOICE_ROWS + 1)])
+        _insert(cursor, "tblsales", ["invoice_id", "product_id", "quantity", "unit_price", "sub_total"],
+                [(i % INVOICE_ROWS + 1, i % PRODUCT_ROWS + 1, 1, 5, 5) for i in range(1, SALES_ROWS + 1)])
+        # Most orders are long received; a few are still open
+        statuses = [RECEIVED] * 18 + [PENDING, PARTIAL]
+        _insert(cursor, "tblpurchaseorder",
+                ["product_id", "quantity", "unit_price", "sub_total", "supplier_id", "order_date", "user_id", "status"],
+                [(i % PRODUCT_ROWS + 1, 10, 5, 50, i % SUPPLIER_ROWS + 1, _date(i), i % REFERENCE_ROWS + 1,
+                  statuses[i % len(statuses)]) for i in range(1, PURCHASE_ORDER_ROWS + 1)])
+        _insert(cursor, "tblreceiveproduct",
+                ["product_id", "quantity", "unit_price", "sub_total", "supplier_id", "received_date", "user_id",
+                 "purchase_order_id"],
+                [(i % PRODUCT_ROWS + 1, 5, 5, 25, i % SUPPLIER_ROWS + 1, _date(i), i % REFERENCE_ROWS + 1,
+                  i % PURCHASE_ORDER_ROWS + 1) for i in range(1, RECEIPT_ROWS + 1)])
+        _insert(cursor, "tblsalesdaily",
+                ["sales_date", "product_id", "user_id", "quantity", "total_amount", "line_count"],
+                [(_date(i), i % PRODUCT_ROWS + 1, 1, 1, 5, 1) for i in range(DAILY_ROWS)])
+        changed_at = datetime.datetime.combine(_date(0), datetime.time())
+        _insert(cursor, "tblchangelog", ["table_name", "row_id", "operation", "changed_at"],
+                [("tblproduct", i % PRODUCT_ROWS + 1, "upsert", changed_at) for i in range(EVENT_ROWS)])
+        _insert(cursor, "tbloutbox", ["event_type", "product_id", "payload", "created_at"],
+                [(outbox.STOCK, i % PRODUCT_ROWS + 1, "{}", changed_at) for i in range(EVENT_ROWS)])
+        _insert(cursor, "tblidempotency", ["endpoint", "idempotency_key", "request_hash", "status_code",
+                                           "response_body"],
+                [("POST /invoice/", f"key-{i}", "0" * 64, 201, b"{}") for i in range(IDEMPOTENCY_ROWS)])
+        conn.commit()
+
+        cursor.execute("SHOW TABLES")
+        for (table,) in cursor.fetchall():
+            cursor.execute(f"ANALYZE TABLE {table}")
+            cursor.fetchall()
+    finally:
+        cursor.close()
+
+
+@pytest.fixture(scope="module")
+def db():
+    if not TEST_DB_NAME:
+        pytest.skip("POS_TEST_DB_NAME is not set")
+    if TEST_DB_NAME == DB_CONFIG["database"]:
+        pytest.fail("POS_TEST_DB_NAME must name a scratch database, not the application's DB_NAME")
+    config = {key: value for key, value in DB_CONFIG.items() if key != "database"}
+    try:
+        conn = mysql.connector.connect(**config)
+    except mysql.connector.Error as err:
+        pytest.skip(f"Database connection error: {err}")
+    cursor = conn.cursor()
+    try:
+        cursor.execute(f"DROP DATABASE IF EXISTS `{TEST_DB_NAME}`")
+        cursor.execute(f"CREATE DATABASE `{TEST_DB_NAME}`")
+        conn.database = TEST_DB_NAME
+        migrate.migrate(conn)
+        seed(conn)
+        yield conn
+    finally:
+        cursor.execute(f"DROP DATABASE IF EXISTS `{TEST_DB_NAME}`")
+        cursor.close()
+        conn.close()
+
+
+@pytest.mark.parametrize(
+    "sql, params, allowed", [check[1:] for check in CHECKS], ids=[check[0] for check in CHECKS]
+)
+def test_no_full_table_scan(db, sql, params, allowed):
+    cursor = db.cursor(dictionary=True)
+    try:
+        cursor.execute("EXPLAIN " + sql, params)
+        plan = cursor.fetchall()
+    finally:
+        cursor.close()
+    scans = [f"{row['table']} (~{row['rows']} rows)" for row in plan
+             if row["type"] == "ALL" and row["table"] not in allowed]
+    assert not scans, f"full scan of {', '.join(scans)}"
+
+
+def _normalize(sql):
+    return " ".join(sql.split())
+
+
+def _module_queries():
+    """(name, sql) for every SELECT defined as a *_SQL constant under app/."""
+    # app/ and its subdirectories are namespace packages, which
+    # pkgutil.walk_packages does not descend into
+    root = pathlib.Path(__file__).resolve().parent.parent
+    for path in sorted((root / "app").rglob("*.py")):
+        module_name = ".".join(path.relative_to(root).with_suffix("").parts)
+        module = importlib.import_module(module_name)
+        for name, value in vars(module).items():
+            if name.endswith("_SQL") and isinstance(value, str) and value.lstrip().upper().startswith("SELECT"):
+                yield f"{module_name}.{name}", value
+
+
+def test_every_query_is_checked():
+    checked = [_normalize(sql) for _, sql, _, _ in CHECKS]
+    # Templates are checked once formatted; match on the text before the first field
+    missing = sorted({name for name, sql in _module_queries()
+                      if not any(_normalize(sql.split("{")[0]) in check for check in checked)})
+    assert not missing, f"no plan check runs {', '.join(missing)}"